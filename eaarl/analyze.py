@@ -14,6 +14,7 @@ future.standard_library.install_aliases()
 
 import numpy as np
 
+import eaarl.detect
 import eaarl.io.waveforms
 import eaarl.project
 import eaarl.util.utm
@@ -50,13 +51,14 @@ def select_eaarla_channel(frame, max_saturated=5, max_samples=12, saturation_val
     (Channel 4 is unused on the EAARL-A system and contains noise, so it is
     never used.)
 
-    This function picks the first non-saturated channel for each pulse.
+    This function picks the first non-saturated channel for each pulse. If
+    all of a pulse's channels are saturated, its last channel is used.
 
     Parameters
         frame : pandas.DataFrame
             DataFrame of raster data to extract from. Must contain fields
-            channel, raster_number, pulse_number, and rx. Must be sorted by
-            raster_number, then pulse_number, then channel.
+            channel, raster_number, pulse_number, and rx. The rows may be in
+            any order.
         max_saturated : int
             Maximum number of samples that may be saturated. Default is 5.
         max_samples : int
@@ -67,34 +69,28 @@ def select_eaarla_channel(frame, max_saturated=5, max_samples=12, saturation_val
             this, it is saturated. Default is 250.
 
     Returns : pandas.DataFrame
-        New pandas.DataFrame with kept records.
+        New pandas.DataFrame with kept records, in their original order.
     '''
     # Get rid of channel 4; in EAARL-A, it's noise
-    frame = frame[frame.channel != 4]
-
-    # Sanity test on sorting; not perfect, but should catch accidents
-    if not np.all(frame.channel[0::3] == 1):
-        raise ValueError('frame is not sorted properly')
-    if not np.all(frame.channel[1::3] == 2):
-        raise ValueError('frame is not sorted properly')
-    if not np.all(frame.channel[2::3] == 3):
-        raise ValueError('frame is not sorted properly')
-    if not np.all(frame.raster_number.values[1:] >= frame.raster_number.values[:-1]):
-        raise ValueError('frame is not sorted properly')
+    frame = frame[frame.channel.values != 4]
 
     # Determine which waveforms are saturated
-    check_saturation = np.vectorize(
-        lambda rx: (rx[:max_samples] >= saturation_value).sum() >= max_saturated,
-        otypes=[bool])
-    saturated = check_saturation(frame.rx)
-
-    # Use the first non-saturated waveform for each; fallback to the third if
-    # all are saturated
-    keep = np.logical_not(saturated)
-    keep[1::3] = np.logical_and(np.logical_not(keep[0::3]), keep[1::3])
-    keep[2::3] = np.logical_and(np.logical_not(keep[0::3]), np.logical_not(keep[1::3]))
-
-    return frame[keep]
+    window, _ = _padded(frame.rx, max_samples)
+    saturated = (window >= saturation_value).sum(axis=1) >= max_saturated
+
+    # Within each pulse, rank the non-saturated channels first, lowest channel
+    # first, followed by the saturated channels, highest channel first. The
+    # first row of each pulse in that order is the one to keep.
+    channel = frame.channel.values
+    raster_number = frame.raster_number.values
+    pulse_number = frame.pulse_number.values
+    order = np.lexsort((np.where(saturated, -channel, channel), saturated,
+                        pulse_number, raster_number))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ((raster_number[order[1:]] != raster_number[order[:-1]]) |
+                 (pulse_number[order[1:]] != pulse_number[order[:-1]]))
+
+    return frame.iloc[np.sort(order[first])]
 
 def add_mirror(frame, ops):
     '''Adds the mirror location to the records
@@ -137,12 +133,390 @@ def add_fs(frame, ops, prefix='fs', limit=12):
             Limits how many samples of the waveform are used for the centroid
             calculation. By default, the first 12 samples are used.
     '''
-    frame[prefix + '_pos'] = centroid_array(frame.rx, limit)
+    return add_target(frame, ops, eaarl.detect.Centroid(limit), prefix)
+
+def add_target(frame, ops, detector=None, prefix='fs', which='first',
+               positions=None):
+    r'''Add targets found by a detector to the waveform data
+
+    Adds five fields to the dataframe, as for :func:`add_fs`: the position in
+    the waveform of the target, the distance in meters between the mirror and
+    the target, and the UTM coordinates of the target. The frame must already
+    have a tx_pos field, as added by :func:`add_mirror`.
+
+    To use several returns from one detection pass, call
+    :func:`detect_targets` once and pass its result as positions::
+
+        positions = detect_targets(wfs, eaarl.detect.Peaks())
+        add_target(wfs, ops, prefix='first', positions=positions)
+        add_target(wfs, ops, prefix='last', which='last', positions=positions)
+        returns = add_target(wfs, ops, prefix='ret', which='all',
+                             positions=positions)
+
+    Parameters
+        frame : pandas.DataFrame
+            DataFrame with waveform data
+        ops : dict
+            The ops data, available as flight.ops on an eaarl.io.flight.Flight
+            or by manually loading an ops file as a dict.
+        detector : callable or None
+            Detector to apply to the rx waveforms, such as those in
+            :mod:`eaarl.detect`. Defaults to eaarl.detect.Centroid().
+        prefix : string, default "fs\_"
+            Prefix for the fields added to the dataframe.
+        which : string, default "first"
+            Which targets to use when the detector finds more than one per
+            waveform. "first" and "last" use the first or last target of each
+            waveform and add fields to frame. "all" returns a new frame with
+            one row per target, in which the field <prefix>_return holds the
+            1-based number of the target within its waveform.
+        positions : 2-D array-like or None
+            Result of :func:`detect_targets` for frame. If given, detector is
+            not used.
+
+    Returns : pandas.DataFrame
+        The frame, or the new frame if which is "all".
+    '''
+    if positions is None:
+        positions = detect_targets(frame, detector)
+    positions = np.asarray(positions, dtype=float).reshape(len(frame), -1)
+    found = positions >= 0
+
+    if which == 'first':
+        pos = np.full(len(frame), -1.)
+        if positions.shape[1]:
+            pos = positions[:, 0]
+    elif which == 'last':
+        pos = np.full(len(frame), -1.)
+        if positions.shape[1]:
+            last = positions.shape[1] - 1 - found[:, ::-1].argmax(axis=1)
+            pos = positions[np.arange(len(frame)), last]
+    elif which == 'all':
+        rows, cols = np.nonzero(found)
+        frame = frame.iloc[rows].copy()
+        frame[prefix + '_return'] = cols + 1
+        pos = positions[rows, cols]
+    else:
+        raise ValueError('which must be "first", "last", or "all"')
+
+    frame[prefix + '_pos'] = pos
+    _project_target(frame, ops, prefix)
+    return frame
+
+def _project_target(frame, ops, prefix):
+    '''Adds the range and coordinates of the targets at <prefix>_pos'''
     frame[prefix + '_range'] = eaarl.project.target_range(
         frame['range'], frame['tx_pos'], frame[prefix + '_pos'],
         frame['channel'], ops)
     eaarl.project.project_point(frame, ops, frame[prefix + '_range'], prefix)
-    return frame
+
+def detect_targets(frame, detector=None, field='rx', chunk_size=100000):
+    '''Apply a detector to the waveforms in a frame
+
+    The waveforms are handled in chunks of chunk_size, so that the padded
+    copies made for the detector stay small.
+
+    Parameters
+        frame : pandas.DataFrame
+            DataFrame with waveform data
+        detector : callable or None
+            Detector to apply, such as those in :mod:`eaarl.detect`. Defaults
+            to eaarl.detect.Centroid().
+        field : string, default "rx"
+            Field holding the waveforms
+        chunk_size : integer, default 100000
+            Number of waveforms to handle at a time
+
+    Returns : 2-D numpy.ndarray of float
+        Positions of the targets in each waveform, as returned by the
+        detector, with -1 where there is no target
+    '''
+    if detector is None:
+        detector = eaarl.detect.Centroid()
+    limit = getattr(detector, 'limit', None)
+    wfs = frame[field].array
+
+    chunks = []
+    for start in range(0, len(wfs), chunk_size):
+        samples, lengths = _padded(wfs[start:start+chunk_size], limit)
+        chunks.append(np.asarray(detector(samples, lengths), dtype=float)
+                      .reshape(len(lengths), -1))
+    if not chunks:
+        return np.zeros((0, 1))
+
+    returns = max(chunk.shape[1] for chunk in chunks)
+    result = np.full((len(wfs), returns), -1.)
+    start = 0
+    for chunk in chunks:
+        result[start:start+len(chunk), :chunk.shape[1]] = chunk
+        start += len(chunk)
+    return result
+
+def decompose(frame, ops=None, prefix='gd', threshold=5, max_returns=4,
+              limit=None, max_iter=30, field='rx', workers=None,
+              chunk_size=20000):
+    r'''Decompose waveforms into sums of Gaussian returns
+
+    Each waveform, after its background (first sample) is removed, is modeled
+    as a sum of Gaussians, one per return:
+
+        amplitude * exp(-(t - position)**2 / (2 * width**2))
+
+    Initial estimates for each return come from the peaks found by
+    :class:`eaarl.detect.Peaks`, with the width estimated from the curvature
+    at the peak. All waveforms with the same number of returns are then
+    refined together by a batched Levenberg-Marquardt least-squares fit
+    that starts from those estimates. Returns that do not fit with a
+    positive amplitude and a position within the waveform are discarded.
+
+    Parameters
+        frame : pandas.DataFrame
+            DataFrame with waveform data
+        ops : dict or None
+            The ops data. If given, the range and coordinates of each return
+            are added as for :func:`add_target`, which requires the tx_pos
+            field added by :func:`add_mirror`.
+        prefix : string, default "gd\_"
+            Prefix for the fields added
+        threshold : number, default 5
+            Smallest peak, above background, that starts a return
+        max_returns : integer, default 4
+            Largest number of returns to fit for each waveform. If more peaks
+            are found, the highest are used.
+        limit : integer or None
+            Number of samples at the head of each waveform to use
+        max_iter : integer, default 30
+            Largest number of least-squares iterations
+        field : string, default "rx"
+            Field holding the waveforms
+        workers : integer or None
+            If greater than 1, chunks of waveforms are fit in parallel by up to
+            this many processes.
+        chunk_size : integer, default 20000
+            Number of waveforms to fit at a time
+
+    Returns : pandas.DataFrame
+        A new frame with one row per return. Each row holds the fields of its
+        waveform along with <prefix>_return, the 1-based number of the return
+        within its waveform; <prefix>_amplitude, <prefix>_pos, and
+        <prefix>_width, the fitted parameters in sample values and samples;
+        and, if ops is given, <prefix>_range, <prefix>_x, <prefix>_y, and
+        <prefix>_z.
+    '''
+    wfs = frame[field].array
+    tasks = []
+    for start in range(0, len(wfs), chunk_size):
+        samples, lengths = _padded(wfs[start:start+chunk_size], limit)
+        tasks.append((start, samples, lengths, threshold, max_returns,
+                      max_iter))
+
+    if workers is not None and workers > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(_decompose_task, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [_decompose_task(task) for task in tasks]
+
+    if results:
+        rows, number, params = [np.concatenate(parts)
+                                for parts in zip(*results)]
+    else:
+        rows = number = np.zeros(0, dtype=np.int64)
+        params = np.zeros((0, 3))
+
+    returns = frame.iloc[rows].copy()
+    returns[prefix + '_return'] = number
+    returns[prefix + '_amplitude'] = params[:, 0]
+    returns[prefix + '_pos'] = params[:, 1]
+    returns[prefix + '_width'] = params[:, 2]
+    if ops is not None:
+        _project_target(returns, ops, prefix)
+    return returns
+
+def _decompose_task(task):
+    '''Decompose one chunk of padded waveforms
+
+    Returns (rows, number, params) for the fitted returns, where rows are
+    positions in the whole frame, number is the 1-based number of each return
+    within its waveform, and params holds amplitude, position, and width.
+    '''
+    start, samples, lengths, threshold, max_returns, max_iter = task
+    wf, valid = eaarl.detect.prepare(samples, lengths)
+    guess = _gaussian_estimates(wf, valid, threshold, max_returns)
+    found = guess[:, :, 0] > 0
+    counts = found.sum(axis=1)
+
+    rows, number, params = [], [], []
+    for count in np.unique(counts[counts > 0]):
+        group = np.flatnonzero(counts == count)
+        # Returns are in order of position, so the found ones come first
+        fitted = _fit_gaussians(wf[group], valid[group],
+                                guess[group, :count], max_iter)
+
+        # Discard returns that did not converge to something sensible
+        fitted[:, :, 2] = np.abs(fitted[:, :, 2])
+        length = valid[group].sum(axis=1)[:, np.newaxis]
+        good = (np.isfinite(fitted).all(axis=2) & (fitted[:, :, 0] > 0) &
+                (fitted[:, :, 1] >= 0) & (fitted[:, :, 1] <= length - 1))
+
+        # Keep the returns in order of position
+        order = np.argsort(np.where(good, fitted[:, :, 1], np.inf), axis=1)
+        fitted = np.take_along_axis(fitted, order[:, :, np.newaxis], axis=1)
+        good = np.take_along_axis(good, order, axis=1)
+
+        group_rows, cols = np.nonzero(good)
+        rows.append(start + group[group_rows])
+        number.append(cols + 1)
+        params.append(fitted[group_rows, cols])
+
+    if not rows:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros((0, 3)))
+    rows = np.concatenate(rows)
+    order = np.argsort(rows, kind='stable')
+    return (rows[order], np.concatenate(number)[order],
+            np.concatenate(params)[order])
+
+def _gaussian_estimates(wf, valid, threshold, max_returns):
+    '''Returns initial Gaussian parameters for a batch of waveforms
+
+    The result has shape (waveforms, max_returns, 3) holding amplitude,
+    position, and width, ordered by position. Returns that were not found have
+    an amplitude of 0 and are placed last.
+    '''
+    positions = eaarl.detect.Peaks(threshold).detect(wf, valid)
+    count, width = wf.shape
+    rows = np.arange(count)[:, np.newaxis]
+    found = positions >= 0
+    idx = np.clip(np.round(positions).astype(np.int64), 0, width - 1)
+    amplitude = np.where(found, wf[rows, idx], 0)
+
+    # Keep the highest peaks, then put them in order of position
+    keep = np.argsort(-amplitude, axis=1, kind='stable')[:, :max_returns]
+    positions = np.take_along_axis(positions, keep, axis=1)
+    amplitude = np.take_along_axis(amplitude, keep, axis=1)
+    idx = np.take_along_axis(idx, keep, axis=1)
+    order = np.argsort(np.where(amplitude > 0, positions, np.inf), axis=1)
+    positions = np.take_along_axis(positions, order, axis=1)
+    amplitude = np.take_along_axis(amplitude, order, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+
+    # For a Gaussian, the second derivative at the peak is
+    # -amplitude / width**2
+    before = wf[rows, np.maximum(idx - 1, 0)]
+    after = wf[rows, np.minimum(idx + 1, width - 1)]
+    curvature = 2 * amplitude - before - after
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma = np.sqrt(amplitude / curvature)
+    sigma = np.where(np.isfinite(sigma), sigma, 1.5)
+    sigma = np.clip(sigma, 0.5, max(width / 4., 0.5))
+
+    guess = np.zeros((count, amplitude.shape[1], 3))
+    guess[:, :, 0] = amplitude
+    guess[:, :, 1] = np.where(amplitude > 0, positions, 0)
+    guess[:, :, 2] = sigma
+    return guess
+
+def _fit_gaussians(wf, valid, params, max_iter):
+    '''Fit sums of Gaussians to a batch of waveforms
+
+    Uses Levenberg-Marquardt, with every waveform in the batch taking its own
+    steps and damping. Each iteration is a handful of array operations on the
+    whole batch.
+
+    Parameters
+        wf : 2-D numpy.ndarray of float
+            Waveforms, with background removed
+        valid : 2-D numpy.ndarray of bool
+            True where wf holds a sample of its waveform
+        params : 3-D numpy.ndarray of float
+            Initial amplitude, position, and width of each return, with shape
+            (waveforms, returns, 3)
+        max_iter : integer
+            Largest number of iterations
+
+    Returns the fitted parameters, in the same form as params. Waveforms
+    whose fit breaks down, with a normal equation system that is not finite,
+    have all parameters set to nan.
+    '''
+    count, returns, _ = params.shape
+    nparams = returns * 3
+    t = np.arange(wf.shape[1], dtype=float)
+    eye = np.eye(nparams)
+    failed = np.zeros(count, dtype=bool)
+
+    def evaluate(params, wf, valid):
+        '''Returns (residuals, cost) for the given parameters'''
+        amplitude = params[:, :, 0, np.newaxis]
+        z = (t - params[:, :, 1, np.newaxis]) / params[:, :, 2, np.newaxis]
+        residual = np.where(
+            valid, (amplitude * np.exp(-0.5 * z * z)).sum(axis=1) - wf, 0)
+        return residual, (residual * residual).sum(axis=1)
+
+    params = params.copy()
+    damping = np.full(count, 1e-3)
+    with np.errstate(all='ignore'):
+        residual, cost = evaluate(params, wf, valid)
+        active = np.arange(count)
+        for _ in range(max_iter):
+            if not len(active):
+                break
+            # Only waveforms that are still improving are computed
+            part = params[active]
+            part_valid = valid[active]
+            amplitude = part[:, :, 0, np.newaxis]
+            sigma = part[:, :, 2, np.newaxis]
+            z = (t - part[:, :, 1, np.newaxis]) / sigma
+            gauss = np.where(part_valid[:, np.newaxis],
+                             np.exp(-0.5 * z * z), 0)
+            jac = np.empty(gauss.shape[:2] + (3,) + gauss.shape[2:])
+            jac[:, :, 0] = gauss
+            jac[:, :, 1] = amplitude * gauss * z / sigma
+            jac[:, :, 2] = jac[:, :, 1] * z
+            jac = jac.reshape(len(active), nparams, -1)
+
+            jtj = np.matmul(jac, jac.transpose(0, 2, 1))
+            grad = np.matmul(jac, residual[active, :, np.newaxis])
+            diag = jtj[:, np.arange(nparams), np.arange(nparams)]
+            system = jtj + (damping[active, np.newaxis, np.newaxis] *
+                            (diag[:, np.newaxis, :] * eye) + 1e-9 * eye)
+            # A degenerate fit, such as a width collapsing to zero, makes the
+            # system non-finite; those waveforms are given up on. Systems
+            # that are singular are solved by pseudo-inverse instead.
+            finite = (np.isfinite(system).all(axis=(1, 2)) &
+                      np.isfinite(grad).all(axis=(1, 2)))
+            failed[active[~finite]] = True
+            step = np.zeros((len(active), nparams))
+            try:
+                step[finite] = np.linalg.solve(system[finite],
+                                               -grad[finite])[:, :, 0]
+            except np.linalg.LinAlgError:
+                step[finite] = np.matmul(np.linalg.pinv(system[finite]),
+                                         -grad[finite])[:, :, 0]
+
+            trial = part + step.reshape(part.shape)
+            trial_residual, trial_cost = evaluate(trial, wf[active],
+                                                  part_valid)
+            better = trial_cost < cost[active]
+            improvement = np.where(better, cost[active] - trial_cost, 0)
+
+            accept = active[better]
+            params[accept] = trial[better]
+            residual[accept] = trial_residual[better]
+            cost[accept] = trial_cost[better]
+            damping[active] = np.where(better, damping[active] / 10,
+                                       damping[active] * 10)
+
+            # Stop once a waveform's fit stops improving
+            done = ((better & (improvement <= 1e-6 * (cost[active] + 1e-12))) |
+                    (damping[active] >= 1e10) | ~finite)
+            active = active[~done]
+    params[failed] = np.nan
+    return params
 
 def centroid(wf, limit=None):
     '''Returns the centroid of the waveform
@@ -155,7 +529,7 @@ def centroid(wf, limit=None):
             Any sequence of numbers suitable as input to np.array, representing
             the sample values for the digitized waveform.
     '''
-    wf = np.array(wf)
+    wf = np.asarray(wf, dtype=float)
 
     if wf.size == 0:
         return -1
@@ -164,7 +538,7 @@ def centroid(wf, limit=None):
         wf = wf[:limit]
 
     # Remove background energy
-    wf = (wf - wf[0]).astype(float)
+    wf = wf - wf[0]
 
     # Avoid divide-by-zero
     sum_power = wf.sum()
@@ -178,5 +552,67 @@ def centroid(wf, limit=None):
     # -1 is necessary to convert from 1-based index to 0-based index
     return weighted_sum / sum_power - 1
 
-# Wrapper around centroid for use on arrays
-centroid_array = np.frompyfunc(centroid, 2, 1) # pylint: disable=invalid-name
+def centroid_array(wfs, limit=None):
+    '''Returns the centroid of each waveform
+
+    Gives the same results as applying :func:`centroid` to each waveform, but
+    handles all of the waveforms at once. This is fastest when wfs is a
+    :class:`eaarl.io.waveforms.RaggedArray` (or a pandas.Series backed by
+    one).
+
+    Parameters
+        wfs : array-like of waveforms
+            The waveforms to calculate centroids for.
+        limit : integer or None
+            Limits how many samples of each waveform are used.
+
+    Returns : numpy.ndarray of float
+        The centroid of each waveform, or -1 where one cannot be calculated.
+    '''
+    samples, lengths = _padded(wfs, limit)
+    return centroid_padded(samples, lengths)
+
+def _padded(wfs, limit=None):
+    '''Returns (samples, lengths) for a sequence of waveforms
+
+    samples is a 2-D array holding the first limit samples of each waveform
+    (or all of them, if limit is None), padded with zeros. lengths is the
+    number of samples of each waveform in samples. Missing waveforms have a
+    length of 0.
+    '''
+    ragged = getattr(wfs, 'array', wfs)
+    if isinstance(ragged, eaarl.io.waveforms.RaggedArray):
+        lengths = np.maximum(ragged.lengths, 0)
+        if limit:
+            lengths = np.minimum(lengths, limit)
+        width = int(lengths.max()) if len(lengths) else 0
+        return ragged.padded(width), lengths
+
+    wfs = [() if wf is None else np.ravel(wf)[:limit or None] for wf in wfs]
+    lengths = np.array([len(wf) for wf in wfs], dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    samples = np.zeros((len(wfs), width))
+    if width:
+        samples[np.arange(width) < lengths[:, np.newaxis]] = np.concatenate(wfs)
+    return samples, lengths
+
+def centroid_padded(samples, lengths=None, limit=None):
+    '''Returns the centroid of each row of a 2-D array of waveforms
+
+    This is the batch form of :func:`centroid`, for waveforms that have been
+    padded to a common length, such as by
+    :meth:`eaarl.io.waveforms.RaggedArray.padded`.
+
+    Parameters
+        samples : 2-D array-like
+            One waveform per row
+        lengths : array-like of int or None
+            Number of samples in each row that belong to its waveform. If
+            None, every row is used in full.
+        limit : integer or None
+            Limits how many samples of each waveform are used.
+
+    Returns : numpy.ndarray of float
+        The centroid of each waveform, or -1 where one cannot be calculated.
+    '''
+    return eaarl.detect.Centroid(limit)(samples, lengths)[:, 0]
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Batch target detection for waveforms
+
+Each detector locates targets in a whole batch of waveforms at once. The
+waveforms are given as a 2-D array with one waveform per row, padded to a
+common width, along with the number of samples in each row that belong to the
+waveform. This is the form returned by
+:meth:`eaarl.io.waveforms.RaggedArray.padded`.
+
+A detector is called as detector(samples, lengths) and returns a 2-D float
+array with a row for each waveform and a column for each target found, in
+order along the waveform. Each value is the 0-based position in the waveform of
+a target, in samples, or -1 where there is no target. Detectors that find at
+most one target return a single column.
+
+All detectors remove background energy first by subtracting the first sample
+of each waveform, in the same way as :func:`eaarl.analyze.centroid`.
+Thresholds are relative to that background. Code that needs the
+background-removed waveforms itself can call :func:`prepare` and pass its
+result to a detector's :meth:`Detector.detect`.
+
+To detect targets and add them to a frame of waveform data, use
+:func:`eaarl.analyze.add_target`.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import numpy as np
+
+class Detector:
+    '''Base class for detectors
+
+    Subclasses implement detect. The limit attribute is the number of samples
+    at the head of each waveform to use, or None to use all of them.
+    '''
+    limit = None
+
+    def __call__(self, samples, lengths=None):
+        '''Detect targets in a batch of waveforms
+
+        Parameters
+            samples : 2-D array-like
+                One waveform per row
+            lengths : array-like of int or None
+                Number of samples in each row that belong to its waveform. If
+                None, every row is used in full.
+
+        Returns : 2-D numpy.ndarray of float
+            Positions of targets, with -1 where there is no target
+        '''
+        wf, valid = prepare(samples, lengths, self.limit)
+        if not wf.shape[1]:
+            return np.full((len(wf), 1), -1.)
+        return self.detect(wf, valid)
+
+    def detect(self, wf, valid):
+        '''Detect targets in background-removed waveforms
+
+        Parameters
+            wf : 2-D numpy.ndarray of float
+                Waveforms, with background removed
+            valid : 2-D numpy.ndarray of bool
+                True where wf holds a sample of its waveform
+        '''
+        raise NotImplementedError
+
+class Centroid(Detector):
+    '''Finds the center of energy of each waveform
+
+    This is :func:`eaarl.analyze.centroid` as a detector.
+    '''
+    def __init__(self, limit=12):
+        '''Create a Centroid detector
+
+        Parameters
+            limit : integer or None, default 12
+                Number of samples at the head of each waveform to use
+        '''
+        self.limit = limit
+
+    def detect(self, wf, valid):
+        wf = np.where(valid, wf, 0)
+        sum_power = wf.sum(axis=1)
+        weighted_sum = wf.dot(np.arange(1, wf.shape[1] + 1, dtype=float))
+        result = np.full(len(wf), -1.)
+        found = sum_power != 0
+        result[found] = weighted_sum[found] / sum_power[found] - 1
+        return result[:, np.newaxis]
+
+class LeadingEdge(Detector):
+    '''Finds where each waveform first rises to a threshold
+
+    The position is interpolated linearly between the samples on either side
+    of the threshold.
+    '''
+    def __init__(self, threshold=5, limit=None):
+        '''Create a LeadingEdge detector
+
+        Parameters
+            threshold : number, default 5
+                Sample value, above background, that marks a target
+            limit : integer or None
+                Number of samples at the head of each waveform to use
+        '''
+        self.threshold = threshold
+        self.limit = limit
+
+    def detect(self, wf, valid):
+        above = valid & (wf >= self.threshold)
+        rows = np.arange(len(wf))
+        idx = above.argmax(axis=1)
+        prev = wf[rows, np.maximum(idx - 1, 0)]
+        cur = wf[rows, idx]
+        step = np.where(cur > prev, cur - prev, 1)
+        frac = np.clip((self.threshold - prev) / step, 0, 1)
+        pos = np.where(idx > 0, idx - 1 + frac, 0.)
+        return np.where(above.any(axis=1), pos, -1.)[:, np.newaxis]
+
+class TrailingEdge(Detector):
+    '''Finds where each waveform last falls below a threshold
+
+    The position is interpolated linearly between the samples on either side
+    of the threshold. If the waveform is still above the threshold at its
+    end, the position of its last sample is used.
+    '''
+    def __init__(self, threshold=5, limit=None):
+        '''Create a TrailingEdge detector
+
+        Parameters
+            threshold : number, default 5
+                Sample value, above background, that marks a target
+            limit : integer or None
+                Number of samples at the head of each waveform to use
+        '''
+        self.threshold = threshold
+        self.limit = limit
+
+    def detect(self, wf, valid):
+        above = valid & (wf >= self.threshold)
+        rows = np.arange(len(wf))
+        width = wf.shape[1]
+        idx = width - 1 - above[:, ::-1].argmax(axis=1)
+        nxt = np.minimum(idx + 1, width - 1)
+        has_next = (idx + 1 < width) & valid[rows, nxt]
+        cur = wf[rows, idx]
+        after = wf[rows, nxt]
+        step = np.where(cur > after, cur - after, 1)
+        frac = np.clip((cur - self.threshold) / step, 0, 1)
+        pos = np.where(has_next, idx + frac, idx)
+        return np.where(above.any(axis=1), pos, -1.)[:, np.newaxis]
+
+class Peak(Detector):
+    '''Finds the highest sample of each waveform
+
+    The position is refined by fitting a parabola to the peak sample and its
+    neighbors.
+    '''
+    def __init__(self, threshold=5, limit=None):
+        '''Create a Peak detector
+
+        Parameters
+            threshold : number, default 5
+                Smallest sample value, above background, of a target
+            limit : integer or None
+                Number of samples at the head of each waveform to use
+        '''
+        self.threshold = threshold
+        self.limit = limit
+
+    def detect(self, wf, valid):
+        wf = np.where(valid, wf, -np.inf)
+        idx = wf.argmax(axis=1)
+        rows = np.arange(len(wf))
+        pos = _refine(wf, rows, idx)
+        return np.where(wf[rows, idx] >= self.threshold, pos, -1.)[:, np.newaxis]
+
+class Peaks(Detector):
+    '''Finds every peak of each waveform
+
+    A peak is a sample at or above the threshold that is higher than the
+    sample before it and at least as high as the sample after it. The first
+    column of the result is the first return and the last non-negative column
+    of each row is its last return. Positions are refined as for
+    :class:`Peak`.
+    '''
+    def __init__(self, threshold=5, max_returns=None, limit=None):
+        '''Create a Peaks detector
+
+        Parameters
+            threshold : number, default 5
+                Smallest sample value, above background, of a target
+            max_returns : integer or None
+                If given, only the first max_returns peaks of each waveform
+                are kept.
+            limit : integer or None
+                Number of samples at the head of each waveform to use
+        '''
+        self.threshold = threshold
+        self.max_returns = max_returns
+        self.limit = limit
+
+    def detect(self, wf, valid):
+        wf = np.where(valid, wf, -np.inf)
+        edge = np.full((len(wf), 1), -np.inf)
+        padded = np.hstack([edge, wf, edge])
+        peak = ((wf >= self.threshold) & (wf > padded[:, :-2]) &
+                (wf >= padded[:, 2:]))
+
+        rows, idx = np.nonzero(peak)
+        counts = np.bincount(rows, minlength=len(wf))
+        rank = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts,
+                                                counts)
+        returns = int(counts.max()) if len(counts) else 0
+        if self.max_returns is not None:
+            keep = rank < self.max_returns
+            rows, idx, rank = rows[keep], idx[keep], rank[keep]
+            returns = min(returns, self.max_returns)
+
+        result = np.full((len(wf), returns), -1.)
+        result[rows, rank] = _refine(wf, rows, idx)
+        return result
+
+def prepare(samples, lengths=None, limit=None):
+    '''Removes background from a batch of padded waveforms
+
+    Parameters
+        samples : 2-D array-like
+            One waveform per row
+        lengths : array-like of int or None
+            Number of samples in each row that belong to its waveform. If
+            None, every row is used in full.
+        limit : integer or None
+            Number of samples at the head of each waveform to use
+
+    Returns : (numpy.ndarray, numpy.ndarray)
+        Returns (wf, valid), where wf is the samples as floats with the first
+        sample of each row subtracted and valid marks the samples that belong
+        to each waveform. These are the arguments of :meth:`Detector.detect`.
+    '''
+    samples = np.asarray(samples)
+    count, width = samples.shape
+    if lengths is None:
+        lengths = np.full(count, width, dtype=np.int64)
+    lengths = np.maximum(np.asarray(lengths, dtype=np.int64), 0)
+    if limit:
+        width = min(width, limit)
+    wf = samples[:, :width].astype(float)
+    wf -= wf[:, :1]
+    valid = np.arange(width) < lengths[:, np.newaxis]
+    return wf, valid
+
+def _refine(wf, rows, idx):
+    '''Returns peak positions refined by parabolic interpolation
+
+    Neighbors outside of the waveform are -inf, in which case the peak
+    sample's own position is used.
+    '''
+    width = wf.shape[1]
+    before = wf[rows, np.maximum(idx - 1, 0)]
+    peak = wf[rows, idx]
+    after = wf[rows, np.minimum(idx + 1, width - 1)]
+    interior = ((idx > 0) & (idx < width - 1) & np.isfinite(before) &
+                np.isfinite(after))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom = np.where(interior, before - 2 * peak + after, 0)
+        offset = np.where(denom < 0, 0.5 * (before - after) / denom, 0)
+    return idx + np.where(interior, offset, 0)
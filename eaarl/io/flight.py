@@ -30,6 +30,7 @@ import pandas as pd
 
 from . import gps
 from . import ins
+from . import store
 from . import waveforms
 
 from ..util import time
@@ -67,7 +68,8 @@ class InvalidDateError(Error):
         super().__init__(message)
         self.err = err
 
-def create_flight(date, basedir=None, ops=None, ins=None, gps=None, edb=None, zone=None):
+def create_flight(date, basedir=None, ops=None, ins=None, gps=None, edb=None, zone=None,
+                  store=None):
     '''Loads a flight with the given configuration
 
     Parameters
@@ -83,6 +85,8 @@ def create_flight(date, basedir=None, ops=None, ins=None, gps=None, edb=None, zo
             Path to the gps file
         edb : string or None
             Path to the edb file
+        store : string or None
+            Path to a waveform store created by :meth:`Flight.export_wfs`
         zone : string or None
             UTM zone for the data
     '''
@@ -95,6 +99,8 @@ def create_flight(date, basedir=None, ops=None, ins=None, gps=None, edb=None, zo
         conf['gps'] = gps
     if edb:
         conf['edb'] = edb
+    if store:
+        conf['store'] = store
     if zone:
         conf['zone'] = zone
     return fromdict(conf, basedir=basedir)
@@ -110,7 +116,7 @@ def fromdict(conf, basedir=None):
     if basedir is not None:
         # force a copy to avoid modifying original
         conf = dict(conf)
-        for field in ['ops', 'ins', 'gps', 'edb']:
+        for field in ['ops', 'ins', 'gps', 'edb', 'store']:
             if field in conf:
                 conf[field] = os.path.join(basedir, conf[field])
 
@@ -127,6 +133,8 @@ def fromdict(conf, basedir=None):
         flight.load_gps(conf['gps'])
     if 'edb' in conf:
         flight.load_edb(conf['edb'])
+    if 'store' in conf:
+        flight.load_store(conf['store'])
     return flight
 
 def load(conf_file):
@@ -160,6 +168,8 @@ class Flight:
         self.gps = None
         self.edb_file = None
         self.edb = None
+        self.store_file = None
+        self.store = None
 
     def gps_time_offset(self):
         '''Returns the time offset between GPS and UTC time for the flight'''
@@ -194,10 +204,61 @@ class Flight:
         self.gps = gps.apply_corrections(gps.read(gps_file),
                                          self.gps_time_offset())
 
-    def load_edb(self, edb_file):
-        '''Loads the given EDB file'''
+    def load_edb(self, edb_file, **kwargs):
+        '''Loads the given EDB file
+
+        Any additional keyword arguments, such as cache=, are passed to
+        :class:`eaarl.io.waveforms.EaarlCollection`.
+        '''
         self.edb_file = edb_file
-        self.edb = waveforms.EaarlCollection(edb_file=edb_file)
+        self.edb = waveforms.EaarlCollection(edb_file=edb_file, **kwargs)
+
+    def load_store(self, store_file):
+        '''Loads the given waveform store
+
+        Once a store is loaded, :meth:`wfs_by_raster`, :meth:`wfs_by_time`,
+        :meth:`wfs_by_region`, :meth:`iter_wfs_by_raster`, and
+        :meth:`iter_wfs_by_time` read from it instead of from the TLD files.
+        See :mod:`eaarl.io.store`.
+        '''
+        if self.store is not None:
+            self.store.close()
+        self.store_file = store_file
+        self.store = store.WaveformStore(store_file)
+
+    def export_wfs(self, store_file, chunk_size=1000, progress=True,
+                   workers=None, **kwargs):
+        '''Writes the waveform data for the whole flight to a waveform store
+
+        The data is retrieved as by :meth:`wfs_by_raster`, one chunk of
+        rasters at a time, so the transmit cleaning, flipping, and INS
+        interpolation in effect now are what is stored. Any existing file is
+        replaced. Use :meth:`load_store` to read from the store afterward.
+
+        Parameters
+            store_file : string
+                Path of the HDF5 file to write
+            chunk_size : integer, default 1000
+                Number of rasters to process at a time
+            progress : tqdm.tqdm or boolean, default True
+                Progress bar setting; see :meth:`iter_wfs_by_raster`.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
+
+        Any additional keyword arguments, such as complevel=, are passed to
+        :class:`eaarl.io.store.WaveformStore`.
+        '''
+        if self.edb is None:
+            raise EdbNotLoadedError('exporting waveforms requires edb data')
+
+        with store.WaveformStore(store_file, 'w', **kwargs) as wfstore:
+            for rasts in self.edb.iter_rasters(
+                    start=1, count=len(self.edb), chunk_size=chunk_size,
+                    progress=progress, columnar=True, workers=workers):
+                rasters = rasts.raster[['raster_number', 'time']].copy()
+                wfstore.append(self._wfs_extra(rasts), rasters)
 
     def _wfs_extra(self, rasters):
         '''Handles the extra stuff for waveform retrieval
@@ -207,6 +268,11 @@ class Flight:
             * Flattens rasters into pulses, then into waveforms.
             * Interpolates INS data for the waveform records
 
+        The rasters may be either an array of dicts or a
+        :class:`eaarl.io.waveforms.tld.TLDArrays`. Either way, the tx and rx
+        waveforms are stored as :class:`eaarl.io.waveforms.RaggedArray`
+        columns.
+
         Returns pandas.DataFrame of waveform records.
         '''
         if self.ops is None:
@@ -219,21 +285,33 @@ class Flight:
         if flip_waveforms:
             waveforms.rasters_wf_flip(rasters)
 
-        pulses = pd.DataFrame(waveforms.rasters_to_pulses(rasters))
+        columnar = isinstance(rasters, waveforms.tld.TLDArrays)
+        if columnar:
+            pulses = waveforms.arrays_to_pulses(rasters)
+        else:
+            pulses = pd.DataFrame(waveforms.rasters_to_pulses(rasters))
         pulse_sod = pulses['time'] - self.soe_day_start()
 
         ins.add_to_frame(pulses, pulse_sod, self.ins, self.ops, zone=self.zone)
 
-        pulse_records = pulses.to_dict('records')
-        channel_records = waveforms.pulses_to_waveforms(pulse_records)
-        wfs = pd.DataFrame(channel_records)
+        if columnar:
+            wfs = waveforms.arrays_to_waveforms(rasters, pulses)
+        else:
+            pulse_records = pulses.to_dict('records')
+            channel_records = waveforms.pulses_to_waveforms(pulse_records)
+            wfs = pd.DataFrame(channel_records)
+            for field in ['tx', 'rx']:
+                if field in wfs:
+                    wfs[field] = waveforms.RaggedArray.from_sequence(
+                        wfs[field].values)
 
         wfs.set_index(['raster_number', 'pulse_number', 'channel'],
                       drop=False, inplace=True)
 
         return wfs
 
-    def wfs_by_raster(self, rasters=None, start=None, count=1, ranges=None, progress=True):
+    def wfs_by_raster(self, rasters=None, start=None, count=1, ranges=None, progress=True,
+                      workers=None):
         '''Retrieves waveform data for raster numbers
 
         Returns DataFrame of waveform data for the given raster number(s). If
@@ -256,15 +334,27 @@ class Flight:
                 will be displayed during raster reading. Specify False to
                 disable. You can also specify your own instance of tqdm.tqdm
                 (or compatible) for customizing output.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
+
+        If a waveform store is loaded, the data is read from it instead and
+        progress and workers are ignored.
         '''
+        if self.store is not None:
+            return self.store.read_by_raster(rasters=rasters, start=start,
+                                             count=count, ranges=ranges)
         if self.edb is None:
             raise EdbNotLoadedError('loading pulses requires edb data')
 
         rasts = self.edb.get_rasters(rasters=rasters, start=start, count=count,
-                                     ranges=ranges, progress=progress)
+                                     ranges=ranges, progress=progress,
+                                     columnar=True, workers=workers)
         return self._wfs_extra(rasts)
 
-    def wfs_by_time(self, start=None, stop=None, ranges=None, progress=True):
+    def wfs_by_time(self, start=None, stop=None, ranges=None, progress=True,
+                    workers=None):
         '''Retrieve waveform data for given time ranges
 
         Returns DataFrame of waveform data for the given time range(s). If
@@ -284,14 +374,120 @@ class Flight:
                 will be displayed during raster reading. Specify False to
                 disable. You can also specify your own instance of tqdm.tqdm
                 (or compatible) for customizing output.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
+
+        If a waveform store is loaded, the data is read from it instead and
+        progress and workers are ignored.
         '''
+        if self.store is not None:
+            return self.store.read_by_time(start=start, stop=stop,
+                                           ranges=ranges)
         if self.edb is None:
             raise EdbNotLoadedError('loading pulses requires edb data')
 
         rasters = self.edb.get_rasters_by_time(start=start, stop=stop,
-                                               ranges=ranges, progress=progress)
+                                               ranges=ranges, progress=progress,
+                                               columnar=True, workers=workers)
         return self._wfs_extra(rasters)
 
+    def iter_wfs_by_raster(self, rasters=None, start=None, count=1, ranges=None,
+                           chunk_size=1000, progress=True, workers=None):
+        '''Retrieve waveform data for raster numbers in chunks
+
+        This is a generator version of :meth:`wfs_by_raster`. Yields a
+        DataFrame of waveform data, with INS data interpolated, for each
+        chunk of up to chunk_size rasters. Only one chunk is held in memory at
+        a time.
+
+        Parameters
+            rasters : int or sequence of ints or None
+                Sequence of raster numbers
+            start : integer or None
+                Starting raster number
+            count : integer
+                Number of rasters to retrieve
+            ranges : sequence of tuples
+                Sequence of (start, count) tuples.
+            chunk_size : integer, default 1000
+                Number of rasters in each chunk
+            progress : tqdm.tqdm or boolean, default True
+                If True and if tqdm is available for import, then a progressbar
+                will be displayed for the whole iteration. Specify False to
+                disable. You can also specify your own instance of tqdm.tqdm
+                (or compatible) for customizing output.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
+
+        If a waveform store is loaded, the data is read from it instead and
+        progress and workers are ignored. Arguments are checked when this is
+        called, before the first chunk is requested.
+        '''
+        if self.store is not None:
+            return self.store.iter_by_raster(
+                rasters=rasters, start=start, count=count, ranges=ranges,
+                chunk_size=chunk_size)
+        if self.edb is None:
+            raise EdbNotLoadedError('loading pulses requires edb data')
+
+        return self._iter_wfs_extra(self.edb.iter_rasters(
+            rasters=rasters, start=start, count=count, ranges=ranges,
+            chunk_size=chunk_size, progress=progress, columnar=True,
+            workers=workers))
+
+    def iter_wfs_by_time(self, start=None, stop=None, ranges=None,
+                         chunk_size=1000, progress=True, workers=None):
+        '''Retrieve waveform data for given time ranges in chunks
+
+        This is a generator version of :meth:`wfs_by_time`. Yields a DataFrame
+        of waveform data, with INS data interpolated, for each chunk of up to
+        chunk_size rasters. Only one chunk is held in memory at a time.
+
+        Parameters
+            start : numeric or None
+                A start time
+            stop : numeric or None
+                A stop time
+            ranges : sequence or None
+                Sequence of start and stop tuples.
+            chunk_size : integer, default 1000
+                Number of rasters in each chunk
+            progress : tqdm.tqdm or boolean, default True
+                If True and if tqdm is available for import, then a progressbar
+                will be displayed for the whole iteration. Specify False to
+                disable. You can also specify your own instance of tqdm.tqdm
+                (or compatible) for customizing output.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
+
+        If a waveform store is loaded, the data is read from it instead and
+        progress and workers are ignored. Arguments are checked when this is
+        called, before the first chunk is requested.
+        '''
+        if self.store is not None:
+            return self.store.iter_by_time(start=start, stop=stop,
+                                           ranges=ranges,
+                                           chunk_size=chunk_size)
+        if self.edb is None:
+            raise EdbNotLoadedError('loading pulses requires edb data')
+
+        rasters = self.edb.lookup_rasters_by_time(start=start, stop=stop,
+                                                  ranges=ranges)
+        return self._iter_wfs_extra(self.edb.iter_rasters(
+            rasters=rasters, chunk_size=chunk_size, progress=progress,
+            columnar=True, workers=workers))
+
+    def _iter_wfs_extra(self, chunks):
+        '''Yields the result of _wfs_extra for each chunk of rasters'''
+        for rasts in chunks:
+            yield self._wfs_extra(rasts)
+
     def times_by_region(self, region):
         '''Retrieve time ranges corresponding to a region
 
@@ -329,7 +525,7 @@ class Flight:
 
         return ranges
 
-    def wfs_by_region(self, region, progress=True):
+    def wfs_by_region(self, region, progress=True, workers=None):
         '''Retrieve waveform data corresponding to a region
 
         This retrieves data for records where the plane was within the given
@@ -346,9 +542,14 @@ class Flight:
                 will be displayed during raster reading. Specify False to
                 disable. You can also specify your own instance of tqdm.tqdm
                 (or compatible) for customizing output.
+            workers : integer or None
+                If greater than 1, TLD files are read in parallel by up to this
+                many processes. See
+                :meth:`eaarl.io.waveforms.EaarlCollection.get_rasters`.
         '''
         ranges = self.times_by_region(region)
-        return self.wfs_by_time(ranges=ranges, progress=progress)
+        return self.wfs_by_time(ranges=ranges, progress=progress,
+                                workers=workers)
 
     def asdict(self, basedir=None):
         '''Returns the configuration for the flight as a dict
@@ -362,7 +563,7 @@ class Flight:
         conf['date'] = self.date.isoformat()
         if self.zone is not None:
             conf['zone'] = self.zone
-        for field in ['ops', 'ins', 'gps', 'edb']:
+        for field in ['ops', 'ins', 'gps', 'edb', 'store']:
             if self.__dict__[field + '_file'] is not None:
                 value = self.__dict__[field + '_file']
                 if basedir is not None:
@@ -101,12 +101,11 @@ def add_to_frame(frame, sod, ins, ops=None, prefix='ins_', zone=None):
     '''
     ops = ops or {}
 
-    def _interp(field):
-        return np.interp(sod, ins.sod, field, left=np.nan, right=np.nan)
-
+    # The weights are found once and then applied to every field together
     fields = ['lon', 'lat', 'alt', 'roll', 'pitch', 'heading']
-    for field in fields:
-        frame[prefix + field] = _interp(ins[field])
+    values = _interp_columns(sod, ins.sod.values, ins[fields].values)
+    for idx, field in enumerate(fields):
+        frame[prefix + field] = values[:, idx]
 
     if 'dmars_invert' in ops and ops['dmars_invert']:
         frame[prefix + 'roll'] *= -1
@@ -114,8 +113,8 @@ def add_to_frame(frame, sod, ins, ops=None, prefix='ins_', zone=None):
         frame[prefix + 'heading'] += 180
 
     # If any of the requested sod values are outside the bounds of the INS,
-    # then the corresponding values will be nan. The UTM conversion in
-    # from_latlon fails if any values are nan, so avoid passing them to it.
+    # then the corresponding values will be nan. Those rows are left out of
+    # the UTM conversion so that they have no zone either.
 
     valid = ~np.isnan(frame[prefix + 'lon']) & ~np.isnan(frame[prefix + 'lat'])
 
@@ -129,3 +128,40 @@ def add_to_frame(frame, sod, ins, ops=None, prefix='ins_', zone=None):
                     frame[prefix + 'lon'][valid], zone)
 
     return frame
+
+def _interp_columns(x, xp, fp):
+    '''Interpolate every column of fp at x
+
+    This gives the same results as calling numpy.interp with left and right
+    set to nan for each column, but the search for the samples on either side
+    of each x is only done once and all columns are then interpolated in a
+    single operation.
+
+    Parameters
+        x : array-like of float
+            Values to interpolate at
+        xp : array-like of float
+            Increasing sample positions
+        fp : 2-D array-like of float
+            Sample values, with one row per sample position
+
+    Returns a 2-D array with one row per value in x and one column per column
+    in fp.
+    '''
+    x = np.asarray(x, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    fp = np.asarray(fp, dtype=float)
+    if len(xp) < 2:
+        return np.column_stack([
+            np.interp(x, xp, column, left=np.nan, right=np.nan)
+            for column in fp.T])
+
+    lower = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    span = xp[lower + 1] - xp[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(span > 0, (x - xp[lower]) / span, 0)
+
+    low = fp[lower]
+    result = low + weight[:, np.newaxis] * (fp[lower + 1] - low)
+    result[~((x >= xp[0]) & (x <= xp[-1]))] = np.nan
+    return result
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Columnar storage for decoded waveform data
+
+Retrieving waveforms through :class:`eaarl.io.flight.Flight` decodes the TLD
+files and interpolates INS data for every pulse, which is the slowest part of
+processing a mission. When a mission will be processed more than once, its
+waveform data can instead be exported once to a :class:`WaveformStore` and
+served from there afterward::
+
+    flight.export_wfs('mission-wfs.h5')
+    flight.load_store('mission-wfs.h5')
+    wfs = flight.wfs_by_time(start, stop)
+
+A store is an HDF5 file with three nodes, all chunked and compressed:
+
+    /waveforms
+        Table with one row per waveform, holding the columns of the DataFrame
+        returned by :meth:`eaarl.io.flight.Flight.wfs_by_raster`. Each waveform
+        column, such as tx or rx, is replaced by a pair of columns holding the
+        offset and length of its samples.
+    /tx, /rx, ...
+        The samples for each waveform column, back to back in a flat uint8
+        array. Transmit waveforms shared by the channels of a pulse are stored
+        once.
+    /rasters
+        Table with one row per raster giving its raster_number, its time, and
+        the span of rows it occupies in /waveforms. The raster_number and time
+        columns are indexed.
+
+Queries are evaluated against /rasters, so only the waveform rows and samples
+for the selected rasters are read from disk.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import numpy as np
+import pandas as pd
+import tables
+
+from .waveforms import RaggedArray
+
+RASTER_DTYPE = np.dtype([
+    ('raster_number', '<i8'),
+    ('time', '<f8'),
+    ('start', '<i8'),
+    ('count', '<i8'),
+])
+
+class WaveformStore:
+    '''HDF5 store of decoded waveform data
+
+    A store can be used as a context manager, which closes it on exit.
+    '''
+    def __init__(self, filename, mode='r', complevel=5, complib='zlib'):
+        '''Open a WaveformStore
+
+        Parameters
+            filename : string
+                Path to the HDF5 file
+            mode : string, default 'r'
+                'r' to read an existing store, 'w' to create a new store
+                (replacing any existing file), or 'a' to add to an existing
+                store.
+            complevel : integer, default 5
+                Compression level for new nodes, from 0 to 9
+            complib : string, default 'zlib'
+                Compression library for new nodes; see tables.Filters
+        '''
+        self.filename = filename
+        self.filters = tables.Filters(complevel=complevel, complib=complib,
+                                      shuffle=True)
+        self._h5 = tables.open_file(filename, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        '''Returns the number of rasters in the store'''
+        if 'rasters' not in self._h5.root:
+            return 0
+        return self._h5.root.rasters.nrows
+
+    def close(self):
+        '''Close the underlying file'''
+        self._h5.close()
+
+    def append(self, wfs, rasters):
+        '''Add waveform data for a set of rasters to the store
+
+        Parameters
+            wfs : pandas.DataFrame
+                Waveform data as returned by
+                :meth:`eaarl.io.flight.Flight.wfs_by_raster`. Rows must be
+                ordered by raster. Columns holding
+                :class:`eaarl.io.waveforms.RaggedArray` values are stored as
+                waveforms; all others must be numeric.
+            rasters : pandas.DataFrame or numpy.ndarray
+                One entry per raster in wfs, in the same order, with fields
+                raster_number and time. Rasters without any waveforms may be
+                included.
+        '''
+        root = self._h5.root
+        ragged = [col for col in wfs.columns
+                  if isinstance(wfs[col].values, RaggedArray)]
+        if 'waveforms' not in root:
+            self._create(wfs, ragged)
+        elif (list(root.waveforms.attrs.columns) != list(wfs.columns) or
+              list(root.waveforms.attrs.ragged) != ragged):
+            raise ValueError('columns do not match those in the store')
+
+        table = root.waveforms
+        raster_number = np.asarray(rasters['raster_number'], dtype=np.int64)
+        entries = np.zeros(len(raster_number), dtype=RASTER_DTYPE)
+        entries['raster_number'] = raster_number
+        entries['time'] = rasters['time']
+        counts = _counts(raster_number, wfs['raster_number'].values)
+        entries['start'] = table.nrows + np.cumsum(counts) - counts
+        entries['count'] = counts
+
+        records = np.zeros(len(wfs), dtype=table.dtype)
+        for col in wfs.columns:
+            if col in ragged:
+                samples = getattr(root, col)
+                buffer, offsets, lengths = _flatten(wfs[col].values)
+                records[col + '_offset'] = offsets + samples.nrows
+                records[col + '_length'] = lengths
+                samples.append(buffer)
+            else:
+                values = wfs[col].values
+                if values.dtype == object:
+                    values = pd.to_numeric(values)
+                records[col] = values
+
+        table.append(records)
+        root.rasters.append(entries)
+        self._h5.flush()
+
+    def _create(self, wfs, ragged):
+        '''Create the nodes of a new store for frames like wfs'''
+        h5 = self._h5
+        fields = []
+        for col in wfs.columns:
+            if col in ragged:
+                fields.append((col + '_offset', '<i8'))
+                fields.append((col + '_length', '<i8'))
+                h5.create_earray(h5.root, col, tables.UInt8Atom(), (0,),
+                                 filters=self.filters)
+            else:
+                dtype = wfs[col].values.dtype
+                if dtype == object:
+                    dtype = pd.to_numeric(wfs[col].values).dtype
+                fields.append((col, dtype))
+        table = h5.create_table(h5.root, 'waveforms', np.dtype(fields),
+                                filters=self.filters)
+        table.attrs.columns = list(wfs.columns)
+        table.attrs.ragged = ragged
+
+        rasters = h5.create_table(h5.root, 'rasters', RASTER_DTYPE,
+                                  filters=self.filters)
+        rasters.cols.raster_number.create_index()
+        rasters.cols.time.create_index()
+
+    def raster_numbers(self):
+        '''Returns an array of the raster numbers in the store'''
+        if 'rasters' not in self._h5.root:
+            return np.zeros(0, dtype=np.int64)
+        return self._h5.root.rasters.col('raster_number')
+
+    def read_by_raster(self, rasters=None, start=None, count=1, ranges=None):
+        '''Retrieves waveform data for raster numbers
+
+        The arguments are as for
+        :meth:`eaarl.io.flight.Flight.wfs_by_raster`. Rasters that are not in
+        the store are ignored.
+
+        Returns pandas.DataFrame of waveform data, ordered as stored.
+        '''
+        return self._read([self._raster_coords(rasters, start, count, ranges)])
+
+    def read_by_time(self, start=None, stop=None, ranges=None):
+        '''Retrieve waveform data for given time ranges
+
+        Rasters are selected by their time in the same way as
+        :meth:`eaarl.io.waveforms.EaarlCollection.lookup_rasters_by_time`.
+        The arguments are as for :meth:`eaarl.io.flight.Flight.wfs_by_time`.
+
+        Returns pandas.DataFrame of waveform data, ordered as stored.
+        '''
+        return self._read([self._time_coords(start, stop, ranges)])
+
+    def iter_by_raster(self, rasters=None, start=None, count=1, ranges=None,
+                       chunk_size=1000):
+        '''Retrieves waveform data for raster numbers in chunks
+
+        This is a generator version of :meth:`read_by_raster`. Yields a
+        DataFrame of waveform data for each chunk of up to chunk_size rasters.
+        '''
+        return self._iter(self._raster_coords(rasters, start, count, ranges),
+                          chunk_size)
+
+    def iter_by_time(self, start=None, stop=None, ranges=None,
+                     chunk_size=1000):
+        '''Retrieve waveform data for given time ranges in chunks
+
+        This is a generator version of :meth:`read_by_time`. Yields a
+        DataFrame of waveform data for each chunk of up to chunk_size rasters.
+        '''
+        return self._iter(self._time_coords(start, stop, ranges), chunk_size)
+
+    def _raster_coords(self, rasters, start, count, ranges):
+        '''Returns the rows of /rasters for the given raster numbers'''
+        spans = []
+        if start is not None:
+            spans.append((start, start + count))
+        if ranges is not None:
+            spans.extend((_start, _start + _count) for _start, _count in ranges)
+
+        coords = [self._where('(raster_number >= lo) & (raster_number < hi)',
+                              lo, hi) for lo, hi in spans]
+        if rasters is not None:
+            rasters = np.atleast_1d(np.asarray(rasters, dtype=np.int64))
+            coords.append(np.flatnonzero(
+                np.isin(self.raster_numbers(), rasters)))
+        return _unique(coords)
+
+    def _time_coords(self, start, stop, ranges):
+        '''Returns the rows of /rasters for the given time ranges'''
+        if start is not None and stop is not None:
+            time_ranges = [(start, stop)]
+        elif ranges is not None:
+            time_ranges = ranges
+        else:
+            raise TypeError(
+                'read_by_time() requires ranges= or start= and stop='
+            )
+
+        return _unique([self._where('(time >= lo) & (time <= hi)', lo, hi)
+                        for lo, hi in time_ranges])
+
+    def _where(self, condition, lo, hi):
+        '''Returns the rows of /rasters matching condition'''
+        if 'rasters' not in self._h5.root:
+            return np.zeros(0, dtype=np.int64)
+        return self._h5.root.rasters.get_where_list(
+            condition, condvars={'lo': lo, 'hi': hi})
+
+    def _iter(self, coords, chunk_size):
+        '''Yields the waveform data for rows of /rasters in chunks'''
+        for first in range(0, len(coords), chunk_size):
+            yield self._read([coords[first:first+chunk_size]])
+
+    def _read(self, coords):
+        '''Returns the waveform data for the given rows of /rasters'''
+        root = self._h5.root
+        coords = _unique(coords)
+
+        if 'waveforms' not in root:
+            return pd.DataFrame()
+        table = root.waveforms
+        columns = list(table.attrs.columns)
+        ragged = list(table.attrs.ragged)
+
+        if len(coords):
+            entries = root.rasters.read_coordinates(coords)
+        else:
+            entries = np.zeros(0, dtype=RASTER_DTYPE)
+
+        # Rasters are stored back to back, so adjacent rasters are read as a
+        # single span of rows
+        starts = entries['start']
+        stops = starts + entries['count']
+        breaks = np.flatnonzero(starts[1:] != stops[:-1]) + 1
+        runs = zip(np.concatenate([[0], breaks]),
+                   np.concatenate([breaks, [len(entries)]]))
+
+        records = []
+        samples = dict((col, []) for col in ragged)
+        for first, last in runs:
+            if first == last:
+                continue
+            rows = table.read(starts[first], stops[last-1])
+            records.append(rows)
+            for col in ragged:
+                samples[col].append(_read_samples(
+                    getattr(root, col), rows[col + '_offset'],
+                    rows[col + '_length']))
+
+        if records:
+            rows = np.concatenate(records)
+        else:
+            rows = np.zeros(0, dtype=table.dtype)
+
+        wfs = pd.DataFrame()
+        for col in columns:
+            if col in ragged:
+                if samples[col]:
+                    wfs[col] = RaggedArray._concat_same_type(samples[col])
+                else:
+                    wfs[col] = RaggedArray(np.zeros(0), np.zeros(0),
+                                           np.zeros(0))
+            else:
+                wfs[col] = rows[col]
+
+        wfs.set_index(['raster_number', 'pulse_number', 'channel'],
+                      drop=False, inplace=True)
+        return wfs
+
+def _unique(coords):
+    '''Returns the sorted, distinct rows in a list of arrays of rows'''
+    if not coords:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(coords)).astype(np.int64)
+
+def _counts(raster_number, wfs_raster_number):
+    '''Returns the number of waveform rows for each raster
+
+    Raises ValueError if the rows are not grouped in the order of the rasters.
+    '''
+    order = np.argsort(raster_number, kind='stable')
+    pos = np.searchsorted(raster_number, wfs_raster_number, sorter=order)
+    pos = order[np.minimum(pos, len(order) - 1)]
+    if len(pos) and (np.any(raster_number[pos] != wfs_raster_number) or
+                     np.any(np.diff(pos) < 0)):
+        raise ValueError('waveforms must be grouped by raster, in order')
+    return np.bincount(pos, minlength=len(raster_number)).astype(np.int64)
+
+def _flatten(waveforms):
+    '''Returns (buffer, offsets, lengths) for storing a RaggedArray
+
+    Elements that refer to the same samples, such as the transmit waveform
+    repeated for each channel of a pulse, are only stored once. Missing
+    elements have an offset of 0 and a length of -1.
+    '''
+    if not len(waveforms):
+        return (np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64))
+    lengths = waveforms.lengths
+    offsets = np.where(lengths < 0, 0, waveforms.offsets)
+    spans, inverse = np.unique(np.stack([offsets, lengths], axis=1), axis=0,
+                               return_inverse=True)
+    unique = RaggedArray(waveforms.buffer, spans[:, 0], spans[:, 1]).compact()
+    inverse = inverse.ravel()
+    return unique.buffer, unique.offsets[inverse], unique.lengths[inverse]
+
+def _read_samples(samples, offsets, lengths):
+    '''Returns a RaggedArray for waveforms stored in samples'''
+    present = lengths > 0
+    if not np.any(present):
+        return RaggedArray(np.zeros(0), np.zeros(len(offsets)), lengths)
+    first = offsets[present].min()
+    last = (offsets + lengths)[present].max()
+    return RaggedArray(samples[first:last],
+                       np.where(present, offsets - first, 0), lengths)
@@ -6,7 +6,12 @@ Module contents:
     * open
     * rasters_to_pulses
     * pulses_to_channels
+    * arrays_to_pulses
+    * arrays_to_waveforms
     * EaarlCollection
+    * RaggedArray
+    * TLDFileCache
+    * RasterCache
 '''
 
 from __future__ import absolute_import
@@ -15,5 +20,10 @@ from .collection import collection_open as open # pylint: disable=redefined-buil
 from .collection import EaarlCollection
 from .collection import rasters_to_pulses
 from .collection import pulses_to_waveforms
+from .collection import arrays_to_pulses
+from .collection import arrays_to_waveforms
 from .collection import rasters_tx_clean
 from .collection import rasters_wf_flip
+from .ragged import RaggedArray
+from .cache import TLDFileCache
+from .cache import RasterCache
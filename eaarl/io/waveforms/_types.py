@@ -12,7 +12,11 @@ import future.standard_library
 future.standard_library.install_aliases()
 
 from collections import namedtuple
+import re
 from struct import Struct
+from struct import error as StructError
+
+import numpy as np
 
 from . import _util as util
 
@@ -34,6 +38,28 @@ def _set_doc(fnc, tokens, doc):
     except AttributeError:
         fnc.__func__.__doc__ = doc
 
+# Mapping from struct format characters to numpy type codes
+_STRUCT_DTYPES = {
+    'B': 'u1', 'b': 'i1',
+    'H': 'u2', 'h': 'i2',
+    'L': 'u4', 'l': 'i4',
+    'I': 'u4', 'i': 'i4',
+    'Q': 'u8', 'q': 'i8',
+}
+
+def _struct_dtype(fmt, fields):
+    '''Returns a packed numpy.dtype equivalent to a little-endian struct format
+
+    Only little-endian formats composed of integer types are supported. Each
+    item in the format corresponds to one of the given field names.
+    '''
+    if fmt[0] != '<':
+        raise ValueError('only little-endian struct formats are supported')
+    formats = []
+    for repeat, code in re.findall(r'(\d*)([a-zA-Z])', fmt[1:]):
+        formats.extend(['<' + _STRUCT_DTYPES[code]] * int(repeat or 1))
+    return np.dtype({'names': list(fields), 'formats': formats})
+
 def _namedtuple_struct(typename, fmt, fields, doc=None):
     '''Creates a class combining struct.Struct and collections.namedtuple
 
@@ -47,6 +73,12 @@ def _namedtuple_struct(typename, fmt, fields, doc=None):
 
     The subclass also adds a convenience _fromdict classmethod to complement
     the _make method provided by namedtuple.
+
+    For bulk decoding, the subclass also provides class attribute _dtype, a
+    numpy.dtype with the same layout as the Struct, along with class methods
+    _unpack_array and _ascolumns that are the array counterparts of
+    _unpack_from and _asdict. For bulk encoding, class method _fromcolumns is
+    the array counterpart of _fromdict.
     '''
     tupletypename = typename + 'Tuple'
     tupletype = namedtuple(tupletypename, fields)
@@ -77,6 +109,35 @@ def _namedtuple_struct(typename, fmt, fields, doc=None):
         vals = cls._struct.unpack_from(buffer, offset)
         return cls(*vals)
 
+    @classmethod
+    def _unpack_array(cls, buffer, offsets=None, count=-1, offset=0):
+        dtype = cls._dtype
+        if offsets is None:
+            return np.frombuffer(buffer, dtype=dtype, count=count,
+                                 offset=offset)
+        buf = np.frombuffer(buffer, dtype=np.uint8)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        idx = offsets[:, np.newaxis] + np.arange(dtype.itemsize)
+        return buf[idx].view(dtype).reshape(len(offsets))
+
+    @classmethod
+    def _ascolumns(cls, array):
+        return dict((field, array[field]) for field in cls._fields)
+
+    @classmethod
+    def _fromcolumns(cls, columns):
+        values = [np.asarray(columns[field]) for field in cls._fields]
+        array = np.zeros(len(values[0]), dtype=cls._dtype)
+        for field, value in zip(cls._fields, values):
+            kind = cls._dtype[field]
+            if len(value) and value.dtype.kind in 'iu' and (
+                    value.min() < np.iinfo(kind).min or
+                    value.max() > np.iinfo(kind).max):
+                raise StructError('{} is out of range for {}'.format(
+                    field, typename))
+            array[field] = value
+        return array
+
     _repr = typename + '(' + ', '.join([f+'=%r' for f in fields]) + ')'
     def __repr__(self):
         '''Return a nicely formatted representation string'''
@@ -95,6 +156,10 @@ def _namedtuple_struct(typename, fmt, fields, doc=None):
         '_pack_into': _pack_into,
         '_unpack': _unpack,
         '_unpack_from': _unpack_from,
+        '_dtype': _struct_dtype(fmt, fields),
+        '_unpack_array': _unpack_array,
+        '_ascolumns': _ascolumns,
+        '_fromcolumns': _fromcolumns,
     }
 
     # pylint: disable=invalid-name
@@ -145,6 +210,28 @@ def _namedtuple_struct(typename, fmt, fields, doc=None):
     Requires len(buffer[offset:]) >= self._size
     ''')
 
+    _set_doc(_NamedTuplePacker._unpack_array, tokens, '''
+    Unpack many {typename} records from a raw buffer into a structured array
+
+    If offsets is None, then count consecutive records starting at offset are
+    returned as a zero-copy view of the buffer (count=-1 reads to the end of
+    the buffer). Otherwise, offsets must be a sequence of byte offsets and a
+    new array is returned with the record found at each offset.
+    ''')
+
+    _set_doc(_NamedTuplePacker._ascolumns, tokens, '''
+    Convert a structured array of {typename} records into a dict of arrays
+
+    This is the columnar counterpart to _asdict.
+    ''')
+
+    _set_doc(_NamedTuplePacker._fromcolumns, tokens, '''
+    Convert a dict of arrays into a structured array of {typename} records
+
+    This is the columnar counterpart to _fromdict. Integer values that do not
+    fit their fields raise struct.error, as _pack would.
+    ''')
+
     _set_doc(_NamedTuplePacker._pack, tokens, '''
     Return a string containing the {typename} object's packed data
     ''')
@@ -189,16 +276,13 @@ TLDPulseHeaderBase = _namedtuple_struct('TLDPulseHeader', '<L5BhH',
 ################
 
 def _rshift_and(val, shift, _and):
+    # Avoid augmented assignment so that numpy arrays are not altered in place
     mask = 2 ** _and - 1
-    val >>= shift
-    val &= mask
-    return val
+    return (val >> shift) & mask
 
 def _lshift_and(val, shift, _and):
     mask = 2 ** _and - 1
-    val &= mask
-    val <<= shift
-    return val
+    return (val & mask) << shift
 
 def _bits_unwrap(dct, conf):
     for src, dst, shift, bits in conf:
@@ -225,6 +309,18 @@ def _time_to_int(dct, src, dst_seconds, dst_fraction):
         dct[dst_seconds] = seconds
     dct[dst_fraction] = fraction
 
+def _time_to_int_columns(dct, src, dst_seconds, dst_fraction):
+    # Rounds the same way as _time_to_int does for scalars, so that encoding
+    # in bulk gives the same bytes as encoding one record at a time
+    soe = np.asarray(dct[src], dtype=np.double)
+    del dct[src]
+    seconds = np.floor(soe)
+    fraction = np.floor((soe - seconds) / util.TIME_FRACTION_SECONDS + 0.5)
+
+    if dst_seconds is not None:
+        dct[dst_seconds] = seconds.astype(np.int64)
+    dct[dst_fraction] = fraction.astype(np.int64)
+
 def _time_to_soe(dct, dst, src_seconds, src_fraction):
     if src_seconds is None:
         seconds = 0
@@ -250,6 +346,18 @@ class EDBRecord(EDBRecordBase):
         _time_to_soe(dct, 'time', 'time_seconds', 'time_fraction')
         return dct
 
+    @classmethod
+    def _ascolumns(cls, array):
+        dct = super(EDBRecord, cls)._ascolumns(array)
+        _time_to_soe(dct, 'time', 'time_seconds', 'time_fraction')
+        return dct
+
+    @classmethod
+    def _fromcolumns(cls, columns):
+        dct = dict(columns)
+        _time_to_int_columns(dct, 'time', 'time_seconds', 'time_fraction')
+        return super(EDBRecord, cls)._fromcolumns(dct)
+
 class TLDRecordHeader(TLDRecordHeaderBase):
     '''Record header in TLD file'''
     _bits_map = [
@@ -267,6 +375,12 @@ class TLDRecordHeader(TLDRecordHeaderBase):
         _bits_unwrap(dct, self._bits_map)
         return dct
 
+    @classmethod
+    def _ascolumns(cls, array):
+        dct = super(TLDRecordHeader, cls)._ascolumns(array)
+        _bits_unwrap(dct, cls._bits_map)
+        return dct
+
 class TLDRasterHeader(TLDRasterHeaderBase):
     '''Raster header in record of TLD file'''
     _bits_map = [
@@ -286,6 +400,13 @@ class TLDRasterHeader(TLDRasterHeaderBase):
         _time_to_soe(dct, 'time', 'time_seconds', 'time_fraction')
         return dct
 
+    @classmethod
+    def _ascolumns(cls, array):
+        dct = super(TLDRasterHeader, cls)._ascolumns(array)
+        _bits_unwrap(dct, cls._bits_map)
+        _time_to_soe(dct, 'time', 'time_seconds', 'time_fraction')
+        return dct
+
 class TLDPulseHeader(TLDPulseHeaderBase):
     '''Pulse header for pulse in raster of TLD file'''
     _bits_map = [
@@ -331,3 +452,24 @@ class TLDPulseHeader(TLDPulseHeaderBase):
         del dct['scan_angle_counts']
 
         return dct
+
+    @classmethod
+    def _ascolumns(cls, array):
+        dct = super(TLDPulseHeader, cls)._ascolumns(array)
+
+        _bits_unwrap(dct, cls._bits_map)
+        _time_to_soe(dct, 'time_offset', None, 'time_fraction')
+
+        dct['bias_rx'] = np.column_stack([
+            dct['bias_rx_1'], dct['bias_rx_2'], dct['bias_rx_3'],
+            dct['bias_rx_4']])
+        del dct['bias_rx_1']
+        del dct['bias_rx_2']
+        del dct['bias_rx_3']
+        del dct['bias_rx_4']
+
+        dct['scan_angle'] = \
+                util.scan_counts_to_degrees(dct['scan_angle_counts'])
+        del dct['scan_angle_counts']
+
+        return dct
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Caching for TLD data
+
+Many EAARL missions are archived with only compressed TLD files. Reading those
+requires decompressing them again every session. :class:`TLDFileCache` keeps
+decompressed copies of compressed TLD files in a directory of your choosing so
+that later sessions can memory map them instead.
+
+Interactive tools often request the same rasters many times, such as when
+stepping back and forth along a flight line. :class:`RasterCache` keeps
+recently decoded rasters in memory so that those requests do not go back to
+the TLD files at all.
+
+To use either cache, pass it to :class:`eaarl.io.waveforms.EaarlCollection`::
+
+    cache = TLDFileCache('/scratch/tld-cache', max_bytes=50 * 1024**3)
+    edb = EaarlCollection(edb_file='mission.idx', cache=cache,
+                          raster_cache=RasterCache(512 * 1024**2))
+
+.. data:: default_max_bytes
+
+    Default size budget for a :class:`TLDFileCache`, in bytes. Defaults to 20
+    GiB.
+
+.. data:: default_raster_max_bytes
+
+    Default size budget for a :class:`RasterCache`, in bytes. Defaults to 256
+    MiB.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import bz2
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import os.path
+import re
+import shutil
+import tempfile
+
+# Size budgets used when none is given
+default_max_bytes = 20 * 1024**3 # pylint: disable=invalid-name
+default_raster_max_bytes = 256 * 1024**2 # pylint: disable=invalid-name
+
+_replace = getattr(os, 'replace', os.rename) # pylint: disable=invalid-name
+
+_TMP_PREFIX = '.tmp-'
+
+# Names of cached copies, as made by TLDFileCache._cached_path
+_ENTRY_NAME = re.compile(r'^[0-9a-f]{16}-[0-9a-f]{8}-')
+
+class TLDFileCache:
+    '''Directory of decompressed copies of compressed TLD files
+
+    Each copy is keyed by the source file's absolute path, size, and
+    modification time, so a copy is never used after its source changes. When
+    the total size of the copies exceeds max_bytes, the least recently used
+    copies are removed. A cache directory may be shared by several processes.
+
+    Only files named the way the cache names its copies are counted, evicted,
+    or cleared, so other files in the directory are left alone.
+    '''
+    def __init__(self, directory, max_bytes=None):
+        '''Create a TLDFileCache
+
+        Parameters
+            directory : string
+                Directory to hold the decompressed files. It is created if it
+                does not exist.
+            max_bytes : integer or None
+                Size budget for the cache, in bytes. If None,
+                :data:`default_max_bytes` is used.
+        '''
+        self.directory = directory
+        self.max_bytes = default_max_bytes if max_bytes is None else max_bytes
+
+    def get(self, path):
+        '''Returns the path to an uncompressed copy of a TLD file
+
+        If path is compressed, a cached copy is returned, creating it first if
+        necessary. If path is not compressed, or if the copy cannot be made
+        (for example, because it would not fit in the budget), then path is
+        returned unchanged.
+
+        Parameters
+            path : string
+                Path to a TLD file
+        '''
+        if path[-3:] == '.gz':
+            opener = gzip.open
+        elif path[-4:] == '.bz2':
+            opener = bz2.BZ2File
+        else:
+            return path
+
+        try:
+            cached = self._cached_path(path)
+            if os.path.isfile(cached):
+                # The file's modification time records its last use
+                os.utime(cached, None)
+                return cached
+            self._discard_stale(cached)
+            self._decompress(opener, path, cached)
+        except (OSError, IOError, EOFError):
+            return path
+
+        if os.path.getsize(cached) > self.max_bytes:
+            _remove(cached)
+            return path
+        self.evict(keep=cached)
+        return cached
+
+    def entries(self):
+        '''Returns a list of (path, size, last_used) for the cached files'''
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not _ENTRY_NAME.match(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        '''Returns the total size of the cached files, in bytes'''
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        '''Remove least recently used files until the cache fits its budget
+
+        Parameters
+            keep : string or None
+                Path of a cached file that should not be removed
+        '''
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if _remove(path):
+                total -= size
+
+    def clear(self):
+        '''Remove all cached files'''
+        for path, _, _ in self.entries():
+            _remove(path)
+
+    def _cached_path(self, path):
+        '''Returns the path where a copy of the given file is cached
+
+        The name begins with a hash of the source path, which identifies all
+        copies of a source, followed by a hash of its size and modification
+        time, which identifies the version of the source.
+        '''
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        source = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+        version = hashlib.sha1('{} {!r}'.format(
+            stat.st_size, stat.st_mtime).encode('utf-8')).hexdigest()[:8]
+        base = os.path.basename(path).rsplit('.', 1)[0]
+        return os.path.join(self.directory,
+                            '{}-{}-{}'.format(source, version, base))
+
+    def _discard_stale(self, cached):
+        '''Remove copies of older versions of a cached file's source'''
+        prefix = os.path.basename(cached)[:17]
+        for path, _, _ in self.entries():
+            if os.path.basename(path).startswith(prefix):
+                _remove(path)
+
+    def _decompress(self, opener, path, cached):
+        '''Decompress path into cached
+
+        The data is written to a temporary file first so that other readers
+        of the cache never see a partial file.
+        '''
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=_TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as dst, opener(path, 'rb') as src:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            _replace(tmp, cached)
+        except Exception:
+            _remove(tmp)
+            raise
+
+class RasterCache:
+    '''In-memory cache of decoded rasters
+
+    Entries are kept until their total size exceeds max_bytes, at which point
+    the least recently used entries are discarded. The hits and misses
+    attributes count lookups that did and did not find an entry.
+
+    The cache stores whatever values it is given; it does not copy them.
+    :class:`eaarl.io.waveforms.EaarlCollection` copies rasters going in and
+    out so that changes made by the caller do not affect the cache.
+    '''
+    def __init__(self, max_bytes=None):
+        '''Create a RasterCache
+
+        Parameters
+            max_bytes : integer or None
+                Size budget for the cache, in bytes. If None,
+                :data:`default_raster_max_bytes` is used.
+        '''
+        self.max_bytes = (default_raster_max_bytes if max_bytes is None
+                          else max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        '''Returns the value for key, or default if it is not cached
+
+        A found entry becomes the most recently used.
+        '''
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        '''Add a value to the cache
+
+        Parameters
+            key : hashable
+                Key for the value
+            value : object
+                Value to store
+            nbytes : integer
+                Size of the value, in bytes. A value larger than the budget is
+                not stored.
+        '''
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+
+    def clear(self):
+        '''Discard all entries and reset the statistics'''
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''Returns a dict of hits, misses, entries, and nbytes'''
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'nbytes': self.nbytes}
+
+def _remove(path):
+    '''Remove a file, returning False if it could not be removed'''
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
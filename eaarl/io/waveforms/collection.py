@@ -11,27 +11,45 @@ from future.builtins import * # pylint: disable=wildcard-import
 import future.standard_library
 future.standard_library.install_aliases()
 
+from collections import OrderedDict
 from contextlib import contextmanager as _contextmanager
-import bz2
-import gzip
+import copy
+import itertools
 import numpy as np
 import os.path
 import pandas as pd
 
 from . import edb
+from . import indexed
+from . import pulseindex
 from . import tld
+from .cache import RasterCache
+from .cache import TLDFileCache
+from .ragged import RaggedArray
+
+# Source of raster cache identities for collections without an EDB file
+_collection_ids = itertools.count() # pylint: disable=invalid-name
 
 @_contextmanager
 def collection_open(*args, **kwds):
-    '''Context manager for an :class:`EaarlCollection`.'''
-    yield EaarlCollection(*args, **kwds)
+    '''Context manager for an :class:`EaarlCollection`.
+
+    The collection is closed on exit, releasing any open TLD files.
+    '''
+    collection = EaarlCollection(*args, **kwds)
+    try:
+        yield collection
+    finally:
+        collection.close()
 
 class EaarlCollection:
     '''Collection of EAARL waveform data.
 
     The collection comprises an EDB file and associated TLD files.
     '''
-    def __init__(self, edb_file=None, tld_path=None, edb_data=None):
+    def __init__(self, edb_file=None, tld_path=None, edb_data=None,
+                 read_gap=1048576, cache=None, max_open_files=16,
+                 raster_cache=None, lazy=False):
         '''Create an EaarlCollection
 
         Parameters
@@ -39,8 +57,35 @@ class EaarlCollection:
                 Path to an EDB file
             tld_path : string or None
                 Path to the TLD files
-            edb_data : sequence of dicts or None
-                Return result from :func:`eaarl.io.waveforms.edb.read`.
+            edb_data : sequence of dicts, pandas.DataFrame, or None
+                Return result from :func:`eaarl.io.waveforms.edb.read` or
+                :func:`eaarl.io.waveforms.edb.read_frame`.
+            read_gap : integer, default 1048576
+                When reading from TLD files that are not memory mapped,
+                requested rasters that are separated by no more than this many
+                bytes are fetched with a single read. Set to 0 to only combine
+                adjacent rasters.
+            cache : eaarl.io.waveforms.cache.TLDFileCache, string, or None
+                Cache for decompressed copies of compressed TLD files. With a
+                cache, compressed files are decompressed once and then read
+                through a memory map like uncompressed files. If a string is
+                given, it is the directory for a TLDFileCache with the default
+                size budget. If None, compressed files are read directly.
+            max_open_files : integer, default 16
+                Number of TLD files that the collection keeps open between
+                calls. Call :meth:`close` (or use :func:`collection_open`) to
+                release them.
+            raster_cache : eaarl.io.waveforms.cache.RasterCache, integer, or None
+                Cache for decoded rasters. Rasters found in the cache are
+                returned without reading the TLD files. If an integer is given,
+                it is the size budget in bytes for a new RasterCache. If None,
+                rasters are not cached.
+            lazy : boolean, default False
+                If True, edb_file is memory mapped with
+                :class:`eaarl.io.waveforms.edb.MappedEDB` instead of being
+                read. Only the EDB entries needed by each call are decoded, so
+                opening a collection is nearly instant. A DataFrame of the
+                full EDB is only built if one is needed.
         '''
         if tld_path is not None:
             self._tld_path = tld_path
@@ -52,18 +97,303 @@ class EaarlCollection:
                 'edb_file='
             )
 
+        # The EDB is held either as a DataFrame or, in lazy mode, as an
+        # edb.MappedEDB until a DataFrame is needed; see _edb
+        self._edb_frame = None
+        self._edb_mapped = None
+        self._edb_file = None
         if edb_data is not None:
             self._edb = pd.DataFrame(edb_data).copy(deep=True)
+        elif lazy:
+            self._edb_file = edb_file
+            self._edb_mapped = edb.MappedEDB(edb_file)
         else:
             try:
-                raw_edb = edb.read_from(edb_file)
+                self._edb = edb.read_frame_from(edb_file)
             except TypeError:
-                raw_edb = edb.read(edb_file)
-            self._edb = pd.DataFrame(raw_edb)
+                self._edb = edb.read_frame(edb_file)
+
+        # Sorted time index, see _time_index
+        self._time_order = None
+        self._time_sorted = None
+
+        self.read_gap = read_gap
+        self._record_end = None
+
+        if isinstance(cache, str):
+            cache = TLDFileCache(cache)
+        self.cache = cache
+
+        if raster_cache is not None and not isinstance(raster_cache,
+                                                       RasterCache):
+            raster_cache = RasterCache(raster_cache)
+        self.raster_cache = raster_cache
+
+        # Open TLD files by file name, least recently used first, and the
+        # resolved path for each file name
+        self.max_open_files = max_open_files
+        self._handles = OrderedDict()
+        self._paths = {}
+
+        # Pulse indexes by file name, see _pulse_index
+        self._pulse_indexes = {}
+
+        # Identifies this collection's rasters in a shared raster cache. A
+        # collection read from an EDB file shares entries with others read
+        # from the same files; one given edb_data never shares them.
+        if edb_data is None and isinstance(edb_file, str):
+            self._cache_id = (os.path.abspath(self._tld_path),
+                              os.path.abspath(edb_file))
+        else:
+            self._cache_id = next(_collection_ids)
+
+    @property
+    def _edb(self):
+        '''The EDB as a DataFrame, with a raster_number column
+
+        In lazy mode, this is decoded on first use.
+        '''
+        if self._edb_frame is None:
+            self._edb = self._mapped_edb().frame()
+        return self._edb_frame
+
+    @_edb.setter
+    def _edb(self, frame):
+        frame['raster_number'] = range(1, len(frame)+1)
+        self._edb_frame = frame
+
+    def __len__(self):
+        '''Returns the number of rasters in the collection'''
+        if self._edb_frame is None:
+            return len(self._mapped_edb())
+        return len(self._edb_frame)
+
+    def _edb_column(self, field):
+        '''Returns an EDB field as an array, without decoding the whole EDB'''
+        if self._edb_frame is None:
+            return getattr(self._mapped_edb(), field)
+        return self._edb_frame[field].values
+
+    def _edb_rows(self, rows):
+        '''Returns a DataFrame of the EDB entries at the given positions'''
+        if self._edb_frame is None:
+            frame = self._mapped_edb().frame(rows)
+            frame['raster_number'] = np.asarray(rows, dtype=np.int64) + 1
+            return frame
+        return self._edb_frame.iloc[rows].reset_index(drop=True)
+
+    def _mapped_edb(self):
+        '''Returns the edb.MappedEDB of a lazy collection
+
+        The map is opened again if it was released by :meth:`close`.
+        '''
+        if self._edb_mapped is None:
+            self._edb_mapped = edb.MappedEDB(self._edb_file)
+        return self._edb_mapped
+
+    def close(self):
+        '''Release any files held open by the collection
+
+        This closes the pooled TLD files and, in lazy mode, the memory map of
+        the EDB file. They are opened again if the collection is used later.
+        '''
+        while self._handles:
+            _, handle = self._handles.popitem()
+            handle.close()
+        self._paths = {}
+        self._pulse_indexes = {}
+        if self._edb_mapped is not None:
+            self._edb_mapped.close()
+            self._edb_mapped = None
+
+    def _tld_file_path(self, file_name):
+        '''Returns the path to read for a TLD file name
+
+        The result is kept, so each file is only located once.
+        '''
+        try:
+            return self._paths[file_name]
+        except KeyError:
+            pass
+        tld_path = _find_tld_file(self._tld_path, file_name)
+        if self.cache is not None:
+            tld_path = self.cache.get(tld_path)
+        self._paths[file_name] = tld_path
+        return tld_path
+
+    def _tld_handle(self, file_name):
+        '''Returns an open TLD file from the collection's pool
+
+        Uncompressed files are opened as a tld.MappedTLD. Compressed files are
+        opened with :func:`eaarl.io.waveforms.indexed.open_compressed`. Files
+        stay open for later calls; once more than max_open_files are open, the
+        least recently used file is closed.
+        '''
+        try:
+            handle = self._handles.pop(file_name)
+        except KeyError:
+            tld_path = self._tld_file_path(file_name)
+            if _compression(tld_path) is None:
+                handle = tld.MappedTLD(tld_path)
+            else:
+                handle = indexed.open_compressed(tld_path)
+            while self._handles and len(self._handles) >= self.max_open_files:
+                self._handles.popitem(last=False)[1].close()
+        self._handles[file_name] = handle
+        return handle
+
+    def _pulse_index(self, file_name):
+        '''Returns the pulseindex.PulseIndex for a TLD file
+
+        The index is loaded from its sidecar file, or built and saved if
+        needed, on first use and then kept.
+        '''
+        try:
+            return self._pulse_indexes[file_name]
+        except KeyError:
+            pass
+
+        def read():
+            '''Returns the entire uncompressed TLD file'''
+            handle = self._tld_handle(file_name)
+            if isinstance(handle, tld.MappedTLD):
+                return handle.buffer
+            handle.seek(0)
+            return handle.read()
+
+        index = pulseindex.PulseIndex.open(self._tld_file_path(file_name),
+                                           read)
+        self._pulse_indexes[file_name] = index
+        return index
+
+    def _locate_pulses(self, rasters, pulses):
+        '''Find pulses in their TLD files' pulse indexes
+
+        Yields (file_name, index, positions, rows) for each TLD file, where
+        positions are the positions in rasters and pulses of the pulses in
+        that file and rows are their positions in the index.
+        '''
+        rasters = np.atleast_1d(np.asarray(rasters, dtype=np.int64))
+        pulses = np.atleast_1d(np.asarray(pulses, dtype=np.int64))
+        if np.any((rasters < 1) | (rasters > len(self))):
+            raise KeyError('raster number out of range')
+
+        entries = self._edb_rows(rasters - 1)
+        offsets = entries['record_offset'].values.astype(np.int64)
+        codes, file_names = pd.factorize(entries['file_name'])
+        for code, file_name in enumerate(file_names):
+            positions = np.flatnonzero(codes == code)
+            index = self._pulse_index(file_name)
+            rows = index.find_pulses(offsets[positions], pulses[positions])
+            yield file_name, index, positions, rows
+
+    def _read_spans(self, file_name, offsets, lengths):
+        '''Read byte ranges from a TLD file
+
+        Returns (samples, sample_offsets) where samples holds the ranges back
+        to back as a uint8 array and sample_offsets gives where each begins.
+        '''
+        handle = self._tld_handle(file_name)
+        if isinstance(handle, tld.MappedTLD):
+            samples, sample_offsets, _ = tld._gather(handle.array, offsets,
+                                                     lengths)
+            return samples, sample_offsets
+
+        # Read in file order so that compressed files only seek forward
+        parts = [None] * len(offsets)
+        for idx in np.argsort(offsets, kind='mergesort'):
+            handle.seek(offsets[idx])
+            parts[idx] = np.frombuffer(handle.read(lengths[idx]),
+                                       dtype=np.uint8)
+        sample_offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=sample_offsets[1:])
+        if parts:
+            return np.concatenate(parts), sample_offsets
+        return np.zeros(0, dtype=np.uint8), sample_offsets
+
+    def get_pulses(self, rasters, pulses):
+        '''Retrieve individual pulses
 
-        self._edb['raster_number'] = range(1, len(self._edb)+1)
+        Only the requested pulses are read from the TLD files, using a pulse
+        index for each file; see :mod:`eaarl.io.waveforms.pulseindex`. This is
+        much faster than :meth:`get_rasters` when only a few pulses from each
+        raster are needed.
 
-    def get_rasters_by_time(self, start=None, stop=None, ranges=None, progress=True):
+        Parameters
+            rasters : integer or array-like of integers
+                Raster number of each pulse
+            pulses : integer or array-like of integers
+                1-based pulse number of each pulse within its raster
+
+        Returns a list of dicts in the same form as the pulse entries of the
+        rasters returned by :meth:`get_rasters`, with raster_number and
+        pulse_number added. Raises KeyError if a pulse does not exist.
+        '''
+        rasters, pulses = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(rasters, dtype=np.int64)),
+            np.atleast_1d(np.asarray(pulses, dtype=np.int64)))
+        times = self._edb_column('time')
+
+        result = [None] * len(rasters)
+        for file_name, index, positions, rows in self._locate_pulses(
+                rasters, pulses):
+            entries = index.pulses[rows]
+            samples, sample_offsets = self._read_spans(
+                file_name, entries['offset'], entries['length'])
+            raw = samples.tobytes()
+            for pos, start in zip(positions, sample_offsets):
+                pulse, _ = tld._read_pulse(raw, int(start))
+                pulse['time'] = times[rasters[pos]-1] + pulse['time_offset']
+                del pulse['time_offset']
+                pulse['raster_number'] = int(rasters[pos])
+                pulse['pulse_number'] = int(pulses[pos])
+                result[pos] = pulse
+        return result
+
+    def get_waveforms(self, rasters, pulses, channels):
+        '''Retrieve individual waveforms
+
+        Only the samples of the requested waveforms are read from the TLD
+        files, using a pulse index for each file; see
+        :mod:`eaarl.io.waveforms.pulseindex`.
+
+        Parameters
+            rasters : integer or array-like of integers
+                Raster number of each waveform
+            pulses : integer or array-like of integers
+                1-based pulse number of each waveform within its raster
+            channels : integer or array-like of integers
+                Channel of each waveform. Channel 0 is the transmit waveform
+                and channels 1 and up are the return waveforms.
+
+        Returns a :class:`eaarl.io.waveforms.RaggedArray` with one waveform
+        per requested (raster, pulse, channel). The waveforms are raw, as
+        stored in the TLD file. Raises KeyError if a waveform does not exist.
+        '''
+        rasters, pulses, channels = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(rasters, dtype=np.int64)),
+            np.atleast_1d(np.asarray(pulses, dtype=np.int64)),
+            np.atleast_1d(np.asarray(channels, dtype=np.int64)))
+
+        buffers = []
+        offsets = np.zeros(len(rasters), dtype=np.int64)
+        lengths = np.zeros(len(rasters), dtype=np.int64)
+        base = 0
+        for file_name, index, positions, rows in self._locate_pulses(
+                rasters, pulses):
+            spans = index.find_waveforms(rows, channels[positions])
+            samples, sample_offsets = self._read_spans(file_name, *spans)
+            offsets[positions] = sample_offsets + base
+            lengths[positions] = spans[1]
+            buffers.append(samples)
+            base += len(samples)
+
+        if buffers:
+            return RaggedArray(np.concatenate(buffers), offsets, lengths)
+        return RaggedArray(np.zeros(0, dtype=np.uint8), offsets, lengths)
+
+    def get_rasters_by_time(self, start=None, stop=None, ranges=None, progress=True,
+                            columnar=False, workers=None):
         '''Retrieve raster data for given time ranges
 
         Returns array of dicts containing the raster data. If start and stop
@@ -82,9 +412,15 @@ class EaarlCollection:
                 will be displayed during raster reading. Specify False to
                 disable. You can also specify your own instance of tqdm.tqdm
                 (or compatible) for customizing output.
+            columnar : boolean, default False
+                If True, returns a :class:`eaarl.io.waveforms.tld.TLDArrays`
+                instead of an array of dicts.
+            workers : integer or None
+                Number of processes to use; see :meth:`get_rasters`.
         '''
         rasters = self.lookup_rasters_by_time(start, stop, ranges)
-        return self.get_rasters(rasters, progress=progress)
+        return self.get_rasters(rasters, progress=progress, columnar=columnar,
+                                workers=workers)
 
     def lookup_rasters_by_time(self, start=None, stop=None, ranges=None):
         '''Lookup raster number for given times
@@ -110,14 +446,35 @@ class EaarlCollection:
                 'lookup_rasters_by_time() requires ranges= or start= and stop='
             )
 
-        match = np.zeros(len(self._edb), dtype=bool)
-        time = self._edb['time']
-        for time_start, time_stop in time_ranges:
-            match |= ((time >= time_start) & (time <= time_stop))
+        time_ranges = _merge_ranges(time_ranges)
+
+        order, times = self._time_index()
+        first = np.searchsorted(times, time_ranges[:, 0], side='left')
+        last = np.searchsorted(times, time_ranges[:, 1], side='right')
 
-        return self._edb[match]['raster_number'].as_matrix()
+        # Expand each [first, last) span into the positions it covers
+        lengths = last - first
+        cum = np.cumsum(lengths) - lengths
+        pos = np.repeat(first - cum, lengths) + np.arange(lengths.sum())
+        rows = np.sort(order[pos])
 
-    def get_rasters(self, rasters=None, start=None, count=1, ranges=None, progress=True):
+        # Raster numbers are 1-based EDB positions
+        return rows + 1
+
+    def _time_index(self):
+        '''Returns (order, times) for the EDB sorted by time
+
+        order is the permutation that sorts the EDB by time and times is the
+        sorted time values. This is built on first use and kept.
+        '''
+        if self._time_order is None:
+            time = self._edb_column('time')
+            self._time_order = np.argsort(time, kind='mergesort')
+            self._time_sorted = time[self._time_order]
+        return self._time_order, self._time_sorted
+
+    def get_rasters(self, rasters=None, start=None, count=1, ranges=None, progress=True,
+                    columnar=False, workers=None):
         '''Retrieve raster data for raster numbers
 
         Returns array of dicts containing the raster data. If start and count
@@ -140,10 +497,173 @@ class EaarlCollection:
                 will be displayed during raster reading. Specify False to
                 disable. You can also specify your own instance of tqdm.tqdm
                 (or compatible) for customizing output.
+            columnar : boolean, default False
+                If True, returns a :class:`eaarl.io.waveforms.tld.TLDArrays`
+                instead of an array of dicts. This is much faster for large
+                numbers of rasters; see :func:`arrays_to_waveforms`.
+            workers : integer or None
+                If greater than 1, the TLD files are read and decoded in
+                parallel by up to this many processes. Results are the same as
+                for a serial read. If None or 1, files are read in this
+                process.
+        '''
+        _edb = self._select(rasters, start, count, ranges)
+
+        if self.raster_cache is not None:
+            return self._get_cached_rasters(_edb, progress, columnar, workers)
+        return self._read_rasters(_edb, progress, columnar, workers)
+
+    def iter_rasters(self, rasters=None, start=None, count=1, ranges=None,
+                     chunk_size=1000, progress=True, columnar=False,
+                     workers=None):
+        '''Retrieve raster data for raster numbers in chunks
+
+        This is a generator version of :meth:`get_rasters`. The requested
+        rasters are read chunk_size rasters at a time, in raster number order,
+        and each chunk is yielded as it is read. Only one chunk is held in
+        memory at a time, so this can process any amount of data.
+
+        Parameters
+            rasters : integer or sequence of integers or None
+                Raster numbers to retrieve
+            start : integer or None
+                Starting raster number
+            count : integer, default 1
+                Number of rasters to retrieve
+            ranges : sequence of tuples
+                Sequence of (start, count) tuples.
+            chunk_size : integer, default 1000
+                Number of rasters in each chunk
+            progress : tqdm.tqdm or boolean, default True
+                If True and if tqdm is available for import, then a progressbar
+                will be displayed for the whole iteration. Specify False to
+                disable. You can also specify your own instance of tqdm.tqdm
+                (or compatible) for customizing output.
+            columnar : boolean, default False
+                If True, each chunk is a :class:`eaarl.io.waveforms.tld.TLDArrays`
+                instead of an array of dicts.
+            workers : integer or None
+                Number of processes to use for each chunk; see
+                :meth:`get_rasters`.
+        '''
+        _edb = self._select(rasters, start, count, ranges)
+
+        bar = _progress_bar(progress, len(_edb))
+        try:
+            for first in range(0, len(_edb), chunk_size):
+                chunk = _edb.iloc[first:first+chunk_size]
+                if self.raster_cache is not None:
+                    yield self._get_cached_rasters(chunk, bar, columnar,
+                                                   workers)
+                else:
+                    yield self._read_rasters(chunk, bar, columnar, workers)
+        finally:
+            if progress is True and bar:
+                bar.close()
+
+    def _read_rasters(self, _edb, progress, columnar, workers=None):
+        '''Read the rasters for the given EDB entries from the TLD files'''
+        bar = _progress_bar(progress, len(_edb))
+
+        files = list(_runs(_edb))
+        if workers is not None and workers > 1 and len(files) > 1:
+            records = self._read_parallel(files, bar, columnar, workers)
+        else:
+            records = []
+            for file_name, runs in files:
+                records.extend(_read_file(self._tld_handle(file_name), runs,
+                                          self.read_gap, bar, columnar))
+
+        if progress is True and bar:
+            bar.close()
+
+        if columnar:
+            return tld.concat_arrays(records)
+        return [record for run in records for record in run]
+
+    def _read_parallel(self, files, progress, columnar, workers):
+        '''Read TLD files in a pool of worker processes
+
+        Each file is read and decoded by a worker, which opens the file
+        itself. Returns the same list of runs that a serial read would.
+        '''
+        import multiprocessing
+
+        tasks = [(self._tld_file_path(file_name), runs, self.read_gap,
+                  columnar) for file_name, runs in files]
+        results = [None] * len(tasks)
+
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            for idx, records in pool.imap_unordered(
+                    _read_file_task, enumerate(tasks)):
+                results[idx] = records
+                if progress:
+                    progress.update(sum(len(raster_numbers)
+                                        for _, _, raster_numbers
+                                        in tasks[idx][1]))
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return [run for records in results for run in records]
+
+    def _get_cached_rasters(self, _edb, progress, columnar, workers):
+        '''Implementation of get_rasters for a collection with a raster cache
+
+        Rasters are returned in raster number order. Values are copied into
+        and out of the cache, since callers often modify rasters in place.
+        Cache keys include the collection's identity, so a cache may be shared
+        by collections for different flights.
         '''
-        # pylint: disable=too-many-locals,too-many-branches
+        cache = self.raster_cache
+        kind = 'arrays' if columnar else 'dict'
+        raster_numbers = _edb['raster_number'].values
+
+        def key(raster):
+            '''Returns the cache key for a raster'''
+            return (self._cache_id, kind, int(raster))
+
+        found = [cache.get(key(raster)) for raster in raster_numbers]
+        missing = np.array([value is None for value in found], dtype=bool)
+        read = {}
+        if missing.any():
+            rasters = self._read_rasters(_edb[missing], progress, columnar,
+                                         workers)
+            if columnar:
+                read = dict(zip(rasters.raster['raster_number'],
+                                tld.split_arrays(rasters)))
+            else:
+                read = dict((raster['raster_number'], raster)
+                            for raster in rasters)
+
+        result = []
+        for raster, value in zip(raster_numbers, found):
+            if value is None:
+                # As when reading without a cache, records that do not decode
+                # to a raster are left out
+                value = read.get(raster)
+                if value is None:
+                    continue
+                if columnar:
+                    cache.put(key(raster), value, value.nbytes)
+                else:
+                    cache.put(key(raster), copy.deepcopy(value),
+                              _record_nbytes(value))
+            elif not columnar:
+                value = copy.deepcopy(value)
+            result.append(value)
 
-        want = np.zeros(len(self._edb), dtype='bool')
+        if columnar:
+            # concat_arrays copies, except when given a single raster
+            if len(result) == 1:
+                return result[0].copy()
+            return tld.concat_arrays(result)
+        return result
+
+    def _select(self, rasters=None, start=None, count=1, ranges=None):
+        '''Returns the EDB entries for the requested raster numbers'''
+        want = np.zeros(len(self), dtype='bool')
 
         if rasters is not None:
             rasters = np.array(rasters, dtype='int')
@@ -156,56 +676,220 @@ class EaarlCollection:
             for _start, _count in ranges:
                 want[_start-1:_start+_count-1] = True
 
-        _edb = self._edb[want]
-        if _edb.empty:
-            return []
-        _edb = _edb.reset_index(drop=True)
+        rows = np.flatnonzero(want)
+        _edb = self._edb_rows(rows)
+        _edb['record_end'] = self._record_ends(rows)
+        return _edb
+
+    def _record_ends(self, rows):
+        '''Returns the byte offset where the given EDB entries' records end
+
+        The EDB's record_length is used when available. Otherwise, a record is
+        assumed to end where the next record in the same file begins. The
+        value is -1 for the last record of a file when its length is unknown.
+        '''
+        offset = self._edb_column('record_offset')[rows].astype(np.int64)
+        try:
+            length = self._edb_column('record_length')[rows].astype(np.int64)
+        except KeyError:
+            length = np.zeros(len(rows), dtype=np.int64)
+        if np.all(length > 0):
+            return offset + length
+        return self._all_record_ends()[rows]
 
-        _edb['rank'] = (_edb['raster_number'].diff()-1).cumsum()
-        _edb['rank'].iat[0] = 0
-        _edb['rank'] = _edb['rank'].astype('int')
+    def _all_record_ends(self):
+        '''Returns the result of _record_ends for every EDB entry
 
-        bar = False
-        if progress is True:
+        This is built on first use and kept.
+        '''
+        if self._record_end is None:
+            offset = self._edb_column('record_offset').astype(np.int64)
             try:
-                from tqdm import tqdm
-            except ImportError:
-                pass
+                length = self._edb_column('record_length').astype(np.int64)
+            except KeyError:
+                length = np.zeros(len(offset), dtype=np.int64)
+
+            if self._edb_frame is None:
+                files = self._mapped_edb().file_index
             else:
-                bar = tqdm(desc='Loading rasters', unit='raster',
-                           smoothing=0.1, total=len(_edb), ncols=72)
-        elif progress:
-            bar = progress
-
-        records = []
-        for file_name, edb_by_file in _edb.groupby('file_name'):
-            with _open_tld_file(self._tld_path, file_name) as f:
-                for _, edb_run in edb_by_file.groupby('rank'):
-                    offset = edb_run['record_offset'].iat[0]
-                    records.extend(tld.read(f, offset, len(edb_run), progress=bar))
+                files = pd.factorize(self._edb_frame['file_name'])[0]
+            order = np.lexsort((offset, files))
+            next_offset = np.full(len(offset), -1, dtype=np.int64)
+            same_file = files[order[1:]] == files[order[:-1]]
+            next_offset[order[:-1][same_file]] = offset[order[1:][same_file]]
 
-        if progress is True and bar:
-            bar.close()
+            self._record_end = np.where(length > 0, offset + length,
+                                        next_offset)
+        return self._record_end
 
-        # Replace cyclic raster_number from file with raster_number defined by
-        # the EDB file
-        for raster, record in zip(_edb.raster_number, records):
-            record['raster_number'] = raster
+def _record_nbytes(record):
+    '''Returns the approximate size of a raster dict, in bytes'''
+    nbytes = 1024
+    for pulse in record['pulse']:
+        nbytes += 512 + len(pulse['tx']) + sum(len(rx) for rx in pulse['rx'])
+    return nbytes
 
-        return records
+def _merge_ranges(ranges):
+    '''Merge overlapping (start, stop) ranges
 
-@_contextmanager
-def _open_tld_file(path, tld_file):
-    '''Helper context manager wrapper for TLD files
+    Returns an array of shape (N, 2) with sorted, non-overlapping ranges that
+    cover the same values as the given ranges. Empty ranges are discarded.
+    '''
+    ranges = np.array(ranges, dtype=float).reshape(-1, 2)
+    ranges = ranges[ranges[:, 0] <= ranges[:, 1]]
+    if len(ranges) < 2:
+        return ranges
+    ranges = ranges[np.argsort(ranges[:, 0], kind='mergesort')]
+
+    # A range starts a new group if it begins after every earlier range ends
+    ends = np.maximum.accumulate(ranges[:, 1])
+    new = np.ones(len(ranges), dtype=bool)
+    new[1:] = ranges[1:, 0] > ends[:-1]
+
+    # Each group ends where the next one starts
+    starts = np.flatnonzero(new)
+    stops = np.append(starts[1:] - 1, len(ranges) - 1)
+    return np.column_stack([ranges[starts, 0], ends[stops]])
+
+def _runs(_edb):
+    '''Group EDB entries into runs of consecutive rasters
+
+    Yields (file_name, runs) for each file, where runs is a list of (offset,
+    end, raster_numbers) for each run of consecutive rasters within the file.
+    end is the byte offset where the run ends, or -1 if unknown.
+    '''
+    if _edb.empty:
+        return
+    _edb = _edb.copy()
+    _edb['rank'] = (_edb['raster_number'].diff().fillna(1)-1).cumsum()
+    _edb['rank'] = _edb['rank'].astype('int')
+
+    for file_name, edb_by_file in _edb.groupby('file_name', observed=True):
+        yield file_name, [
+            (edb_run['record_offset'].iat[0], edb_run['record_end'].iat[-1],
+             edb_run['raster_number'].values)
+            for _, edb_run in edb_by_file.groupby('rank')]
+
+def _plan_reads(runs, gap):
+    '''Combine runs of rasters into larger reads
+
+    Runs are sorted by offset and merged into a single block whenever the
+    space between them is no more than gap bytes. Returns a list of (start,
+    end, runs) for each block, where end is None if the block extends to the
+    end of the file.
+
+    Parameters
+        runs : sequence of tuples
+            Sequence of (offset, end, raster_numbers) as yielded by _runs
+        gap : integer
+            Largest number of unwanted bytes to read to combine two runs
+    '''
+    blocks = []
+    for run in sorted(runs, key=lambda run: run[0]):
+        offset, end = run[0], run[1]
+        if blocks and blocks[-1][1] >= 0 and offset - blocks[-1][1] <= gap:
+            block = blocks[-1]
+            block[1] = -1 if end < 0 else max(block[1], end)
+            block[2].append(run)
+        else:
+            blocks.append([offset, end, [run]])
+    return [(start, None if end < 0 else end, block_runs)
+            for start, end, block_runs in blocks]
+
+def _read_file(f, runs, gap, progress, columnar):
+    '''Read runs of rasters from a single TLD file
 
-    Opens the given file, handling compression as needed. Also handles
-    detection of whether the file is in an eaarl subdirectory.
+    Returns a list with the result of _read_run for each run.
+
+    Parameters
+        f : tld.MappedTLD or file object
+            The open TLD file
+        runs : sequence of tuples
+            Sequence of (offset, end, raster_numbers) as yielded by _runs
+        gap : integer
+            Largest number of unwanted bytes to read to combine two runs when
+            f is not memory mapped
+        progress : tqdm.tqdm or compatible or False
+            Progress bar to update
+        columnar : boolean
+            Whether to decode into tld.TLDArrays
+    '''
+    # Uncompressed files are read straight from their memory map
+    if isinstance(f, tld.MappedTLD):
+        return [_read_run(f, offset, raster_numbers, progress, columnar)
+                for offset, _, raster_numbers in runs]
+
+    # Otherwise, nearby runs are combined into larger reads
+    records = []
+    for start, end, block_runs in _plan_reads(runs, gap):
+        f.seek(start)
+        block = f.read() if end is None else f.read(end - start)
+        for offset, _, raster_numbers in block_runs:
+            records.append(_read_run(block, offset - start, raster_numbers,
+                                     progress, columnar, base=start))
+    return records
+
+def _read_file_task(task):
+    '''Worker process task for EaarlCollection._read_parallel
+
+    task is (index, (tld_path, runs, gap, columnar)). Returns (index,
+    records), where records is the result of _read_file.
+    '''
+    idx, (tld_path, runs, gap, columnar) = task
+    if _compression(tld_path) is None:
+        f = tld.MappedTLD(tld_path)
+    else:
+        f = indexed.open_compressed(tld_path)
+    with f:
+        return idx, _read_file(f, runs, gap, False, columnar)
+
+def _read_run(f, offset, raster_numbers, progress, columnar, base=0):
+    '''Read a run of rasters from a tld.MappedTLD or an in-memory block
+
+    The cyclic raster_number from the file is replaced with the raster_number
+    defined by the EDB file. If f is a block read from a file, base should be
+    the block's offset in the file.
+    '''
+    count = len(raster_numbers)
+    if isinstance(f, tld.MappedTLD):
+        f = f.buffer
+
+    if columnar:
+        arrays = tld.decode_arrays(f, count, offset)
+        arrays.raster['record_offset'] += base
+        arrays.raster['raster_number'] = \
+                raster_numbers[arrays.raster['record_index']]
+        if progress:
+            progress.update(count)
+        return arrays
+
+    records = tld.read_buffer(f, offset, count, progress=progress)
+    for raster, record in zip(raster_numbers, records):
+        record['raster_number'] = raster
+    return records
+
+def _progress_bar(progress, total, desc='Loading rasters', unit='raster'):
+    '''Returns a progress bar, or False, for the given progress argument'''
+    if progress is True:
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            return False
+        return tqdm(desc=desc, unit=unit, smoothing=0.1, total=total,
+                    ncols=72)
+    return progress or False
+
+def _find_tld_file(path, tld_file):
+    '''Locate a TLD file
+
+    Returns the path to the file, which may be compressed. Handles detection
+    of whether the file is in an eaarl subdirectory.
 
     Parameters
         path : string
             Path where the TLD file is expected to be found.
         tld_file : string
-            Name of the file to open.
+            Name of the file to find.
     '''
     # Select file with least amount of compression, which may result in faster
     # reads. If can't find any in same directory as EDB file, then check for an
@@ -226,13 +910,43 @@ def _open_tld_file(path, tld_file):
     else:
         raise FileNotFoundError('Unable to find ' + tld_file)
 
+    return tld_path
+
+def _compression(tld_path):
+    '''Returns 'bz2', 'gz', or None based on a TLD file's extension'''
     if tld_path[-4:] == '.bz2':
-        open_fnc = bz2.BZ2File
-    elif tld_path[-3:] == '.gz':
-        open_fnc = gzip.open
+        return 'bz2'
+    if tld_path[-3:] == '.gz':
+        return 'gz'
+    return None
+
+@_contextmanager
+def _open_tld_file(path, tld_file, cache=None):
+    '''Helper context manager wrapper for TLD files
+
+    Opens the given file, handling compression as needed. Compressed files are
+    opened through :func:`eaarl.io.waveforms.indexed.open_compressed` so that
+    seeking within them is fast. Also handles detection of whether the file is
+    in an eaarl subdirectory.
+
+    Parameters
+        path : string
+            Path where the TLD file is expected to be found.
+        tld_file : string
+            Name of the file to open.
+        cache : eaarl.io.waveforms.cache.TLDFileCache or None
+            If given, compressed files are opened from their cached
+            decompressed copies.
+    '''
+    tld_path = _find_tld_file(path, tld_file)
+    if cache is not None:
+        tld_path = cache.get(tld_path)
+
+    if _compression(tld_path) is None:
+        f = open(tld_path, 'rb')
     else:
-        open_fnc = open
-    with open_fnc(tld_path, 'rb') as f:
+        f = indexed.open_compressed(tld_path)
+    with f:
         yield f
 
 def rasters_to_pulses(rasters):
@@ -289,6 +1003,70 @@ def pulses_to_waveforms(pulses):
                 wfs.append(wf)
     return wfs
 
+def arrays_to_pulses(arrays):
+    '''Flatten raster arrays to a frame of pulses
+
+    This is the columnar counterpart to :func:`rasters_to_pulses`. The raster
+    fields are repeated for each pulse with index arithmetic rather than by
+    copying dicts.
+
+    Parameters
+        arrays : eaarl.io.waveforms.tld.TLDArrays
+            Raster data
+
+    Returns pandas.DataFrame with one row per pulse
+    '''
+    raster = arrays.raster[arrays.pulse['raster_index']]
+    pulse = arrays.pulse
+
+    columns = {}
+    for field in ['raster_number', 'digitizer', 'pulse_count']:
+        columns[field] = raster[field].astype(np.int64)
+    for field in ['bias_tx', 'waveform_count', 'thresh_rx', 'thresh_tx',
+                  'range']:
+        columns[field] = pulse[field].astype(np.int64)
+    columns['scan_angle'] = pulse['scan_angle']
+    columns['tx'] = arrays.tx
+    columns['time'] = pulse['time']
+    columns['pulse_number'] = pulse['pulse_number'].astype(np.int64)
+
+    return pd.DataFrame(columns)
+
+def arrays_to_waveforms(arrays, pulses=None):
+    '''Flatten raster arrays to a frame of waveforms
+
+    This is the columnar counterpart to :func:`pulses_to_waveforms`. Each
+    pulse's fields are repeated for each of its channels. Waveforms are not
+    copied; the tx and rx columns share the sample buffers of arrays.
+
+    Parameters
+        arrays : eaarl.io.waveforms.tld.TLDArrays
+            Raster data
+        pulses : pandas.DataFrame or None
+            Result of :func:`arrays_to_pulses` for arrays, possibly with
+            additional fields added. If None, it will be created.
+
+    Returns pandas.DataFrame with one row per waveform
+    '''
+    if pulses is None:
+        pulses = arrays_to_pulses(arrays)
+
+    channel = arrays.channel
+    # There are only four rx bias values; as with pulses_to_waveforms, any
+    # additional channels are dropped
+    keep = channel['channel'] <= 4
+    pulse_index = channel['pulse_index'][keep]
+    channels = channel['channel'][keep].astype(np.int64)
+
+    wfs = pulses.take(pulse_index)
+    wfs.reset_index(drop=True, inplace=True)
+    wfs['bias_rx'] = arrays.pulse['bias_rx'][pulse_index, channels-1].astype(
+        np.int64)
+    wfs['rx'] = arrays.rx[keep]
+    wfs['channel'] = channels
+
+    return wfs
+
 def rasters_tx_clean(rasters, pos):
     '''Cleans up the transmit waveforms
 
@@ -296,13 +1074,19 @@ def rasters_tx_clean(rasters, pos):
     the same as the first sample value in the waveform.
 
     Parameters
-        rasters : sequence of dicts
+        rasters : sequence of dicts or eaarl.io.waveforms.tld.TLDArrays
             Sequence of dicts that contain pulse entries, which in turn contain
-            tx entries
+            tx entries. If TLDArrays is given, all of its transmit waveforms
+            are updated in place at once.
         pos : integer
             1-based index into the transmit waveforms where cleaning should
-            start
+            start. Must be at least 1.
     '''
+    if pos < 1:
+        raise ValueError('pos must be at least 1')
+    if isinstance(rasters, tld.TLDArrays):
+        rasters.tx.fill_from(pos - 1)
+        return
     for raster in rasters:
         for pulse in raster['pulse']:
             pulse['tx'] = np.array(pulse['tx'])
@@ -317,10 +1101,15 @@ def rasters_wf_flip(rasters):
     have high values.
 
     Parameters
-        rasters : sequence of dicts
+        rasters : sequence of dicts or eaarl.io.waveforms.tld.TLDArrays
             Sequence of dicts that contain pulse entries, which in turn contain
-            tx and rx entries
+            tx and rx entries. If TLDArrays is given, all of its waveforms are
+            flipped in place at once.
     '''
+    if isinstance(rasters, tld.TLDArrays):
+        rasters.tx.invert()
+        rasters.rx.invert()
+        return
     for raster in rasters:
         for pulse in raster['pulse']:
             pulse['tx'] = 255 - np.array(pulse['tx'])
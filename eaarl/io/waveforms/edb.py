@@ -1,6 +1,17 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencoding=utf-8 :
-'''Handling for EDB files'''
+'''Handling for EDB files
+
+Records can be decoded either into a list of dicts, with :func:`decode` and
+:func:`read`, or into a pandas.DataFrame, with :func:`decode_frame` and
+:func:`read_frame`. Likewise, they can be encoded from a list of dicts, with
+:func:`encode` and :func:`write`, or from a table of columns, with
+:func:`encode_frame` and :func:`write_frame`. The DataFrame forms are handled
+in bulk with NumPy and are much faster for large EDB files.
+
+:class:`MappedEDB` maps an EDB file into memory without decoding it. Its fields
+are available as NumPy arrays, and a DataFrame is only built when asked for.
+'''
 
 # Boilerplate for cross-compatibility of Python 2/3
 from __future__ import unicode_literals
@@ -11,8 +22,12 @@ from future.builtins import * # pylint: disable=wildcard-import
 import future.standard_library
 future.standard_library.install_aliases()
 
+import mmap
 import struct
 
+import numpy as np
+import pandas as pd
+
 from ._types import EDBHeader, EDBRecord
 
 # pylint: disable=no-member
@@ -75,6 +90,55 @@ def decode(raw):
 
     return result
 
+def decode_frame(raw):
+    '''Decode a raw buffer into a pandas.DataFrame of EDB records
+
+    The columns are the same as the keys of the dicts returned by
+    :func:`decode`. The file_name column is a pandas.Categorical whose
+    categories are the file names listed in the EDB file, so each name is
+    stored only once.
+    '''
+    array, files = _unpack(raw)
+    return _records_frame(array, files)
+
+def _unpack(raw):
+    '''Returns (records, files) for a raw EDB buffer
+
+    records is a structured array of EDBRecord that is a view of raw, and
+    files is the list of file names.
+    '''
+    header = EDBHeader._unpack_from(raw, 0)
+    offset = EDBHeader._size
+
+    array = EDBRecord._unpack_array(raw, count=header.record_count,
+                                    offset=offset)
+    offset += EDBRecord._size * header.record_count
+
+    files = _unpack_pascal_strings(raw, offset, header.file_count)
+    return array, files
+
+def _records_frame(array, files):
+    '''Returns a DataFrame for a structured array of EDBRecord'''
+    columns = EDBRecord._ascolumns(array)
+    codes = columns.pop('file_index').astype(np.int64) - 1
+    for field in columns:
+        if columns[field].dtype.kind in 'iu':
+            columns[field] = columns[field].astype(np.int64)
+
+    columns['file_name'] = _file_names(codes, files)
+    return pd.DataFrame(columns)
+
+def _file_names(codes, files):
+    '''Returns a pandas.Categorical of files[codes]
+
+    Negative codes index from the end of files, as they would for a list. A
+    file_index of 0 thus maps to the last file, as it does in :func:`decode`.
+    '''
+    codes = np.where(codes < 0, codes + len(files), codes)
+    if len(set(files)) == len(files):
+        return pd.Categorical.from_codes(codes, files)
+    return pd.Categorical(np.array(files, dtype=object)[codes])
+
 def encode(data):
     '''Encode a sequence of EDB records into a buffer
     '''
@@ -114,6 +178,138 @@ def encode(data):
 
     return buf
 
+class MappedEDB(object):
+    '''Memory-mapped EDB file
+
+    Opening an EDB file this way only reads its header and list of file
+    names. The integer fields of the records are exposed as read-only
+    zero-copy views of the map, and time is computed on first use. Use
+    :meth:`frame` to decode records into a DataFrame.
+
+    Instances may be used as context managers.
+    '''
+    def __init__(self, filename):
+        '''Map the given file
+
+        Parameters
+            filename : string
+                Path to an EDB file
+        '''
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.records, self.files = _unpack(self._mmap)
+        self._time = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def record_offset(self):
+        '''Offset of each raster record in its TLD file'''
+        return self.records['record_offset']
+
+    @property
+    def record_length(self):
+        '''Length of each raster record'''
+        return self.records['record_length']
+
+    @property
+    def file_index(self):
+        '''1-based index into files of each record's TLD file'''
+        return self.records['file_index']
+
+    @property
+    def pulse_count(self):
+        '''Number of pulses in each raster'''
+        return self.records['pulse_count']
+
+    @property
+    def digitizer(self):
+        '''Digitizer of each raster'''
+        return self.records['digitizer']
+
+    @property
+    def time(self):
+        '''Time of each raster, in seconds of the epoch'''
+        if self._time is None:
+            self._time = EDBRecord._ascolumns(self.records)['time']
+        return self._time
+
+    @property
+    def file_name(self):
+        '''TLD file name of each record, as a pandas.Categorical'''
+        return _file_names(self.file_index.astype(np.int64) - 1, self.files)
+
+    def frame(self, rows=None):
+        '''Decode records into a pandas.DataFrame
+
+        Parameters
+            rows : array-like of int or None
+                Positions of the records to decode. If None, all records are
+                decoded.
+
+        Returns a DataFrame in the same form as :func:`decode_frame`.
+        '''
+        records = self.records if rows is None else self.records[rows]
+        return _records_frame(records, self.files)
+
+    def close(self):
+        '''Release the memory map
+
+        If views into the map are still referenced elsewhere, the map is left
+        for the garbage collector to release once they are gone.
+        '''
+        self.records = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+def encode_frame(data):
+    '''Encode a table of EDB records into a buffer
+
+    The result is identical to that of :func:`encode` for the same records.
+
+    Parameters
+        data : pandas.DataFrame, dict of arrays, or numpy structured array
+            Table with columns record_offset, record_length, file_name,
+            pulse_count, digitizer, and time, such as returned by
+            :func:`decode_frame`. file_name may be a pandas.Categorical.
+    '''
+    columns = dict((field, data[field]) for field in
+                   ['record_offset', 'record_length', 'pulse_count',
+                    'digitizer', 'time'])
+
+    # Number the files referenced in sorted order, hashing each name once
+    names = data['file_name']
+    if not hasattr(names, 'dtype'):
+        names = np.asarray(names, dtype=object)
+    codes, names = pd.factorize(names)
+    names = np.asarray(names, dtype=object)
+    order = sorted(range(len(names)), key=names.__getitem__)
+    rank = np.zeros(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    files = [names[idx] for idx in order]
+    columns['file_index'] = rank[codes] + 1
+
+    records = EDBRecord._fromcolumns(columns)
+
+    files_offset = EDBHeader._size + EDBRecord._size * len(records)
+    header = EDBHeader(files_offset, len(records), len(files))
+
+    buf = bytearray(header._pack())
+    buf += records.tobytes()
+    buf += _pack_pascal_strings(files)
+
+    return buf
+
 ####
 
 def read(f):
@@ -126,6 +322,16 @@ def read_from(filename, mode='rb'):
     with open(filename, mode) as f:
         return read(f)
 
+def read_frame(f):
+    '''Read records from an open file object into a pandas.DataFrame'''
+    raw = f.read()
+    return decode_frame(raw)
+
+def read_frame_from(filename, mode='rb'):
+    '''Read records from a file specified by name into a pandas.DataFrame'''
+    with open(filename, mode) as f:
+        return read_frame(f)
+
 def write(f, records):
     '''Write records to an open file object'''
     raw = encode(records)
@@ -135,3 +341,13 @@ def write_to(filename, records, mode='wb'):
     '''Write records to a file specified by name'''
     with open(filename, mode) as f:
         write(f, records)
+
+def write_frame(f, data):
+    '''Write a table of records to an open file object'''
+    raw = encode_frame(data)
+    f.write(raw)
+
+def write_frame_to(filename, data, mode='wb'):
+    '''Write a table of records to a file specified by name'''
+    with open(filename, mode) as f:
+        write_frame(f, data)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Random access to compressed TLD files
+
+Seeking within a gzip or bzip2 file normally requires decompressing all of the
+data that comes before the target position. For a TLD file, that means that
+fetching a raster near the end of the file costs as much as reading the whole
+file.
+
+This module instead builds an index of seek points for a compressed file. The
+index is saved beside the compressed file, with ".idx" appended to its name,
+and is reused as long as it is newer than the compressed file. With an index,
+seeking to any position only requires decompressing from the nearest seek
+point.
+
+Indexing requires the optional packages `indexed_gzip
+<https://pypi.org/project/indexed-gzip/>`_ (for .gz files) and `indexed_bzip2
+<https://pypi.org/project/indexed-bzip2/>`_ (for .bz2 files). If the relevant
+package is not installed, files are opened using the standard library and
+seeking works as before.
+
+.. data:: seek_point_spacing
+
+    Number of bytes of uncompressed data between seek points in gzip indexes.
+    Defaults to 4 MiB. Smaller values make seeks faster but the index larger;
+    each seek point stores 32 KiB. This has no effect on bzip2 files, where
+    every compressed block is a seek point.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import bz2
+import gzip
+import json
+import os
+import os.path
+import tempfile
+
+# Spacing between gzip seek points, in bytes of uncompressed data
+seek_point_spacing = 4 * 1024 * 1024 # pylint: disable=invalid-name
+
+_replace = getattr(os, 'replace', os.rename) # pylint: disable=invalid-name
+
+def index_path(path):
+    '''Returns the path of the seek-point index for a compressed file'''
+    return path + '.idx'
+
+def open_compressed(path):
+    '''Open a compressed TLD file for reading, with fast seeking if possible
+
+    If a current index exists for the file, it is used. Otherwise, a new index
+    is built and saved, if possible. The index can only be saved if the
+    directory is writable; otherwise, it is only used by the returned file.
+
+    Parameters
+        path : string
+            Path to a file ending in .gz or .bz2
+
+    Returns a readable, seekable file object.
+    '''
+    if path[-3:] == '.gz':
+        return _open_gzip(path)
+    if path[-4:] == '.bz2':
+        return _open_bzip2(path)
+    raise ValueError('unsupported compression for ' + path)
+
+def _index_current(path):
+    '''Returns True if the file has an index that is newer than it'''
+    idx = index_path(path)
+    try:
+        return os.path.getmtime(idx) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+def _save_index(path, write):
+    '''Save an index for path using the given write(filename) function
+
+    The index is written to a temporary file first so that readers never see a
+    partial index. Failure to save is not an error.
+    '''
+    idx = index_path(path)
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(idx) or '.',
+                                   prefix='.tmp-', suffix='.idx')
+    except OSError:
+        return
+    try:
+        os.close(fd)
+        write(tmp)
+        _replace(tmp, idx)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def _open_gzip(path):
+    '''Open a gzip file using indexed_gzip, if available'''
+    try:
+        import indexed_gzip
+    except ImportError:
+        return gzip.open(path, 'rb')
+
+    if _index_current(path):
+        try:
+            return indexed_gzip.IndexedGzipFile(
+                path, index_file=index_path(path))
+        except (indexed_gzip.ZranError, OSError, ValueError):
+            pass
+
+    f = indexed_gzip.IndexedGzipFile(path, spacing=seek_point_spacing)
+    f.build_full_index()
+    _save_index(path, f.export_index)
+    f.seek(0)
+    return f
+
+def _open_bzip2(path):
+    '''Open a bzip2 file using indexed_bzip2, if available'''
+    try:
+        import indexed_bzip2
+    except ImportError:
+        return bz2.BZ2File(path, 'rb')
+
+    f = indexed_bzip2.open(path)
+
+    if _index_current(path):
+        try:
+            with open(index_path(path), 'r') as idx:
+                offsets = json.load(idx)['block_offsets']
+            f.set_block_offsets(dict((int(bit), int(byte))
+                                     for bit, byte in offsets))
+            return f
+        except (KeyError, TypeError, ValueError, OSError):
+            f.close()
+            f = indexed_bzip2.open(path)
+
+    # Scans the whole file for block boundaries
+    offsets = sorted(f.block_offsets().items())
+
+    def write(filename):
+        '''Write the block offsets as JSON'''
+        with open(filename, 'w') as idx:
+            json.dump({'block_offsets': offsets}, idx)
+    _save_index(path, write)
+    f.seek(0)
+
+    return f
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Sidecar indexes of the pulses in TLD files
+
+An EDB file only locates raster records. Reading a single pulse or waveform
+through it still requires reading and decoding its whole raster. A pulse index
+additionally records the byte offset and length of every pulse and waveform in
+a TLD file, so that individual pulses and waveforms can be read directly.
+
+A pulse index is built from a full pass over a TLD file the first time it is
+needed. It is then saved beside the TLD file, with ".pidx.npz" appended to its
+name, and is reused as long as it is newer than the TLD file. If the index
+cannot be saved, it is only kept in memory.
+
+Pulse indexes are used by
+:meth:`eaarl.io.waveforms.EaarlCollection.get_pulses` and
+:meth:`eaarl.io.waveforms.EaarlCollection.get_waveforms`.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+
+from . import tld
+
+_replace = getattr(os, 'replace', os.rename) # pylint: disable=invalid-name
+
+def index_path(tld_path):
+    '''Returns the path of the pulse index for a TLD file'''
+    return tld_path + '.pidx.npz'
+
+class PulseIndex:
+    '''Index of the pulses and waveforms in a TLD file
+
+    Attributes
+        pulses : numpy.ndarray of tld.PULSE_INDEX_DTYPE
+            One entry per pulse, ordered by record_offset and pulse_number
+        waveforms : numpy.ndarray of tld.WAVEFORM_INDEX_DTYPE
+            One entry per return waveform
+    '''
+    def __init__(self, pulses, waveforms):
+        self.pulses = pulses
+        self.waveforms = waveforms
+        self._keys = _pulse_keys(pulses['record_offset'],
+                                 pulses['pulse_number'])
+
+    @classmethod
+    def build(cls, raw):
+        '''Build the index for a buffer holding an entire TLD file'''
+        return cls(*tld.index_pulses(raw))
+
+    @classmethod
+    def load(cls, tld_path):
+        '''Load the saved index for a TLD file
+
+        Returns None if there is no index or if it is older than the file.
+        '''
+        path = index_path(tld_path)
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(tld_path):
+                return None
+            with np.load(path) as data:
+                pulses = data['pulses'].astype(tld.PULSE_INDEX_DTYPE)
+                waveforms = data['waveforms'].astype(tld.WAVEFORM_INDEX_DTYPE)
+        except (OSError, IOError, KeyError, ValueError, TypeError):
+            return None
+        return cls(pulses, waveforms)
+
+    @classmethod
+    def open(cls, tld_path, read):
+        '''Load the index for a TLD file, building and saving it if needed
+
+        Parameters
+            tld_path : string
+                Path to the TLD file
+            read : callable
+                Function that takes no arguments and returns the entire
+                contents of the TLD file, uncompressed. This is only called if
+                the index must be built.
+        '''
+        index = cls.load(tld_path)
+        if index is None:
+            index = cls.build(read())
+            index.save(tld_path)
+        return index
+
+    def save(self, tld_path):
+        '''Save the index beside a TLD file
+
+        The index is written to a temporary file first so that readers never
+        see a partial index. Failure to save is not an error.
+        '''
+        path = index_path(tld_path)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                       prefix='.tmp-', suffix='.npz')
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, pulses=self.pulses, waveforms=self.waveforms)
+            _replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def find_pulses(self, record_offsets, pulse_numbers):
+        '''Returns the positions in pulses of the given pulses
+
+        Parameters
+            record_offsets : array-like of int
+                Offset of each pulse's raster record
+            pulse_numbers : array-like of int
+                1-based number of each pulse within its raster
+
+        Raises KeyError if any pulse is not in the index.
+        '''
+        keys = _pulse_keys(record_offsets, pulse_numbers)
+        pos = np.searchsorted(self._keys, keys)
+        pos = np.minimum(pos, len(self._keys) - 1)
+        if len(keys) and (not len(self._keys) or
+                          np.any(self._keys[pos] != keys)):
+            raise KeyError('pulse not found in TLD file')
+        return pos
+
+    def find_waveforms(self, rows, channels):
+        '''Returns (offsets, lengths) of waveforms of the given pulses
+
+        Parameters
+            rows : array-like of int
+                Positions in pulses, as returned by :meth:`find_pulses`
+            channels : array-like of int
+                Channel of each waveform. Channel 0 is the transmit waveform
+                and channels 1 and up are the return waveforms.
+
+        Raises KeyError if a pulse does not have the requested channel.
+        '''
+        pulses = self.pulses[np.asarray(rows, dtype=np.int64)]
+        channels = np.asarray(channels, dtype=np.int64)
+        if np.any((channels < 0) | (channels > pulses['waveform_count'])):
+            raise KeyError('channel not found in pulse')
+
+        is_rx = channels > 0
+        rx = self.waveforms[pulses['waveform_index'][is_rx] +
+                            channels[is_rx] - 1]
+        offsets = pulses['tx_offset'].copy()
+        lengths = pulses['tx_length'].copy()
+        offsets[is_rx] = rx['offset']
+        lengths[is_rx] = rx['length']
+        return offsets, lengths
+
+def _pulse_keys(record_offsets, pulse_numbers):
+    '''Combine record offsets and pulse numbers into sortable int64 keys'''
+    return (np.asarray(record_offsets, dtype=np.int64) << 16 |
+            np.asarray(pulse_numbers, dtype=np.int64))
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Compact storage for variable-length waveforms
+
+A flight contains tens of millions of waveforms. Storing each one as its own
+Python list or NumPy array costs far more memory and time than the samples
+themselves. :class:`RaggedArray` instead stores all of the samples in a single
+contiguous uint8 buffer along with an offset and length for each waveform.
+
+RaggedArray is a pandas extension array, so it can be used directly as a
+DataFrame column. Indexing a single element returns a read-only int64 array
+of that waveform's samples, so code that handles one waveform at a time
+continues to work and can do arithmetic on it without wrapping around.
+Changes to the samples have to go through the batch methods. Code that handles whole batches can use :attr:`RaggedArray.buffer`,
+:attr:`RaggedArray.offsets`, and :attr:`RaggedArray.lengths` directly, or
+:meth:`RaggedArray.padded` for a 2-D view.
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import numbers
+
+import numpy as np
+from pandas.api.extensions import ExtensionArray, ExtensionDtype
+from pandas.api.extensions import register_extension_dtype
+
+@register_extension_dtype
+class RaggedDtype(ExtensionDtype):
+    '''pandas dtype for :class:`RaggedArray`'''
+    name = 'ragged[uint8]'
+    type = np.ndarray
+    kind = 'O'
+    na_value = None
+
+    @classmethod
+    def construct_array_type(cls):
+        '''Returns the array type associated with this dtype'''
+        return RaggedArray
+
+class RaggedArray(ExtensionArray):
+    '''Array of variable-length uint8 waveforms
+
+    Element i consists of the samples buffer[offsets[i]:offsets[i]+lengths[i]].
+    Offsets need not be increasing and elements may overlap, which allows
+    subsets to be taken without copying any samples. Missing elements have a
+    length of -1.
+    '''
+    # pylint: disable=abstract-method
+
+    def __init__(self, buffer, offsets, lengths):
+        '''Create a RaggedArray from its components
+
+        Parameters
+            buffer : array-like of uint8
+                Sample values
+            offsets : array-like of int
+                Offset into buffer for the start of each element
+            lengths : array-like of int
+                Number of samples in each element
+        '''
+        self.buffer = np.asarray(buffer, dtype=np.uint8)
+        if self.buffer.ndim != 1:
+            self.buffer = self.buffer.ravel()
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        if self.offsets.shape != self.lengths.shape:
+            raise ValueError('offsets and lengths must have the same shape')
+
+    @classmethod
+    def from_sequence(cls, waveforms):
+        '''Create a RaggedArray from a sequence of waveforms
+
+        Parameters
+            waveforms : sequence of array-like
+                Each entry is a sequence of sample values, or None for a
+                missing entry.
+        '''
+        lengths = np.array([-1 if wf is None else len(wf) for wf in waveforms],
+                           dtype=np.int64)
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(np.maximum(lengths, 0)[:-1], out=offsets[1:])
+        parts = [np.asarray(wf, dtype=np.uint8)
+                 for wf in waveforms if wf is not None and len(wf)]
+        if parts:
+            buffer = np.concatenate(parts)
+        else:
+            buffer = np.zeros(0, dtype=np.uint8)
+        return cls(buffer, offsets, lengths)
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        # pylint: disable=unused-argument
+        if isinstance(scalars, RaggedArray):
+            return scalars.copy() if copy else scalars
+        return cls.from_sequence(list(scalars))
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls.from_sequence(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        to_concat = list(to_concat)
+        bases = np.cumsum([0] + [len(arr.buffer) for arr in to_concat[:-1]])
+        return cls(
+            np.concatenate([arr.buffer for arr in to_concat]),
+            np.concatenate([arr.offsets + base
+                            for arr, base in zip(to_concat, bases)]),
+            np.concatenate([arr.lengths for arr in to_concat]))
+
+    @property
+    def dtype(self):
+        return RaggedDtype()
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + self.offsets.nbytes + self.lengths.nbytes
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, item):
+        if isinstance(item, numbers.Integral):
+            length = self.lengths[item]
+            if length < 0:
+                return None
+            offset = self.offsets[item]
+            # A copy, since the buffer is uint8 and shared with other arrays
+            result = self.buffer[offset:offset+length].astype(np.int64)
+            result.setflags(write=False)
+            return result
+        if isinstance(item, tuple) and len(item) == 1:
+            item = item[0]
+        return RaggedArray(self.buffer, self.offsets[item], self.lengths[item])
+
+    def __setitem__(self, key, value):
+        raise TypeError('RaggedArray does not support item assignment')
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __array__(self, dtype=None, copy=None):
+        # pylint: disable=unused-argument
+        result = np.empty(len(self), dtype=object)
+        for idx in range(len(self)):
+            result[idx] = self[idx]
+        return result
+
+    def __eq__(self, other):
+        if isinstance(other, RaggedArray):
+            if len(other) != len(self):
+                raise ValueError('lengths must match to compare')
+            return np.array([
+                a is not None and b is not None and np.array_equal(a, b)
+                for a, b in zip(self, other)], dtype=bool)
+        return NotImplemented
+
+    def isna(self):
+        return self.lengths < 0
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        indices = np.asarray(indices, dtype=np.int64)
+        if allow_fill:
+            if fill_value is not None:
+                raise ValueError('RaggedArray only supports None as fill value')
+            if np.any(indices < -1):
+                raise ValueError('invalid value in indices')
+            missing = indices == -1
+            offsets = self.offsets.take(indices, mode='clip')
+            lengths = self.lengths.take(indices, mode='clip')
+            if len(self) == 0:
+                offsets = np.zeros(len(indices), dtype=np.int64)
+                lengths = np.zeros(len(indices), dtype=np.int64)
+            lengths[missing] = -1
+            return RaggedArray(self.buffer, offsets, lengths)
+        return RaggedArray(self.buffer, self.offsets.take(indices),
+                           self.lengths.take(indices))
+
+    def copy(self):
+        return RaggedArray(self.buffer.copy(), self.offsets.copy(),
+                           self.lengths.copy())
+
+    def compact(self):
+        '''Returns a copy whose buffer contains exactly its own samples
+
+        The returned array's buffer holds the elements back to back, in order.
+        This is useful to release a large buffer after taking a small subset.
+        '''
+        lengths = np.maximum(self.lengths, 0)
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        idx = _sample_index(self.offsets, lengths)
+        return RaggedArray(self.buffer[idx], offsets, self.lengths.copy())
+
+    def invert(self):
+        '''Replaces each sample value v with 255 - v, in place
+
+        Only the samples of this array's elements are inverted, so other
+        arrays sharing the buffer keep their other samples. Each sample is
+        inverted exactly once, even where elements share samples.
+        '''
+        present = self.lengths > 0
+        starts = self.offsets[present]
+        ends = starts + self.lengths[present]
+        # Elements laid back to back over the whole buffer, as after compact,
+        # are inverted in a single pass
+        if (len(starts) and starts[0] == 0 and ends[-1] == len(self.buffer)
+                and np.array_equal(starts[1:], ends[:-1])):
+            np.subtract(255, self.buffer, out=self.buffer)
+            return
+        # Otherwise, count the elements covering each sample of the buffer
+        size = len(self.buffer) + 1
+        cover = np.cumsum(np.bincount(starts, minlength=size) -
+                          np.bincount(ends, minlength=size))[:-1]
+        np.subtract(255, self.buffer, out=self.buffer, where=cover > 0)
+
+    def fill_from(self, pos):
+        '''Sets the samples of each element from pos onward, in place
+
+        Samples at 0-based position pos and later in each element are set to
+        the element's first sample. Elements that share samples should not be
+        passed, since their samples would be filled more than once.
+
+        Parameters
+            pos : integer
+                0-based position of the first sample to set. Must not be
+                negative.
+        '''
+        _fill_from(self.buffer, self.offsets, self.lengths, pos)
+
+    def padded(self, width=None, fill=0):
+        '''Returns the waveforms as a 2-D array
+
+        Each row holds the first width samples of the corresponding waveform.
+        Waveforms with fewer than width samples are padded with fill. This is
+        the fast way to work with fixed-length windows of the waveforms, such
+        as the first dozen samples of each.
+
+        Parameters
+            width : integer or None
+                Number of columns. If None, the length of the longest waveform
+                is used.
+            fill : integer, default 0
+                Value to use for padding
+        '''
+        lengths = np.maximum(self.lengths, 0)
+        if width is None:
+            width = int(lengths.max()) if len(lengths) else 0
+        if width == 0 or len(self) == 0:
+            return np.full((len(self), width), fill, dtype=np.uint8)
+
+        buffer = self.buffer
+        if len(buffer) < width or self.offsets.max() > len(buffer) - width:
+            buffer = np.concatenate([buffer, np.zeros(width, dtype=np.uint8)])
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, width)
+        result = windows[self.offsets]
+        result[np.arange(width) >= lengths[:, np.newaxis]] = fill
+        return result
+
+def _sample_index(offsets, lengths):
+    '''Returns the buffer index of every sample of every element, in order
+
+    lengths must not be negative.
+    '''
+    cum = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=cum[1:])
+    idx = np.repeat(offsets - cum, lengths)
+    idx += np.arange(len(idx))
+    return idx
+
+def _fill_from(buffer, offsets, lengths, pos):
+    '''Implementation of RaggedArray.fill_from for a buffer of any dtype'''
+    # A negative position would reach into the preceding element's samples
+    if pos < 0:
+        raise ValueError('pos must not be negative')
+    fill = np.maximum(np.maximum(lengths, 0) - pos, 0)
+    total = fill.sum()
+    if not total:
+        return
+    filled = fill > 0
+    # Index of every sample to set, grouped by element
+    cum = np.cumsum(fill) - fill
+    idx = np.repeat(offsets + pos - cum, fill) + np.arange(total)
+    buffer[idx] = np.repeat(buffer[offsets[filled]], fill[filled])
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# vim: set fileencoding=utf-8 :
+'''Rebuilding EDB files from TLD files
+
+An EDB file is an index of the raster records in a mission's TLD files. If the
+EDB file is missing or damaged, it can be rebuilt from the TLD files
+themselves, since every raster record begins with a header holding the
+information the EDB needs. Only those headers are read, so rebuilding an index
+is far faster than decoding the data.
+
+To rebuild the EDB file for a mission::
+
+    rebuild_edb('/data/mission/eaarl', '/data/mission/eaarl/mission.idx')
+
+Or, to use the TLD files without writing an EDB file::
+
+    edb_data = build_edb('/data/mission/eaarl')
+    collection = EaarlCollection(edb_data=edb_data,
+                                 tld_path='/data/mission/eaarl')
+'''
+
+# Boilerplate for cross-compatibility of Python 2/3
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future.builtins import * # pylint: disable=wildcard-import
+import future.standard_library
+future.standard_library.install_aliases()
+
+import bz2
+import gzip
+import os
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from . import edb
+from . import tld
+from .collection import _progress_bar
+
+# Extensions of TLD files, in order of preference
+_EXTENSIONS = ['.tld', '.tld.gz', '.tld.bz2']
+
+def find_tld_files(path):
+    '''Find the TLD files in a directory
+
+    Files named *.tld, *.tld.gz, and *.tld.bz2 are found. If a file is present
+    in more than one form, the least compressed is used. If there are no TLD
+    files in path but there is an eaarl subdirectory, it is searched instead,
+    matching how :class:`eaarl.io.waveforms.EaarlCollection` locates files.
+
+    Parameters
+        path : string
+            Directory to search
+
+    Returns a list of (file_name, tld_path), sorted by file_name. file_name
+    is the name to record in the EDB, without any compression extension.
+    '''
+    for directory in [path, os.path.join(path, 'eaarl')]:
+        if not os.path.isdir(directory):
+            continue
+        found = {}
+        for name in os.listdir(directory):
+            for rank, ext in enumerate(_EXTENSIONS):
+                if name.lower().endswith(ext):
+                    file_name = name[:len(name) - len(ext) + len('.tld')]
+                    if file_name not in found or rank < found[file_name][0]:
+                        found[file_name] = (rank, os.path.join(directory, name))
+                    break
+        if found:
+            return [(file_name, found[file_name][1])
+                    for file_name in sorted(found)]
+    return []
+
+def scan_tld_file(tld_path):
+    '''Read the EDB records for a single TLD file
+
+    Parameters
+        tld_path : string
+            Path to a TLD file, which may be compressed
+
+    Returns a dict of arrays as returned by
+    :func:`eaarl.io.waveforms.tld.read_headers`.
+
+    Compressed files are read straight through once. No seek index is built
+    for them, so nothing is written beside the TLD files.
+    '''
+    if tld_path[-3:] == '.gz':
+        opener = gzip.open
+    elif tld_path[-4:] == '.bz2':
+        opener = bz2.BZ2File
+    else:
+        opener = None
+    if opener is not None:
+        with opener(tld_path, 'rb') as f:
+            return tld.read_headers(f)
+    with open(tld_path, 'rb') as f:
+        return tld.read_headers(f, size=os.path.getsize(tld_path))
+
+def build_edb(path, workers=None, progress=True):
+    '''Build EDB records from the TLD files in a directory
+
+    Parameters
+        path : string
+            Directory containing the TLD files
+        workers : integer or None
+            If greater than 1, files are scanned in parallel by up to this many
+            processes.
+        progress : tqdm.tqdm or boolean, default True
+            If True and if tqdm is available for import, then a progressbar
+            will be displayed while scanning files. Specify False to disable.
+            You can also specify your own instance of tqdm.tqdm (or
+            compatible) for customizing output.
+
+    Returns a pandas.DataFrame of EDB records in the form returned by
+    :func:`eaarl.io.waveforms.edb.decode_frame`, ordered by file name and then
+    by offset within each file.
+    '''
+    files = find_tld_files(path)
+    paths = [tld_path for _, tld_path in files]
+
+    bar = _progress_bar(progress, len(files), desc='Scanning TLD files',
+                        unit='file')
+
+    if workers is not None and workers > 1 and len(files) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(files)))
+        try:
+            scans = []
+            for scan in pool.imap(scan_tld_file, paths):
+                scans.append(scan)
+                if bar:
+                    bar.update()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        scans = []
+        for tld_path in paths:
+            scans.append(scan_tld_file(tld_path))
+            if bar:
+                bar.update()
+
+    if progress is True and bar:
+        bar.close()
+
+    counts = [len(scan['record_offset']) for scan in scans]
+    codes = np.repeat(np.arange(len(files)), counts)
+
+    def column(field):
+        '''Concatenate a field across files'''
+        if not scans:
+            return np.zeros(0)
+        return np.concatenate([scan[field] for scan in scans])
+
+    frame = pd.DataFrame({
+        'record_offset': column('record_offset').astype(np.int64),
+        'record_length': column('record_length').astype(np.int64),
+        'pulse_count': column('pulse_count').astype(np.int64),
+        'digitizer': column('digitizer').astype(np.int64),
+        'time': column('time').astype(np.double),
+        'file_name': pd.Categorical.from_codes(
+            codes, [file_name for file_name, _ in files]),
+    })
+    return frame
+
+def rebuild_edb(path, edb_file, workers=None, progress=True):
+    '''Write an EDB file for the TLD files in a directory
+
+    Parameters
+        path : string
+            Directory containing the TLD files
+        edb_file : string
+            Path of the EDB file to write
+        workers : integer or None
+            If greater than 1, files are scanned in parallel by up to this many
+            processes.
+        progress : tqdm.tqdm or boolean, default True
+            Progress bar setting; see :func:`build_edb`.
+
+    Returns the records written, as returned by :func:`build_edb`.
+    '''
+    frame = build_edb(path, workers=workers, progress=progress)
+    edb.write_frame_to(edb_file, frame)
+    return frame
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencoding=utf-8 :
 # pylint: disable = no-member
-'''Handling for TLD data'''
+'''Handling for TLD data
+
+TLD data can be decoded in two ways. :func:`read` returns a list of raster
+dicts that each contain a list of pulse dicts; this is convenient for
+exploring individual records. :func:`read_arrays` and :func:`decode_arrays`
+instead return a :class:`TLDArrays` of structured NumPy arrays, which is much
+faster for large amounts of data.
+'''
 
 # Boilerplate for cross-compatibility of Python 2/3
 from __future__ import unicode_literals
@@ -12,10 +19,96 @@ from future.builtins import * # pylint: disable=wildcard-import
 import future.standard_library
 future.standard_library.install_aliases()
 
+from collections import namedtuple
 import copy
+import mmap
 import struct
 
+import numpy as np
+
 from ._types import TLDRecordHeader, TLDRasterHeader, TLDPulseHeader
+from .ragged import RaggedArray
+
+#: Data type for the raster array in :class:`TLDArrays`
+RASTER_DTYPE = np.dtype([
+    ('record_index', '<i8'),
+    ('record_offset', '<i8'),
+    ('time', '<f8'),
+    ('raster_number', '<u4'),
+    ('digitizer', 'u1'),
+    ('pulse_count', '<u2'),
+])
+
+#: Data type for the pulse array in :class:`TLDArrays`
+PULSE_DTYPE = np.dtype([
+    ('raster_index', '<i8'),
+    ('pulse_number', '<u2'),
+    ('time', '<f8'),
+    ('waveform_count', 'u1'),
+    ('bias_tx', 'u1'),
+    ('bias_rx', 'u1', (4,)),
+    ('scan_angle', '<f8'),
+    ('range', '<u2'),
+    ('thresh_rx', 'u1'),
+    ('thresh_tx', 'u1'),
+])
+
+#: Data type for the channel array in :class:`TLDArrays`
+CHANNEL_DTYPE = np.dtype([
+    ('pulse_index', '<i8'),
+    ('channel', 'u1'),
+])
+
+#: Data type for the pulse entries of a pulse index; see :func:`index_pulses`
+PULSE_INDEX_DTYPE = np.dtype([
+    ('record_offset', '<i8'),
+    ('pulse_number', '<u2'),
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    ('tx_offset', '<i8'),
+    ('tx_length', '<i8'),
+    ('waveform_index', '<i8'),
+    ('waveform_count', 'u1'),
+])
+
+#: Data type for the waveform entries of a pulse index; see
+#: :func:`index_pulses`
+WAVEFORM_INDEX_DTYPE = np.dtype([
+    ('offset', '<i8'),
+    ('length', '<i8'),
+])
+
+class TLDArrays(namedtuple('TLDArrays', ['raster', 'pulse', 'channel', 'tx', 'rx'])):
+    '''Columnar representation of TLD raster records
+
+    Attributes
+        raster : numpy.ndarray of RASTER_DTYPE
+            One entry per raster record. record_index is the 0-based position
+            of the record among the records that were decoded and
+            record_offset is its byte offset in the file.
+        pulse : numpy.ndarray of PULSE_DTYPE
+            One entry per pulse, ordered by raster and then by pulse.
+            raster_index is the 0-based index into raster.
+        channel : numpy.ndarray of CHANNEL_DTYPE
+            One entry per return waveform, ordered by pulse and then by
+            channel. pulse_index is the 0-based index into pulse.
+        tx : eaarl.io.waveforms.ragged.RaggedArray
+            Transmit waveforms, one per entry in pulse
+        rx : eaarl.io.waveforms.ragged.RaggedArray
+            Return waveforms, one per entry in channel
+    '''
+    __slots__ = ()
+
+    @property
+    def nbytes(self):
+        '''Total size of the arrays, in bytes'''
+        return (self.raster.nbytes + self.pulse.nbytes + self.channel.nbytes +
+                self.tx.nbytes + self.rx.nbytes)
+
+    def copy(self):
+        '''Returns a copy that shares no data with this one'''
+        return TLDArrays(self.raster.copy(), self.pulse.copy(),
+                         self.channel.copy(), self.tx.copy(), self.rx.copy())
 
 def read(f, offset, count, progress=None):
     '''Read records from file
@@ -40,6 +133,104 @@ def read(f, offset, count, progress=None):
             progress.update()
     return records
 
+def read_headers(f, size=None):
+    '''Read the header of every raster record in a file
+
+    Only the record header and raster header of each record are read; the
+    pulse data is skipped. This is much faster than decoding the records and
+    is intended for building an EDB index from TLD files. Scanning stops at
+    the first record that is truncated or has an invalid length.
+
+    Parameters
+        f : filehandle
+            Open readable filehandle, positioned at the start of the data
+        size : integer or None
+            Size of the file, in bytes. If given, payloads are skipped with
+            seek() and records extending past size are treated as truncated.
+            If None, payloads are skipped by reading them, which is required
+            for files that cannot seek forward cheaply or whose size is
+            unknown, such as compressed files.
+
+    Returns a dict of arrays with record_offset, record_length, time,
+    raster_number, digitizer, and pulse_count for each raster record.
+    '''
+    offset = 0
+    offsets = []
+    lengths = []
+    headers = bytearray()
+    while True:
+        raw = f.read(TLDRecordHeader._size)
+        if len(raw) < TLDRecordHeader._size:
+            break
+        header = TLDRecordHeader._unpack(raw)._asdict()
+        length = header['record_length']
+        if length < TLDRecordHeader._size:
+            break
+        data_length = length - TLDRecordHeader._size
+
+        is_raster = (header['record_type'] == 5 and
+                     data_length >= TLDRasterHeader._size)
+        raster = f.read(TLDRasterHeader._size) if is_raster else b''
+
+        if size is not None:
+            if offset + length > size:
+                break
+            f.seek(offset + length)
+        else:
+            skip = data_length - len(raster)
+            if len(raster) + len(f.read(skip)) < data_length:
+                break
+
+        if is_raster:
+            offsets.append(offset)
+            lengths.append(length)
+            headers += raster
+        offset += length
+
+    cols = TLDRasterHeader._ascolumns(TLDRasterHeader._unpack_array(
+        bytes(headers)))
+    result = {
+        'record_offset': np.array(offsets, dtype=np.int64),
+        'record_length': np.array(lengths, dtype=np.int64),
+    }
+    for field in ['time', 'raster_number', 'digitizer', 'pulse_count']:
+        result[field] = cols[field]
+    return result
+
+def read_buffer(buf, offset, count, progress=None, views=False):
+    '''Read records from a buffer
+
+    This is equivalent to :func:`read` but works directly on a bytes-like
+    object, such as a memory map, without copying the record data.
+
+    Parameters
+        buf : bytes-like object
+            Buffer containing TLD records
+        offset : int
+            Offset into buffer to start reading at
+        count : int
+            Number of records to read
+        progress : tqdm.tqdm or compatible or None or False
+            If provided, then progress.update() will be called after each
+            raster is loaded.
+        views : bool, default False
+            If True, the tx and rx waveforms are returned as read-only
+            numpy.ndarray views of buf instead of lists of integers.
+    '''
+    buf = memoryview(buf)
+    records = []
+    for _ in range(count):
+        header = TLDRecordHeader._unpack_from(buf, offset)._asdict()
+        start = offset + TLDRecordHeader._size
+        offset += header['record_length']
+        if header['record_type'] != 5:
+            records.append(None)
+        else:
+            records.append(_decode_record(buf[start:offset], views))
+        if progress:
+            progress.update()
+    return records
+
 def _read_record(f):
     '''Read and return a raster record'''
     raw = f.read(TLDRecordHeader._size)
@@ -50,18 +241,22 @@ def _read_record(f):
     if record_header['record_type'] != 5:
         return None
 
+    return _decode_record(raw)
+
+def _decode_record(raw, views=False):
+    '''Decode and return a raster record from its data'''
     raster = TLDRasterHeader._unpack_from(raw, 0)._asdict()
     raster['pulse'] = []
     offset = TLDRasterHeader._size
     for _ in range(raster['pulse_count']):
-        pulse, offset = _read_pulse(raw, offset)
+        pulse, offset = _read_pulse(raw, offset, views)
         pulse['time'] = raster['time'] + pulse['time_offset']
         del pulse['time_offset']
         raster['pulse'].append(pulse)
 
     return raster
 
-def _read_pulse(raw, offset):
+def _read_pulse(raw, offset, views=False):
     '''read and return a pulse record'''
     pulse = TLDPulseHeader._unpack_from(raw, offset)._asdict()
     offset += TLDPulseHeader._size
@@ -69,31 +264,399 @@ def _read_pulse(raw, offset):
     data_length = struct.unpack_from('<H', raw, offset)[0]
     offset += 2
 
-    _read_waveforms(raw[offset:offset+data_length], pulse)
+    _read_waveforms(raw[offset:offset+data_length], pulse, views)
     offset += data_length
 
     return (pulse, offset)
 
-def _read_waveforms(raw, pulse):
+def _read_waveforms(raw, pulse, views=False):
     '''Read and return a set of waveforms'''
+    wf = _wf_view if views else _wf
     offset = 0
 
     length = struct.unpack_from('<B', raw, offset)[0]
     offset += 1
-    pulse['tx'] = _wf(raw[offset:offset+length])
+    pulse['tx'] = wf(raw[offset:offset+length])
     offset += length
 
     pulse['rx'] = []
     for _ in range(pulse['waveform_count']):
         length = struct.unpack_from('<H', raw, offset)[0]
         offset += 2
-        pulse['rx'].append(_wf(raw[offset:offset+length]))
+        pulse['rx'].append(wf(raw[offset:offset+length]))
         offset += length
 
 def _wf(raw):
     '''Converts a buffer into an integer sequence'''
     return [_ for _ in bytes(raw)]
 
+def _wf_view(raw):
+    '''Wraps a buffer as a uint8 array without copying'''
+    return np.frombuffer(raw, dtype=np.uint8)
+
+class MappedTLD(object):
+    '''Memory-mapped TLD file
+
+    Provides read-only access to an uncompressed TLD file through mmap.
+    Records are decoded straight from the mapped pages, so reading a record
+    requires no system calls and no intermediate copies. Waveforms can also be
+    retrieved as views into the map.
+
+    Instances may be used as context managers.
+    '''
+    def __init__(self, filename):
+        '''Map the given file
+
+        Parameters
+            filename : string
+                Path to an uncompressed TLD file
+        '''
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._mmap = None
+        self.buffer = memoryview(self._mmap if self._mmap is not None else b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def array(self):
+        '''Contents of the file as a read-only numpy.ndarray of uint8'''
+        return np.frombuffer(self.buffer, dtype=np.uint8)
+
+    def read(self, offset, count, progress=None, views=False):
+        '''Read records from the file
+
+        Equivalent to :func:`read_buffer` on the mapped file.
+        '''
+        return read_buffer(self.buffer, offset, count, progress=progress,
+                           views=views)
+
+    def read_arrays(self, offset, count, progress=None):
+        '''Read records from the file into a :class:`TLDArrays`
+
+        Equivalent to :func:`read_arrays`, but decodes straight from the
+        mapped file.
+        '''
+        arrays = decode_arrays(self.buffer, count, offset)
+        if progress:
+            progress.update(count)
+        return arrays
+
+    def close(self):
+        '''Release the memory map
+
+        If views into the map are still referenced elsewhere, the map is left
+        for the garbage collector to release once they are gone.
+        '''
+        try:
+            self.buffer.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass
+        self._mmap = None
+
+def read_arrays(f, offset, count, progress=None):
+    '''Read records from file into a :class:`TLDArrays`
+
+    This is the columnar counterpart to :func:`read`.
+
+    Parameters
+        f : filehandle
+            Open readable filehandle
+        offset : int
+            Offset into file to start reading at
+        count : int
+            Number of records to read
+        progress : tqdm.tqdm or compatible or None or False
+            If provided, then progress.update() will be called once the
+            records are loaded.
+    '''
+    f.seek(offset)
+    raw = bytearray()
+    for _ in range(count):
+        header = f.read(TLDRecordHeader._size)
+        length = TLDRecordHeader._unpack(header)._asdict()['record_length']
+        raw += header
+        raw += f.read(length - TLDRecordHeader._size)
+
+    arrays = decode_arrays(raw, count)
+    arrays.raster['record_offset'] += offset
+
+    if progress:
+        progress.update(count)
+    return arrays
+
+def decode_arrays(raw, count=None, offset=0):
+    '''Decode records from a raw buffer into a :class:`TLDArrays`
+
+    All of the record and pulse offsets are located in a single pass over the
+    buffer; the headers are then unpacked for all records at once. Records
+    that are not raster records are skipped.
+
+    Parameters
+        raw : bytes-like object
+            Buffer containing TLD records
+        count : int or None
+            Number of records to decode. If None, records are decoded until
+            the end of the buffer.
+        offset : int
+            Offset into buffer to start decoding at
+    '''
+    # pylint: disable=too-many-locals
+    buf = np.frombuffer(raw, dtype=np.uint8)
+
+    record_offsets, is_raster = _scan_records(raw, count, offset)
+    record_offsets = record_offsets[is_raster]
+
+    raster = np.zeros(len(record_offsets), dtype=RASTER_DTYPE)
+    raster['record_index'] = np.flatnonzero(is_raster)
+    raster['record_offset'] = record_offsets
+    cols = TLDRasterHeader._ascolumns(TLDRasterHeader._unpack_array(
+        buf, record_offsets + TLDRecordHeader._size))
+    for field in ['time', 'raster_number', 'digitizer', 'pulse_count']:
+        raster[field] = cols[field]
+
+    pulse_offsets, pulse_numbers = _scan_pulses(
+        buf, record_offsets + TLDRecordHeader._size + TLDRasterHeader._size,
+        raster['pulse_count'])
+
+    pulse = np.zeros(len(pulse_offsets), dtype=PULSE_DTYPE)
+    pulse['raster_index'] = np.repeat(np.arange(len(raster)),
+                                      raster['pulse_count'])
+    pulse['pulse_number'] = pulse_numbers
+    cols = TLDPulseHeader._ascolumns(TLDPulseHeader._unpack_array(
+        buf, pulse_offsets))
+    pulse['time'] = raster['time'][pulse['raster_index']] + cols['time_offset']
+    for field in ['waveform_count', 'bias_tx', 'bias_rx', 'scan_angle',
+                  'range', 'thresh_rx', 'thresh_tx']:
+        pulse[field] = cols[field]
+
+    # Skip past pulse header and the two-byte data length
+    data_offsets = pulse_offsets + TLDPulseHeader._size + 2
+    tx_starts = data_offsets + 1
+    tx_lengths = buf[data_offsets].astype(np.int64)
+    rx_starts, rx_lengths, channels = _scan_waveforms(
+        buf, tx_starts + tx_lengths, pulse['waveform_count'])
+
+    channel = np.zeros(len(rx_starts), dtype=CHANNEL_DTYPE)
+    channel['pulse_index'] = np.repeat(np.arange(len(pulse)),
+                                       pulse['waveform_count'])
+    channel['channel'] = channels
+
+    tx = RaggedArray(*_gather(buf, tx_starts, tx_lengths))
+    rx = RaggedArray(*_gather(buf, rx_starts, rx_lengths))
+
+    return TLDArrays(raster, pulse, channel, tx, rx)
+
+def concat_arrays(arrays):
+    '''Concatenate a sequence of :class:`TLDArrays` into one
+
+    The raster_index, pulse_index, and record_index fields are updated to
+    refer to the combined arrays.
+    '''
+    arrays = list(arrays)
+    if len(arrays) == 1:
+        return arrays[0]
+    if not arrays:
+        return decode_arrays(b'')
+
+    raster = np.concatenate([a.raster for a in arrays])
+    pulse = np.concatenate([a.pulse for a in arrays])
+    channel = np.concatenate([a.channel for a in arrays])
+
+    raster_base = pulse_base = record_base = 0
+    raster_pos = pulse_pos = channel_pos = 0
+    for a in arrays:
+        raster[raster_pos:raster_pos+len(a.raster)]['record_index'] += record_base
+        pulse[pulse_pos:pulse_pos+len(a.pulse)]['raster_index'] += raster_base
+        channel[channel_pos:channel_pos+len(a.channel)]['pulse_index'] += pulse_base
+        if len(a.raster):
+            record_base += a.raster['record_index'][-1] + 1
+        raster_base += len(a.raster)
+        pulse_base += len(a.pulse)
+        raster_pos += len(a.raster)
+        pulse_pos += len(a.pulse)
+        channel_pos += len(a.channel)
+
+    tx = RaggedArray._concat_same_type([a.tx for a in arrays])
+    rx = RaggedArray._concat_same_type([a.rx for a in arrays])
+    return TLDArrays(raster, pulse, channel, tx, rx)
+
+def split_arrays(arrays):
+    '''Split a :class:`TLDArrays` into one TLDArrays per raster
+
+    This is the inverse of :func:`concat_arrays`. Each result holds compact
+    copies of its raster's data and shares nothing with arrays.
+    '''
+    pulse_starts = np.searchsorted(arrays.pulse['raster_index'],
+                                   np.arange(len(arrays.raster) + 1))
+    channel_starts = np.searchsorted(arrays.channel['pulse_index'],
+                                     pulse_starts)
+
+    result = []
+    for idx in range(len(arrays.raster)):
+        p0, p1 = pulse_starts[idx], pulse_starts[idx+1]
+        c0, c1 = channel_starts[idx], channel_starts[idx+1]
+        raster = arrays.raster[idx:idx+1].copy()
+        raster['record_index'] = 0
+        pulse = arrays.pulse[p0:p1].copy()
+        pulse['raster_index'] = 0
+        channel = arrays.channel[c0:c1].copy()
+        channel['pulse_index'] -= p0
+        result.append(TLDArrays(raster, pulse, channel,
+                                arrays.tx[p0:p1].compact(),
+                                arrays.rx[c0:c1].compact()))
+    return result
+
+def index_pulses(raw):
+    '''Locate every pulse and waveform in a buffer of TLD records
+
+    This finds the byte offset and length of each pulse and each of its
+    waveforms without decoding any samples. The result can be kept and used
+    to read individual pulses or waveforms later.
+
+    Parameters
+        raw : bytes-like object
+            Buffer containing the TLD records of an entire file
+
+    Returns (pulses, waveforms). pulses is an array of
+    :data:`PULSE_INDEX_DTYPE` with one entry per pulse, ordered by
+    record_offset and then pulse_number. offset and length cover the pulse's
+    header and data. tx_offset and tx_length locate its transmit waveform, and
+    its return waveforms are waveforms[waveform_index:waveform_index +
+    waveform_count], an array of :data:`WAVEFORM_INDEX_DTYPE`.
+    '''
+    buf = np.frombuffer(raw, dtype=np.uint8)
+
+    record_offsets, is_raster = _scan_records(raw)
+    record_offsets = record_offsets[is_raster]
+    pulse_counts = TLDRasterHeader._ascolumns(TLDRasterHeader._unpack_array(
+        buf, record_offsets + TLDRecordHeader._size))['pulse_count']
+
+    pulse_offsets, pulse_numbers = _scan_pulses(
+        buf, record_offsets + TLDRecordHeader._size + TLDRasterHeader._size,
+        pulse_counts)
+    waveform_counts = TLDPulseHeader._ascolumns(TLDPulseHeader._unpack_array(
+        buf, pulse_offsets))['waveform_count']
+
+    data_offsets = pulse_offsets + TLDPulseHeader._size + 2
+    tx_lengths = buf[data_offsets].astype(np.int64)
+    rx_starts, rx_lengths, _ = _scan_waveforms(
+        buf, data_offsets + 1 + tx_lengths, waveform_counts)
+
+    pulses = np.zeros(len(pulse_offsets), dtype=PULSE_INDEX_DTYPE)
+    pulses['record_offset'] = np.repeat(record_offsets, pulse_counts)
+    pulses['pulse_number'] = pulse_numbers
+    pulses['offset'] = pulse_offsets
+    pulses['length'] = (TLDPulseHeader._size + 2 +
+                        _uint16(buf, pulse_offsets + TLDPulseHeader._size))
+    pulses['tx_offset'] = data_offsets + 1
+    pulses['tx_length'] = tx_lengths
+    pulses['waveform_count'] = waveform_counts
+    np.cumsum(waveform_counts[:-1].astype(np.int64),
+              out=pulses['waveform_index'][1:])
+
+    waveforms = np.zeros(len(rx_starts), dtype=WAVEFORM_INDEX_DTYPE)
+    waveforms['offset'] = rx_starts
+    waveforms['length'] = rx_lengths
+
+    return pulses, waveforms
+
+def _scan_records(raw, count=None, offset=0):
+    '''Locate the records in a raw buffer
+
+    Record boundaries must be found sequentially, but that only requires
+    looking at the four-byte record headers. Returns (offsets, is_raster), an
+    array of record offsets and a boolean array indicating which are raster
+    records.
+    '''
+    size = memoryview(raw).nbytes
+    record_offsets = []
+    length_types = []
+    while count is None or len(record_offsets) < count:
+        if count is None and offset >= size:
+            break
+        if offset + TLDRecordHeader._size > size:
+            raise ValueError('TLD data is truncated')
+        length_type = TLDRecordHeader._struct.unpack_from(raw, offset)[0]
+        record_offsets.append(offset)
+        length_types.append(length_type)
+        length = length_type & 0xFFFFFF
+        if length < TLDRecordHeader._size:
+            raise ValueError('invalid TLD record length')
+        offset += length
+
+    records = np.zeros(len(length_types), dtype=TLDRecordHeader._dtype)
+    records['length_type'] = length_types
+    is_raster = TLDRecordHeader._ascolumns(records)['record_type'] == 5
+    return np.array(record_offsets, dtype=np.int64), is_raster
+
+def _uint16(buf, offsets):
+    '''Returns the little-endian uint16 values at the given offsets'''
+    return buf[offsets].astype(np.int64) | (buf[offsets+1].astype(np.int64) << 8)
+
+def _scan_pulses(buf, starts, counts):
+    '''Locate the pulses in a set of raster records
+
+    Pulses within a raster are variable length and must be walked in order,
+    but all rasters are walked together. Returns (offsets, pulse_numbers), each
+    ordered by raster and then by pulse.
+    '''
+    max_count = counts.max() if len(counts) else 0
+    offsets = np.zeros((len(counts), max_count), dtype=np.int64)
+    pos = starts.astype(np.int64)
+    for idx in range(max_count):
+        active = counts > idx
+        offsets[:, idx] = pos
+        data_length = _uint16(buf, pos[active] + TLDPulseHeader._size)
+        pos[active] += TLDPulseHeader._size + 2 + data_length
+
+    valid = np.arange(max_count) < counts[:, np.newaxis]
+    numbers = np.broadcast_to(np.arange(1, max_count+1), valid.shape)
+    return offsets[valid], numbers[valid]
+
+def _scan_waveforms(buf, starts, counts):
+    '''Locate the return waveforms in a set of pulses
+
+    Returns (offsets, lengths, channels), each ordered by pulse and then by
+    channel.
+    '''
+    max_count = counts.max() if len(counts) else 0
+    offsets = np.zeros((len(counts), max_count), dtype=np.int64)
+    lengths = np.zeros((len(counts), max_count), dtype=np.int64)
+    pos = starts.astype(np.int64)
+    for idx in range(max_count):
+        active = counts > idx
+        length = _uint16(buf, pos[active])
+        offsets[active, idx] = pos[active] + 2
+        lengths[active, idx] = length
+        pos[active] += 2 + length
+
+    valid = np.arange(max_count) < counts[:, np.newaxis]
+    channels = np.broadcast_to(np.arange(1, max_count+1), valid.shape)
+    return offsets[valid], lengths[valid], channels[valid]
+
+def _gather(buf, starts, lengths):
+    '''Copy variable-length segments of buf into a new contiguous buffer
+
+    Returns (samples, offsets, lengths) where offsets gives the start of each
+    segment in samples.
+    '''
+    offsets = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    total = int(lengths.sum())
+    idx = np.repeat(starts - offsets, lengths) + np.arange(total)
+    return buf[idx], offsets, lengths
+
 def write(f, rasters):
     '''Writes a series of rasters to an open filehandle'''
     for raster in rasters:
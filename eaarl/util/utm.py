@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 # vim: set fileencoding=utf-8 :
-'''Conversion to/from UTM'''
+'''Conversion to/from UTM
+
+The conversions work on whole arrays of coordinates at once. They use the
+same transverse Mercator series and WGS-84 parameters as the `utm
+<https://pypi.python.org/pypi/utm>`_ package, so results agree with it to
+well under a millimeter, but every point may be in its own zone.
+'''
 
 # Boilerplate for cross-compatibility of Python 2/3
 from __future__ import unicode_literals
@@ -12,9 +18,35 @@ import future.standard_library
 future.standard_library.install_aliases()
 
 import numpy as np
-import utm
 
-_from_latlon = np.frompyfunc(utm.from_latlon, 3, 4) # pylint: disable=invalid-name
+K0 = 0.9996
+
+E = 0.00669438
+E2 = E * E
+E3 = E2 * E
+E_P2 = E / (1 - E)
+
+SQRT_E = np.sqrt(1 - E)
+_E = (1 - SQRT_E) / (1 + SQRT_E)
+_E2 = _E * _E
+_E3 = _E2 * _E
+_E4 = _E3 * _E
+_E5 = _E4 * _E
+
+M1 = (1 - E / 4 - 3 * E2 / 64 - 5 * E3 / 256)
+M2 = (3 * E / 8 + 3 * E2 / 32 + 45 * E3 / 1024)
+M3 = (15 * E2 / 256 + 45 * E3 / 1024)
+M4 = (35 * E3 / 3072)
+
+P2 = (3. / 2 * _E - 27. / 32 * _E3 + 269. / 512 * _E5)
+P3 = (21. / 16 * _E2 - 55. / 32 * _E4)
+P4 = (151. / 96 * _E3 - 417. / 128 * _E5)
+P5 = (1097. / 512 * _E4)
+
+R = 6378137
+
+ZONE_LETTERS = np.array(list('CDEFGHJKLMNPQRSTUVWXX'))
+
 def from_latlon(latitude, longitude, force_zone_number=None):
     '''Converts geographic coordinates to UTM coordinates
 
@@ -31,9 +63,65 @@ def from_latlon(latitude, longitude, force_zone_number=None):
         Returns (easting, northing, zone_number, zone_letter) where each are
         arrays.
     '''
-    return _from_latlon(latitude, longitude, force_zone_number)
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    if np.any((latitude < -80) | (latitude > 84)):
+        raise ValueError(
+            'latitude out of range (must be between 80 deg S and 84 deg N)')
+    if np.any((longitude < -180) | (longitude > 180)):
+        raise ValueError(
+            'longitude out of range (must be between 180 deg W and 180 deg E)')
+
+    if force_zone_number is None:
+        zone_number = latlon_to_zone_number(latitude, longitude)
+    else:
+        _check_zone_number(force_zone_number)
+        zone_number = np.broadcast_to(
+            np.asarray(force_zone_number, dtype=np.int64),
+            np.broadcast(latitude, longitude).shape)
+    zone_letter = latitude_to_zone_letter(latitude)
+
+    lat_rad = np.radians(latitude)
+    lat_sin = np.sin(lat_rad)
+    lat_cos = np.cos(lat_rad)
+
+    lat_tan = lat_sin / lat_cos
+    lat_tan2 = lat_tan * lat_tan
+    lat_tan4 = lat_tan2 * lat_tan2
+
+    lon_rad = np.radians(longitude)
+    central_lon_rad = np.radians(zone_number_to_central_longitude(zone_number))
+
+    n = R / np.sqrt(1 - E * lat_sin**2)
+    c = E_P2 * lat_cos**2
+
+    a = lat_cos * _mod_angle(lon_rad - central_lon_rad)
+    a2 = a * a
+    a3 = a2 * a
+    a4 = a3 * a
+    a5 = a4 * a
+    a6 = a5 * a
+
+    # Multiple-angle sines from the sine and cosine already at hand
+    sin2, cos2 = 2 * lat_sin * lat_cos, lat_cos * lat_cos - lat_sin * lat_sin
+    sin4, cos4 = 2 * sin2 * cos2, cos2 * cos2 - sin2 * sin2
+    sin6 = sin4 * cos2 + cos4 * sin2
+    m = R * (M1 * lat_rad - M2 * sin2 + M3 * sin4 - M4 * sin6)
+
+    easting = K0 * n * (
+        a +
+        a3 / 6 * (1 - lat_tan2 + c) +
+        a5 / 120 * (5 - 18 * lat_tan2 + lat_tan4 + 72 * c - 58 * E_P2)
+    ) + 500000
+
+    northing = K0 * (m + n * lat_tan * (
+        a2 / 2 +
+        a4 / 24 * (5 - lat_tan2 + 9 * c + 4 * c**2) +
+        a6 / 720 * (61 - 58 * lat_tan2 + lat_tan4 + 600 * c - 330 * E_P2)))
+    northing = np.where(latitude < 0, northing + 10000000, northing)
+
+    return easting, northing, zone_number, zone_letter
 
-_to_latlon = np.frompyfunc(utm.to_latlon, 5, 2) # pylint: disable=invalid-name
 def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None):
     '''Converts UTM coordinates to geographic coordinates
 
@@ -56,6 +144,133 @@ def to_latlon(easting, northing, zone_number, zone_letter=None, northern=None):
     Returns : (array, array)
         Returns (latitude, longitude) where each are arrays.
     '''
-    if not zone_letter and northern is None:
+    if isinstance(zone_letter, str) and not zone_letter:
+        zone_letter = None
+    if zone_letter is not None:
+        northern = np.char.upper(np.asarray(zone_letter, dtype=str)) >= 'N'
+    elif northern is None:
         northern = True
-    return _to_latlon(easting, northing, zone_number, zone_letter, northern)
+    northern = np.asarray(northern, dtype=bool)
+
+    zone_number = np.asarray(zone_number, dtype=np.int64)
+    _check_zone_number(zone_number)
+
+    x = np.asarray(easting, dtype=float) - 500000
+    y = np.asarray(northing, dtype=float)
+    y = np.where(northern, y, y - 10000000)
+
+    m = y / K0
+    mu = m / (R * M1)
+
+    sin2, cos2 = np.sin(2 * mu), np.cos(2 * mu)
+    sin4, cos4 = 2 * sin2 * cos2, cos2 * cos2 - sin2 * sin2
+    sin6 = sin4 * cos2 + cos4 * sin2
+    sin8 = 2 * sin4 * cos4
+    p_rad = mu + P2 * sin2 + P3 * sin4 + P4 * sin6 + P5 * sin8
+
+    p_sin = np.sin(p_rad)
+    p_sin2 = p_sin * p_sin
+
+    p_cos = np.cos(p_rad)
+
+    p_tan = p_sin / p_cos
+    p_tan2 = p_tan * p_tan
+    p_tan4 = p_tan2 * p_tan2
+
+    ep_sin = 1 - E * p_sin2
+    ep_sin_sqrt = np.sqrt(ep_sin)
+
+    n = R / ep_sin_sqrt
+    r = (1 - E) / ep_sin
+
+    c = E_P2 * p_cos**2
+    c2 = c * c
+
+    d = x / (n * K0)
+    d2 = d * d
+    d3 = d2 * d
+    d4 = d3 * d
+    d5 = d4 * d
+    d6 = d5 * d
+
+    latitude = p_rad - (p_tan / r) * (
+        d2 / 2 -
+        d4 / 24 * (5 + 3 * p_tan2 + 10 * c - 4 * c2 - 9 * E_P2) +
+        d6 / 720 * (61 + 90 * p_tan2 + 298 * c + 45 * p_tan4 - 252 * E_P2 - 3 * c2))
+
+    longitude = (
+        d -
+        d3 / 6 * (1 + 2 * p_tan2 + c) +
+        d5 / 120 * (5 - 2 * c + 28 * p_tan2 - 3 * c2 + 8 * E_P2 + 24 * p_tan4)
+    ) / p_cos
+
+    longitude = _mod_angle(
+        longitude + np.radians(zone_number_to_central_longitude(zone_number)))
+
+    return np.degrees(latitude), np.degrees(longitude)
+
+def latlon_to_zone_number(latitude, longitude):
+    '''Returns the UTM zone number of each point
+
+    The exceptions to the regular zones around Norway and Svalbard are
+    applied.
+
+    Parameters
+        latitude : array-like of float
+            Latitude coordinate values
+        longitude : array-like of float
+            Longitude coordinate values
+
+    Returns : array of int
+    '''
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+
+    # Normalize longitude to be in the range [-180, 180)
+    longitude = (longitude % 360 + 540) % 360 - 180
+
+    with np.errstate(invalid='ignore'):
+        zone = np.floor((longitude + 180) / 6)
+    zone = np.where(np.isfinite(zone), zone, 0).astype(np.int64) + 1
+
+    # Special zone for Norway
+    norway = (latitude >= 56) & (latitude < 64) & (longitude >= 3) & \
+        (longitude < 12)
+    zone = np.where(norway, 32, zone)
+
+    # Special zones for Svalbard
+    svalbard = (latitude >= 72) & (latitude <= 84) & (longitude >= 0) & \
+        (longitude < 42)
+    svalbard_zone = np.select(
+        [longitude < 9, longitude < 21, longitude < 33], [31, 33, 35], 37)
+    return np.where(svalbard, svalbard_zone, zone)
+
+def latitude_to_zone_letter(latitude):
+    '''Returns the UTM zone letter of each latitude
+
+    Parameters
+        latitude : array-like of float
+            Latitude coordinate values, between -80 and 84
+
+    Returns : array of str
+    '''
+    latitude = np.asarray(latitude, dtype=float)
+    with np.errstate(invalid='ignore'):
+        band = np.floor(latitude + 80) // 8
+    band = np.clip(np.where(np.isfinite(band), band, 0), 0,
+                   len(ZONE_LETTERS) - 1).astype(np.int64)
+    return ZONE_LETTERS[band]
+
+def zone_number_to_central_longitude(zone_number):
+    '''Returns the central longitude, in degrees, of each UTM zone'''
+    return (np.asarray(zone_number) - 1) * 6 - 180 + 3
+
+def _check_zone_number(zone_number):
+    '''Raises ValueError if any zone number is not between 1 and 60'''
+    zone_number = np.asarray(zone_number)
+    if np.any((zone_number < 1) | (zone_number > 60)):
+        raise ValueError('zone number out of range (must be between 1 and 60)')
+
+def _mod_angle(value):
+    '''Returns angle in radians to be between -pi and pi'''
+    return (value + np.pi) % (2 * np.pi) - np.pi
@@ -0,0 +1,44 @@
+# pylint: disable=missing-docstring
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library # pylint: disable=unused-import
+from future.builtins import *
+
+import numpy as np
+import pandas as pd
+
+from eaarl.io import ins
+
+def test_interp_columns():
+    xp = np.array([0., 1., 1., 3., 4.])
+    fp = np.array([[0., 10.], [1., 20.], [2., 25.], [3., 40.], [5., 0.]])
+    x = np.array([-0.5, 0., 0.5, 1., 2., 3.5, 4., 4.5, np.nan])
+    expected = np.column_stack([
+        np.interp(x, xp, column, left=np.nan, right=np.nan)
+        for column in fp.T])
+    result = ins._interp_columns(x, xp, fp)
+    assert np.allclose(result, expected, equal_nan=True)
+
+def test_add_to_frame():
+    data = pd.DataFrame({
+        'sod': [100., 101., 102.],
+        'lon': [-80.0, -80.1, -80.2],
+        'lat': [25.0, 25.1, 25.2],
+        'alt': [300., 301., 302.],
+        'roll': [1., 2., 3.],
+        'pitch': [4., 5., 6.],
+        'heading': [10., 20., 30.],
+    })
+    frame = pd.DataFrame({'time': [0, 1, 2]})
+    ins.add_to_frame(frame, np.array([100.5, 101.75, 103.]), data)
+    assert np.allclose(frame['ins_alt'], [300.5, 301.75, np.nan],
+                       equal_nan=True)
+    assert np.allclose(frame['ins_heading'], [15., 27.5, np.nan],
+                       equal_nan=True)
+    assert frame['ins_east'].dtype == np.float64
+    assert not np.isnan(frame['ins_east'][:2]).any()
+    assert np.isnan(frame['ins_east'][2])
+    assert list(frame['ins_zone'][:2]) == [17, 17]
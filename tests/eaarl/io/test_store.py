@@ -0,0 +1,152 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from eaarl.io import flight
+from eaarl.io import store
+from eaarl.io.waveforms import RaggedArray
+
+def _wfs(raster_numbers, channels=2):
+    '''Returns a waveform frame and raster entries for the given rasters
+
+    Each raster has two pulses of the given number of channels. The transmit
+    waveform of a pulse is shared by its channels, as in the frames returned
+    by Flight.
+    '''
+    raster_numbers = np.asarray(raster_numbers, dtype=np.int64)
+    pulses = np.repeat(raster_numbers, 2)
+    pulse_number = np.tile([1, 2], len(raster_numbers))
+    tx = RaggedArray(
+        np.concatenate([[raster, pulse, 7] for raster, pulse
+                        in zip(pulses, pulse_number)]).astype(np.uint8),
+        np.arange(len(pulses)) * 3, np.full(len(pulses), 3))
+
+    rows = np.repeat(np.arange(len(pulses)), channels)
+    channel = np.tile(np.arange(1, channels+1), len(pulses))
+    rx = RaggedArray.from_sequence(
+        [list(range(pulses[row], pulses[row] + chan))
+         for row, chan in zip(rows, channel)])
+
+    wfs = pd.DataFrame({
+        'raster_number': pulses[rows],
+        'pulse_number': pulse_number[rows],
+        'time': pulses[rows] + pulse_number[rows] * 0.01,
+        'ins_zone': np.array([17] * len(rows), dtype=object),
+        'tx': tx.take(rows),
+        'rx': rx,
+        'channel': channel,
+    })
+    rasters = pd.DataFrame({'raster_number': raster_numbers,
+                            'time': raster_numbers.astype(np.double)})
+    return wfs, rasters
+
+class TestWaveformStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'wfs.h5')
+        with store.WaveformStore(self.filename, 'w') as wfstore:
+            for chunk in [[1, 2, 3], [4, 5], [7, 8, 9, 10]]:
+                wfs, rasters = _wfs(chunk)
+                wfstore.append(wfs, rasters)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertWfsEqual(self, got, expected):
+        self.assertEqual(list(got.columns), list(expected.columns))
+        self.assertEqual(len(got), len(expected))
+        for col in expected.columns:
+            if col in ('tx', 'rx'):
+                self.assertTrue(all(got[col].values == expected[col].values))
+            else:
+                self.assertEqual(list(got[col]), list(expected[col]))
+
+    def test_read_by_raster(self):
+        with store.WaveformStore(self.filename) as wfstore:
+            self.assertEqual(len(wfstore), 9)
+            self.assertWfsEqual(wfstore.read_by_raster(start=2, count=4),
+                                _wfs([2, 3, 4, 5])[0])
+            self.assertWfsEqual(wfstore.read_by_raster(ranges=[(9, 5), (1, 1)]),
+                                _wfs([1, 9, 10])[0])
+            got = wfstore.read_by_raster(rasters=[6, 8, 3])
+            self.assertWfsEqual(got, _wfs([3, 8])[0])
+            self.assertEqual(got.index.names,
+                             ['raster_number', 'pulse_number', 'channel'])
+            self.assertEqual(len(wfstore.read_by_raster(rasters=[6])), 0)
+
+    def test_read_by_time(self):
+        with store.WaveformStore(self.filename) as wfstore:
+            self.assertWfsEqual(wfstore.read_by_time(start=3.5, stop=8),
+                                _wfs([4, 5, 7, 8])[0])
+            self.assertWfsEqual(
+                wfstore.read_by_time(ranges=[(0, 1), (10, 11)]),
+                _wfs([1, 10])[0])
+            with self.assertRaises(TypeError):
+                wfstore.read_by_time(start=1)
+
+    def test_iter(self):
+        with store.WaveformStore(self.filename) as wfstore:
+            chunks = list(wfstore.iter_by_raster(start=2, count=8,
+                                                 chunk_size=3))
+            self.assertEqual(len(chunks), 3)
+            for chunk, expected in zip(chunks, [[2, 3, 4], [5, 7, 8], [9]]):
+                self.assertWfsEqual(chunk, _wfs(expected)[0])
+            chunks = list(wfstore.iter_by_time(start=3.5, stop=8,
+                                               chunk_size=2))
+            self.assertEqual(len(chunks), 2)
+            self.assertWfsEqual(chunks[1], _wfs([7, 8])[0])
+            with self.assertRaises(TypeError):
+                wfstore.iter_by_time(start=1)
+
+    def test_flight_iter(self):
+        fl = flight.Flight('2016-01-01')
+        with self.assertRaises(flight.EdbNotLoadedError):
+            fl.iter_wfs_by_raster(start=1)
+        with self.assertRaises(flight.EdbNotLoadedError):
+            fl.iter_wfs_by_time(start=1, stop=2)
+        fl.load_store(self.filename)
+        try:
+            chunks = list(fl.iter_wfs_by_time(start=3.5, stop=8,
+                                              chunk_size=2))
+            self.assertWfsEqual(chunks[0], _wfs([4, 5])[0])
+            chunks = list(fl.iter_wfs_by_raster(rasters=[1, 10],
+                                                chunk_size=1))
+            self.assertWfsEqual(chunks[1], _wfs([10])[0])
+        finally:
+            fl.store.close()
+
+    def test_shared_tx(self):
+        with store.WaveformStore(self.filename) as wfstore:
+            # Each of the 18 pulses stores 3 tx samples once
+            self.assertEqual(wfstore._h5.root.tx.nrows, 18 * 3)
+
+    def test_append_checks(self):
+        with store.WaveformStore(self.filename, 'a') as wfstore:
+            wfs, rasters = _wfs([11, 12])
+            with self.assertRaises(ValueError):
+                wfstore.append(wfs.drop(columns=['time']), rasters)
+            with self.assertRaises(ValueError):
+                wfstore.append(wfs, rasters.iloc[::-1])
+            wfstore.append(wfs, rasters)
+            self.assertWfsEqual(wfstore.read_by_raster(start=10, count=3),
+                                _wfs([10, 11, 12])[0])
+
+    def test_empty_raster(self):
+        with store.WaveformStore(self.filename, 'a') as wfstore:
+            wfs, _ = _wfs([12])
+            rasters = pd.DataFrame({'raster_number': [11, 12],
+                                    'time': [11., 12.]})
+            wfstore.append(wfs, rasters)
+            self.assertEqual(len(wfstore.read_by_raster(rasters=[11])), 0)
+            self.assertWfsEqual(wfstore.read_by_raster(start=11, count=2), wfs)
@@ -0,0 +1,142 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import bz2
+import gzip
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+from eaarl.io.waveforms.cache import RasterCache
+from eaarl.io.waveforms.cache import TLDFileCache
+
+class TestTLDFileCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, 'cache')
+        self.cache = TLDFileCache(self.cache_dir, max_bytes=2500)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_gz(self, name, data):
+        fn = os.path.join(self.dir, name + '.gz')
+        with gzip.open(fn, 'wb') as fh:
+            fh.write(data)
+        return fn
+
+    def test_uncompressed(self):
+        fn = os.path.join(self.dir, 'a.tld')
+        self.assertEqual(self.cache.get(fn), fn)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_get(self):
+        fn = self.write_gz('a.tld', b'abc' * 100)
+        cached = self.cache.get(fn)
+        self.assertNotEqual(cached, fn)
+        self.assertTrue(cached.endswith('a.tld'))
+        with open(cached, 'rb') as fh:
+            self.assertEqual(fh.read(), b'abc' * 100)
+        self.assertEqual(self.cache.get(fn), cached)
+        self.assertEqual(self.cache.size(), 300)
+
+    def test_bz2(self):
+        fn = os.path.join(self.dir, 'a.tld.bz2')
+        with bz2.BZ2File(fn, 'wb') as fh:
+            fh.write(b'xyz' * 10)
+        with open(self.cache.get(fn), 'rb') as fh:
+            self.assertEqual(fh.read(), b'xyz' * 10)
+
+    def test_stale(self):
+        fn = self.write_gz('a.tld', b'a' * 100)
+        first = self.cache.get(fn)
+        self.write_gz('a.tld', b'b' * 200)
+        second = self.cache.get(fn)
+        self.assertNotEqual(first, second)
+        self.assertFalse(os.path.exists(first))
+        with open(second, 'rb') as fh:
+            self.assertEqual(fh.read(), b'b' * 200)
+
+    def test_evict_lru(self):
+        fns = [self.write_gz(name, b'x' * 1000) for name in 'abc']
+        cached = [self.cache.get(fn) for fn in fns[:2]]
+        # Make a the most recently used
+        os.utime(cached[1], (time.time() - 100,) * 2)
+        os.utime(cached[0], None)
+        self.cache.get(fns[2])
+        self.assertTrue(os.path.exists(cached[0]))
+        self.assertFalse(os.path.exists(cached[1]))
+        self.assertEqual(self.cache.size(), 2000)
+
+    def test_too_large(self):
+        fn = self.write_gz('a.tld', b'x' * 3000)
+        self.assertEqual(self.cache.get(fn), fn)
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_corrupt(self):
+        fn = os.path.join(self.dir, 'a.tld.gz')
+        with open(fn, 'wb') as fh:
+            fh.write(b'not gzip data')
+        self.assertEqual(self.cache.get(fn), fn)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_clear(self):
+        self.cache.get(self.write_gz('a.tld', b'x'))
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_foreign_files(self):
+        os.makedirs(self.cache_dir)
+        foreign = [os.path.join(self.cache_dir, name) for name in
+                   ['important_archive.tld.gz', '0123456789abcdef-a.tld']]
+        for fn in foreign:
+            with open(fn, 'wb') as fh:
+                fh.write(b'y' * 3000)
+        fns = [self.write_gz(name, b'x' * 1000) for name in 'abc']
+        for fn in fns:
+            self.cache.get(fn)
+        self.assertEqual(self.cache.size(), 2000)
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(os.path.basename(fn) for fn in foreign))
+
+class TestRasterCache(unittest.TestCase):
+    def test_get_put(self):
+        cache = RasterCache(100)
+        self.assertIsNone(cache.get(1))
+        cache.put(1, 'a', 10)
+        self.assertEqual(cache.get(1), 'a')
+        self.assertEqual(cache.stats(),
+                         {'hits': 1, 'misses': 1, 'entries': 1, 'nbytes': 10})
+
+    def test_evict_lru(self):
+        cache = RasterCache(100)
+        cache.put(1, 'a', 40)
+        cache.put(2, 'b', 40)
+        cache.get(1)
+        cache.put(3, 'c', 40)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertIn(3, cache)
+        self.assertEqual(cache.nbytes, 80)
+
+    def test_replace(self):
+        cache = RasterCache(100)
+        cache.put(1, 'a', 40)
+        cache.put(1, 'b', 50)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.nbytes, 50)
+
+    def test_too_large(self):
+        cache = RasterCache(100)
+        cache.put(1, 'a', 101)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
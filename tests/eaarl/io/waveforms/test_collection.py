@@ -17,6 +17,7 @@ import tempfile
 import unittest
 
 from eaarl.io.waveforms import collection
+from eaarl.io.waveforms import edb
 from eaarl.io.waveforms import tld
 
 class TestEaarlCollection(unittest.TestCase):
@@ -58,11 +59,31 @@ class TestEaarlCollection(unittest.TestCase):
                 }])
             fh.close()
 
+        self.edb = edb
         self.eaarl = collection.EaarlCollection(edb_data=edb, tld_path=self.dir)
 
     def tearDown(self):
+        self.eaarl.close()
         shutil.rmtree(self.dir)
 
+    def test_lazy(self):
+        edb_file = os.path.join(self.dir, 'test.idx')
+        edb.write_to(edb_file, self.edb)
+        lazy = collection.EaarlCollection(edb_file=edb_file, lazy=True)
+        try:
+            self.assertEqual(len(lazy), 30)
+            ranges = [(1,2),(7,8),(30,1)]
+            self.assertEqual(lazy.get_rasters(ranges=ranges),
+                             self.eaarl.get_rasters(ranges=ranges))
+            start, stop = self.times[2] - 0.001, self.times[4] + 0.001
+            self.assertEqual(list(lazy.lookup_rasters_by_time(start, stop)),
+                             [3,4,5])
+            self.assertIsNone(lazy._edb_frame)
+            self.assertEqual(list(lazy._edb['raster_number']),
+                             list(range(1, 31)))
+        finally:
+            lazy.close()
+
     def test_get_rasters_single(self):
         raster = self.eaarl.get_rasters(2)
         self.assertEqual(len(raster), 1)
@@ -110,6 +131,168 @@ class TestEaarlCollection(unittest.TestCase):
         for idx, rn in zip(range(10), expected):
             self.assertEqual(raster[idx]['raster_number'], rn)
 
+    def test_get_rasters_columnar(self):
+        arrays = self.eaarl.get_rasters(ranges=[(1,2),(7,8)], columnar=True)
+        expected = list(range(1,3)) + list(range(7,15))
+        self.assertEqual(list(arrays.raster['raster_number']), expected)
+        self.assertTrue(np.allclose(arrays.raster['time'],
+                                    self.times[np.array(expected)-1]))
+
+    def test_get_rasters_compressed(self):
+        for fn in os.listdir(self.dir):
+            path = os.path.join(self.dir, fn)
+            with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+                dst.write(src.read())
+            os.remove(path)
+        expected = list(range(1,3)) + list(range(7,15)) + [30]
+        for gap in [0, 1048576]:
+            self.eaarl.read_gap = gap
+            raster = self.eaarl.get_rasters(ranges=[(1,2),(7,8),(30,1)])
+            self.assertEqual([r['raster_number'] for r in raster], expected)
+            arrays = self.eaarl.get_rasters(ranges=[(1,2),(7,8),(30,1)],
+                                            columnar=True)
+            self.assertEqual(list(arrays.raster['raster_number']), expected)
+
+    def test_get_rasters_cached(self):
+        for fn in os.listdir(self.dir):
+            path = os.path.join(self.dir, fn)
+            with open(path, 'rb') as src, bz2.BZ2File(path + '.bz2', 'wb') as dst:
+                dst.write(src.read())
+            os.remove(path)
+        cache_dir = os.path.join(self.dir, 'cache')
+        self.eaarl.cache = collection.TLDFileCache(cache_dir)
+        expected = list(range(1,3)) + list(range(7,15))
+        raster = self.eaarl.get_rasters(ranges=[(1,2),(7,8)])
+        self.assertEqual([r['raster_number'] for r in raster], expected)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+        self.assertTrue(all(isinstance(handle, tld.MappedTLD)
+                            for handle in self.eaarl._handles.values()))
+
+    def test_get_rasters_workers(self):
+        ranges = [(1,2),(7,8),(30,1)]
+        expected = self.eaarl.get_rasters(ranges=ranges)
+        raster = self.eaarl.get_rasters(ranges=ranges, workers=2)
+        self.assertEqual(raster, expected)
+        arrays = self.eaarl.get_rasters(ranges=ranges, columnar=True, workers=2)
+        self.assertEqual(list(arrays.raster['raster_number']),
+                         [r['raster_number'] for r in expected])
+        self.assertEqual(list(arrays.raster['record_index']),
+                         list(range(len(expected))))
+
+    def test_iter_rasters(self):
+        ranges = [(1,2),(7,8),(30,1)]
+        expected = self.eaarl.get_rasters(ranges=ranges)
+        chunks = list(self.eaarl.iter_rasters(ranges=ranges, chunk_size=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 3])
+        self.assertEqual([r for chunk in chunks for r in chunk], expected)
+
+    def test_iter_rasters_columnar(self):
+        chunks = list(self.eaarl.iter_rasters(start=3, count=5, chunk_size=2,
+                                              columnar=True))
+        self.assertEqual([list(chunk.raster['raster_number'])
+                          for chunk in chunks], [[3,4], [5,6], [7]])
+
+    def test_get_rasters_repeated(self):
+        first = self.eaarl.get_rasters([2,8])
+        second = self.eaarl.get_rasters([2,8])
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.eaarl._handles), 2)
+
+    def test_handle_pool(self):
+        names = self.eaarl._edb['file_name'].values
+        self.eaarl.max_open_files = 2
+        self.eaarl.get_rasters([2,8,14])
+        self.assertEqual(list(self.eaarl._handles), [names[7], names[13]])
+        self.assertEqual(len(self.eaarl._paths), 3)
+        handle = self.eaarl._handles[names[13]]
+        self.eaarl.get_rasters(14)
+        self.assertIs(self.eaarl._handles[names[13]], handle)
+        self.eaarl.get_rasters(2)
+        self.assertEqual(list(self.eaarl._handles), [names[13], names[1]])
+
+    def test_raster_cache(self):
+        self.eaarl.raster_cache = collection.RasterCache()
+        first = self.eaarl.get_rasters(ranges=[(4,4)])
+        self.assertEqual(self.eaarl.raster_cache.misses, 4)
+        first[0]['digitizer'] = 9
+        second = self.eaarl.get_rasters(ranges=[(2,4)])
+        self.assertEqual([r['raster_number'] for r in second], [2,3,4,5])
+        self.assertEqual(second[2]['digitizer'], 0)
+        self.assertEqual(self.eaarl.raster_cache.hits, 2)
+        self.assertEqual(self.eaarl.raster_cache.misses, 6)
+
+    def test_raster_cache_columnar(self):
+        self.eaarl.raster_cache = collection.RasterCache()
+        first = self.eaarl.get_rasters(ranges=[(4,4)], columnar=True)
+        first.raster['digitizer'] = 9
+        second = self.eaarl.get_rasters(ranges=[(2,4),(9,1)], columnar=True)
+        self.assertEqual(list(second.raster['raster_number']), [2,3,4,5,9])
+        self.assertEqual(list(second.raster['digitizer']), [0]*5)
+        self.assertEqual(list(second.raster['record_index']), list(range(5)))
+        self.assertEqual(self.eaarl.raster_cache.hits, 2)
+        single = self.eaarl.get_rasters(9, columnar=True)
+        single.raster['digitizer'] = 9
+        self.assertEqual(
+            self.eaarl.get_rasters(9, columnar=True).raster['digitizer'][0], 0)
+
+    def test_raster_cache_shared(self):
+        cache = collection.RasterCache()
+        self.eaarl.raster_cache = cache
+        self.eaarl.get_rasters(2)
+        other_edb = self.eaarl._edb.copy()
+        other_edb['digitizer'] = 1
+        other = collection.EaarlCollection(
+            edb_data=other_edb.drop(columns=['raster_number']),
+            tld_path=self.dir, raster_cache=cache)
+        other.get_rasters(2)
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(len(cache), 2)
+
+        edb_file = os.path.join(self.dir, 'test.idx')
+        edb.write_to(edb_file, self.edb)
+        first = collection.EaarlCollection(edb_file=edb_file,
+                                           raster_cache=cache)
+        second = collection.EaarlCollection(edb_file=edb_file,
+                                            raster_cache=cache)
+        first.get_rasters(2)
+        second.get_rasters(2)
+        self.assertEqual(cache.hits, 1)
+
+    def test_raster_cache_not_raster(self):
+        # Make raster 5's record some other kind of record
+        entry = self.eaarl._edb.iloc[4]
+        fn = os.path.join(self.dir, entry['file_name'])
+        with open(fn, 'r+b') as fh:
+            fh.seek(int(entry['record_offset']) + 3)
+            fh.write(b'\x01')
+        expected = self.eaarl.get_rasters(ranges=[(4,3)], columnar=True)
+        self.eaarl.raster_cache = collection.RasterCache()
+        for _ in range(2):
+            got = self.eaarl.get_rasters(ranges=[(4,3)], columnar=True)
+            self.assertEqual(list(got.raster['raster_number']),
+                             list(expected.raster['raster_number']))
+        self.assertNotIn(5, list(got.raster['raster_number']))
+
+    def test_close(self):
+        self.eaarl.get_rasters(2)
+        self.eaarl.close()
+        self.assertEqual(len(self.eaarl._handles), 0)
+        raster = self.eaarl.get_rasters(2)
+        self.assertEqual(raster[0]['raster_number'], 2)
+
+    def test_close_lazy(self):
+        edb_file = os.path.join(self.dir, 'test.idx')
+        edb.write_to(edb_file, self.edb)
+        lazy = collection.EaarlCollection(edb_file=edb_file, lazy=True)
+        mapped = lazy._edb_mapped
+        lazy.get_rasters(2)
+        lazy.close()
+        self.assertIsNone(lazy._edb_mapped)
+        self.assertTrue(mapped._mmap.closed)
+        raster = lazy.get_rasters(3)
+        self.assertEqual(raster[0]['raster_number'], 3)
+        lazy.close()
+
     def test_lookup_time_start_stop(self):
         start = self.times[2] - 0.001
         stop = self.times[4] + 0.001
@@ -125,6 +308,17 @@ class TestEaarlCollection(unittest.TestCase):
         rns = self.eaarl.lookup_rasters_by_time(ranges=ranges)
         self.assertEqual(list(rns), expected)
 
+    def test_lookup_time_ranges_overlap(self):
+        ranges = [
+            (self.times[6] - 0.001, self.times[9] + 0.001),
+            (self.times[2] - 0.001, self.times[4] + 0.001),
+            (self.times[3] - 0.001, self.times[7] + 0.001),
+            (self.times[20] + 0.001, self.times[20] - 0.001),
+        ]
+        expected = [3,4,5,6,7,8,9,10]
+        rns = self.eaarl.lookup_rasters_by_time(ranges=ranges)
+        self.assertEqual(list(rns), expected)
+
     def test_get_by_time(self):
         start = self.times[2] - 0.001
         stop = self.times[4] + 0.001
@@ -134,6 +328,109 @@ class TestEaarlCollection(unittest.TestCase):
         self.assertEqual(raster[1]['raster_number'], 4)
         self.assertEqual(raster[2]['raster_number'], 5)
 
+class TestPulseAccess(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        edb = []
+        for name in ['a.tld', 'b.tld']:
+            with open(os.path.join(self.dir, name), 'wb') as fh:
+                for idx in range(3):
+                    offset = fh.tell()
+                    tld.write(fh, [{
+                        'time': 1.4e9 + len(edb),
+                        'raster_number': 1,
+                        'digitizer': 0,
+                        'pulse': [{
+                            'time': 1.4e9 + len(edb) + 0.001 * pulse,
+                            'bias_tx': 0,
+                            'bias_rx': [0, 0, 0, 0],
+                            'scan_angle': 0,
+                            'range': pulse,
+                            'thresh_rx': 0,
+                            'thresh_tx': 0,
+                            'tx': [len(edb), pulse],
+                            'rx': [[len(edb), pulse, channel]
+                                   for channel in range(1, 4)],
+                        } for pulse in range(1, idx + 2)],
+                    }])
+                    edb.append({
+                        'record_offset': offset,
+                        'record_length': fh.tell() - offset,
+                        'file_name': name,
+                        'pulse_count': idx + 1,
+                        'digitizer': 0,
+                        'time': 1.4e9 + len(edb),
+                    })
+        self.eaarl = collection.EaarlCollection(edb_data=edb,
+                                                tld_path=self.dir)
+
+    def tearDown(self):
+        self.eaarl.close()
+        shutil.rmtree(self.dir)
+
+    def check(self):
+        rasters = self.eaarl.get_rasters(start=1, count=6, progress=False)
+        pulses = self.eaarl.get_pulses([6, 2, 4], [3, 1, 1])
+        for pulse, (raster, number) in zip(pulses, [(6, 3), (2, 1), (4, 1)]):
+            self.assertEqual(pulse['raster_number'], raster)
+            self.assertEqual(pulse['pulse_number'], number)
+            expected = rasters[raster-1]['pulse'][number-1]
+            self.assertEqual(pulse['tx'], expected['tx'])
+            self.assertEqual(pulse['rx'], expected['rx'])
+            self.assertEqual(pulse['range'], expected['range'])
+            self.assertTrue(np.isclose(pulse['time'], expected['time']))
+
+        wfs = self.eaarl.get_waveforms([5, 3, 1, 6], [2, 3, 1, 1], [3, 0, 1, 2])
+        self.assertEqual([list(wf) for wf in wfs],
+                         [[4, 2, 3], [2, 3], [0, 1, 1], [5, 1, 2]])
+
+    def test_get_pulses(self):
+        self.check()
+        for name in ['a.tld', 'b.tld']:
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.dir, name + '.pidx.npz')))
+
+    def test_get_pulses_compressed(self):
+        for name in ['a.tld', 'b.tld']:
+            path = os.path.join(self.dir, name)
+            with open(path, 'rb') as src, bz2.BZ2File(path + '.bz2', 'wb') as dst:
+                dst.write(src.read())
+            os.remove(path)
+        self.check()
+
+    def test_missing(self):
+        self.assertRaises(KeyError, self.eaarl.get_pulses, 1, 2)
+        self.assertRaises(KeyError, self.eaarl.get_pulses, 7, 1)
+        self.assertRaises(KeyError, self.eaarl.get_waveforms, 1, 1, 4)
+
+    def test_empty(self):
+        self.assertEqual(self.eaarl.get_pulses([], []), [])
+        self.assertEqual(len(self.eaarl.get_waveforms([], [], [])), 0)
+
+class TestMergeRanges(unittest.TestCase):
+    def test_merge(self):
+        ranges = [(5, 6), (1, 3), (2, 4), (6, 7), (10, 12), (11, 11), (9, 8)]
+        merged = collection._merge_ranges(ranges)
+        self.assertEqual(merged.tolist(), [[1, 4], [5, 7], [10, 12]])
+
+    def test_empty(self):
+        self.assertEqual(collection._merge_ranges([]).shape, (0, 2))
+
+class TestPlanReads(unittest.TestCase):
+    def test_plan(self):
+        runs = [(500, 600, 'c'), (0, 100, 'a'), (150, 200, 'b'), (900, -1, 'd')]
+        blocks = collection._plan_reads(runs, 100)
+        self.assertEqual(blocks, [
+            (0, 200, [(0, 100, 'a'), (150, 200, 'b')]),
+            (500, 600, [(500, 600, 'c')]),
+            (900, None, [(900, -1, 'd')]),
+        ])
+
+    def test_plan_open_end(self):
+        runs = [(0, 100, 'a'), (150, -1, 'b')]
+        blocks = collection._plan_reads(runs, 100)
+        self.assertEqual(blocks, [(0, None, runs)])
+
 class TestOpenTldFile(unittest.TestCase):
     def setUp(self):
         self.dir = tempfile.mkdtemp()
@@ -202,3 +499,89 @@ class TestOpenTldFile(unittest.TestCase):
         with collection._open_tld_file(self.dir, self.file) as fh:
             data = fh.read()
         self.assertEqual(data, self.data)
+
+class TestBatchWaveforms(unittest.TestCase):
+    def setUp(self):
+        self.raster = {
+            'time': 1000.,
+            'raster_number': 1,
+            'digitizer': 0,
+            'pulse': [
+                {
+                    'time': 1000.1, 'bias_tx': 0, 'bias_rx': [0,0,0,0],
+                    'scan_angle': 0, 'range': 0, 'thresh_rx': 0,
+                    'thresh_tx': 0, 'tx': [1, 2, 3, 4, 5], 'rx': [[10, 20]],
+                },
+                {
+                    'time': 1000.2, 'bias_tx': 0, 'bias_rx': [0,0,0,0],
+                    'scan_angle': 0, 'range': 0, 'thresh_rx': 0,
+                    'thresh_tx': 0, 'tx': [9, 8], 'rx': [[30], [40, 50]],
+                },
+            ],
+        }
+        self.raw = tld._encode_record(self.raster)
+        self.arrays = tld.decode_arrays(self.raw)
+
+    def test_tx_clean(self):
+        collection.rasters_tx_clean(self.arrays, 3)
+        self.assertEqual([list(wf) for wf in self.arrays.tx],
+                         [[1, 2, 1, 1, 1], [9, 8]])
+
+    def test_tx_clean_dicts(self):
+        rasters = tld.read_buffer(self.raw, 0, 1)
+        collection.rasters_tx_clean(rasters, 3)
+        self.assertEqual([list(pulse['tx']) for pulse in rasters[0]['pulse']],
+                         [[1, 2, 1, 1, 1], [9, 8]])
+
+    def test_wf_flip_dicts(self):
+        rasters = tld.read_buffer(self.raw, 0, 1)
+        collection.rasters_wf_flip(rasters)
+        pulses = rasters[0]['pulse']
+        self.assertEqual([list(pulse['tx']) for pulse in pulses],
+                         [[254, 253, 252, 251, 250], [246, 247]])
+        self.assertEqual([[list(rx) for rx in pulse['rx']] for pulse in pulses],
+                         [[[245, 235]], [[225], [215, 205]]])
+
+    def test_tx_clean_dicts_pos(self):
+        rasters = tld.read_buffer(self.raw, 0, 1)
+        for pos in [0, -1]:
+            with self.assertRaises(ValueError):
+                collection.rasters_tx_clean(rasters, pos)
+        collection.rasters_tx_clean(rasters, 1)
+        self.assertEqual([list(pulse['tx']) for pulse in rasters[0]['pulse']],
+                         [[1, 1, 1, 1, 1], [9, 9]])
+
+    def test_dicts_independent(self):
+        rasters = tld.read_buffer(self.raw, 0, 1, views=True)
+        collection.rasters_wf_flip(rasters)
+        collection.rasters_tx_clean(rasters, 2)
+        pulses = rasters[0]['pulse']
+        for pulse in pulses:
+            self.assertEqual(pulse['tx'].dtype, np.uint8)
+            for rx in pulse['rx']:
+                self.assertEqual(rx.dtype, np.uint8)
+        pulses[0]['tx'][:] = 0
+        pulses[0]['rx'][0][:] = 0
+        self.assertEqual(list(pulses[1]['tx']), [246, 246])
+        self.assertEqual([list(rx) for rx in pulses[1]['rx']],
+                         [[225], [215, 205]])
+        self.assertIsNone(pulses[1]['tx'].base)
+
+    def test_wf_flip(self):
+        collection.rasters_wf_flip(self.arrays)
+        self.assertEqual([list(wf) for wf in self.arrays.tx],
+                         [[254, 253, 252, 251, 250], [246, 247]])
+        self.assertEqual([list(wf) for wf in self.arrays.rx],
+                         [[245, 235], [225], [215, 205]])
+
+    def test_arrays_to_waveforms(self):
+        pulses = collection.rasters_to_pulses(tld.read_buffer(self.raw, 0, 1))
+        expected = collection.pulses_to_waveforms(pulses)
+        wfs = collection.arrays_to_waveforms(self.arrays)
+        self.assertEqual(len(wfs), len(expected))
+        for (_, row), exp in zip(wfs.iterrows(), expected):
+            for field in ['raster_number', 'pulse_number', 'channel', 'time',
+                          'bias_rx', 'range', 'scan_angle']:
+                self.assertEqual(row[field], exp[field])
+            self.assertEqual(list(row['tx']), exp['tx'])
+            self.assertEqual(list(row['rx']), exp['rx'])
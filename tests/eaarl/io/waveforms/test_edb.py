@@ -5,9 +5,17 @@ from __future__ import absolute_import
 from future import standard_library
 from future.builtins import *
 
+import os
+import os.path
+import shutil
+import struct
+import tempfile
 import unittest
 from io import BytesIO
 
+import numpy as np
+import pandas as pd
+
 from eaarl.io.waveforms import edb
 
 class TestEdb(unittest.TestCase):
@@ -79,6 +87,94 @@ class TestEdb(unittest.TestCase):
         records = edb.decode(self.raw)
         self.assertEqual(records, self.records)
 
+    def test_decode_frame(self):
+        frame = edb.decode_frame(self.raw)
+        self.assertEqual(frame.to_dict('records'), self.records)
+        self.assertEqual(list(frame['file_name'].cat.categories),
+                         ['first.tld', 'second.tld'])
+        self.assertEqual(list(frame['file_name'].cat.codes), [0, 1, 1])
+        self.assertEqual(frame['record_offset'].dtype, 'int64')
+
+    def test_mapped(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmpdir, 'test.idx')
+            with open(fn, 'wb') as fh:
+                fh.write(self.raw)
+            with edb.MappedEDB(fn) as mapped:
+                self.assertEqual(len(mapped), 3)
+                self.assertEqual(mapped.files, ['first.tld', 'second.tld'])
+                self.assertEqual(list(mapped.record_offset), [3, 259, 65539])
+                self.assertEqual(list(mapped.file_index), [1, 2, 2])
+                self.assertFalse(mapped.record_offset.flags.writeable)
+                self.assertEqual(list(mapped.time),
+                                 [record['time'] for record in self.records])
+                self.assertEqual(list(mapped.file_name),
+                                 ['first.tld', 'second.tld', 'second.tld'])
+                self.assertEqual(mapped.frame().to_dict('records'),
+                                 self.records)
+                self.assertEqual(mapped.frame([2, 0]).to_dict('records'),
+                                 [self.records[2], self.records[0]])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_file_index_zero(self):
+        # A file_index of 0 refers to the last file, as files[-1] would
+        raw = bytearray(self.raw)
+        raw[12 + 16] = 0
+        expected = [record['file_name'] for record in edb.decode(bytes(raw))]
+        self.assertEqual(expected, ['second.tld', 'second.tld', 'second.tld'])
+        frame = edb.decode_frame(bytes(raw))
+        self.assertEqual(list(frame['file_name']), expected)
+        self.assertEqual(list(frame['file_name'].cat.codes), [1, 1, 1])
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmpdir, 'test.idx')
+            with open(fn, 'wb') as fh:
+                fh.write(raw)
+            with edb.MappedEDB(fn) as mapped:
+                self.assertEqual(list(mapped.file_name), expected)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_read_frame(self):
+        frame = edb.read_frame(BytesIO(self.raw))
+        self.assertEqual(frame.to_dict('records'), self.records)
+
     def test_encode(self):
         raw = edb.encode(self.records)
         self.assertEqual(raw, self.raw)
+
+    def test_encode_frame(self):
+        raw = edb.encode_frame(pd.DataFrame(self.records))
+        self.assertEqual(raw, self.raw)
+
+    def test_encode_frame_decoded(self):
+        raw = edb.encode_frame(edb.decode_frame(self.raw))
+        self.assertEqual(raw, self.raw)
+
+    def test_encode_frame_columns(self):
+        columns = dict((field, [record[field] for record in self.records])
+                       for field in self.records[0])
+        raw = edb.encode_frame(columns)
+        self.assertEqual(raw, self.raw)
+
+    def test_encode_frame_matches_encode(self):
+        rng = np.random.RandomState(1)
+        count = 500
+        frame = pd.DataFrame({
+            'record_offset': rng.randint(0, 2**32, count),
+            'record_length': rng.randint(0, 2**16, count),
+            'file_name': rng.choice(['c.tld', 'a.tld', 'b.tld'], count),
+            'pulse_count': rng.randint(0, 256, count),
+            'digitizer': rng.randint(0, 2, count),
+            'time': 1.4e9 + rng.uniform(0, 86400, count),
+        })
+        records = frame.to_dict('records')
+        self.assertEqual(edb.encode_frame(frame), edb.encode(records))
+
+    def test_encode_frame_range(self):
+        frame = pd.DataFrame(self.records)
+        frame.loc[0, 'record_offset'] = 2**32
+        self.assertRaises(struct.error, edb.encode_frame, frame)
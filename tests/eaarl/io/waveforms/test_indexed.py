@@ -0,0 +1,81 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import bz2
+import gzip
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from eaarl.io.waveforms import indexed
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+try:
+    import indexed_bzip2
+except ImportError:
+    indexed_bzip2 = None
+
+class TestOpenCompressed(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = bytes(bytearray(range(256))) * 8192
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, fn):
+        with indexed.open_compressed(fn) as fh:
+            self.assertEqual(fh.read(4), self.data[:4])
+            fh.seek(2000000)
+            self.assertEqual(fh.read(10), self.data[2000000:2000010])
+            fh.seek(100)
+            self.assertEqual(fh.read(10), self.data[100:110])
+
+    def write_gz(self):
+        fn = os.path.join(self.dir, 'file.tld.gz')
+        with gzip.open(fn, 'wb') as fh:
+            fh.write(self.data)
+        return fn
+
+    def write_bz2(self):
+        fn = os.path.join(self.dir, 'file.tld.bz2')
+        with bz2.BZ2File(fn, 'wb') as fh:
+            fh.write(self.data)
+        return fn
+
+    def test_gz(self):
+        self.check(self.write_gz())
+
+    def test_bz2(self):
+        self.check(self.write_bz2())
+
+    @unittest.skipIf(indexed_gzip is None, 'indexed_gzip is not installed')
+    def test_gz_index(self):
+        fn = self.write_gz()
+        self.check(fn)
+        self.assertTrue(os.path.isfile(indexed.index_path(fn)))
+        self.check(fn)
+
+    @unittest.skipIf(indexed_bzip2 is None, 'indexed_bzip2 is not installed')
+    def test_bz2_index(self):
+        fn = self.write_bz2()
+        self.check(fn)
+        self.assertTrue(os.path.isfile(indexed.index_path(fn)))
+        self.check(fn)
+
+    @unittest.skipIf(indexed_bzip2 is None, 'indexed_bzip2 is not installed')
+    def test_bad_index(self):
+        fn = self.write_bz2()
+        with open(indexed.index_path(fn), 'w') as fh:
+            fh.write('garbage')
+        self.check(fn)
@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO
+
+import numpy as np
+
+from eaarl.io.waveforms import pulseindex
+from eaarl.io.waveforms import tld
+
+def _pulse(count):
+    return {
+        'time': 0.,
+        'bias_tx': 0,
+        'bias_rx': [0, 0, 0, 0],
+        'scan_angle': 0,
+        'range': 0,
+        'thresh_rx': 0,
+        'thresh_tx': 0,
+        'tx': [1, 2],
+        'rx': [[10 + idx] * (idx + 1) for idx in range(count)],
+    }
+
+class TestPulseIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'test.tld')
+        fh = BytesIO()
+        tld.write(fh, [
+            {'time': 1., 'raster_number': 1, 'digitizer': 0,
+             'pulse': [_pulse(1), _pulse(4)]},
+            {'time': 2., 'raster_number': 2, 'digitizer': 0,
+             'pulse': [_pulse(2)]},
+        ])
+        self.raw = fh.getvalue()
+        with open(self.fn, 'wb') as f:
+            f.write(self.raw)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_find(self):
+        index = pulseindex.PulseIndex.build(self.raw)
+        second = index.pulses['record_offset'][-1]
+        rows = index.find_pulses([second, 0, 0], [1, 2, 1])
+        self.assertEqual(list(rows), [2, 1, 0])
+        offsets, lengths = index.find_waveforms(rows, [2, 4, 0])
+        wfs = [list(bytearray(self.raw[o:o+l]))
+               for o, l in zip(offsets, lengths)]
+        self.assertEqual(wfs, [[11, 11], [13] * 4, [1, 2]])
+
+    def test_find_missing(self):
+        index = pulseindex.PulseIndex.build(self.raw)
+        self.assertRaises(KeyError, index.find_pulses, [0], [3])
+        self.assertRaises(KeyError, index.find_pulses, [1], [1])
+        self.assertRaises(KeyError, index.find_waveforms, [0], [2])
+
+    def test_open_saves(self):
+        calls = []
+        def read():
+            calls.append(1)
+            return self.raw
+        index = pulseindex.PulseIndex.open(self.fn, read)
+        self.assertTrue(os.path.isfile(pulseindex.index_path(self.fn)))
+        again = pulseindex.PulseIndex.open(self.fn, read)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(np.array_equal(index.pulses, again.pulses))
+        self.assertTrue(np.array_equal(index.waveforms, again.waveforms))
+
+    def test_open_stale(self):
+        pulseindex.PulseIndex.build(self.raw).save(self.fn)
+        future = time.time() + 100
+        os.utime(self.fn, (future, future))
+        self.assertIsNone(pulseindex.PulseIndex.load(self.fn))
@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from eaarl.io.waveforms.ragged import RaggedArray
+
+class TestRaggedArray(unittest.TestCase):
+    def setUp(self):
+        self.wfs = [[1, 2, 3], [], [4, 5], [6, 7, 8, 9]]
+        self.ragged = RaggedArray.from_sequence(self.wfs)
+
+    def test_from_sequence(self):
+        self.assertEqual(list(self.ragged.buffer), [1, 2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(list(self.ragged.offsets), [0, 3, 3, 5])
+        self.assertEqual(list(self.ragged.lengths), [3, 0, 2, 4])
+
+    def test_getitem(self):
+        self.assertEqual([list(wf) for wf in self.ragged], self.wfs)
+        subset = self.ragged[[3, 0]]
+        self.assertIs(subset.buffer, self.ragged.buffer)
+        self.assertEqual([list(wf) for wf in subset], [self.wfs[3], self.wfs[0]])
+
+    def test_getitem_element(self):
+        element = self.ragged[0]
+        self.assertEqual(element.dtype, np.int64)
+        self.assertEqual(list(element - element[2]), [-2, -1, 0])
+        with self.assertRaises(ValueError):
+            element[0] = 9
+        self.assertEqual(list(self.ragged[[0]][0]), [1, 2, 3])
+
+    def test_compact(self):
+        subset = self.ragged[[3, 0]].compact()
+        self.assertEqual(list(subset.buffer), [6, 7, 8, 9, 1, 2, 3])
+        self.assertEqual(list(subset.offsets), [0, 4])
+
+    def test_padded(self):
+        expected = [
+            [1, 2, 3, 0],
+            [0, 0, 0, 0],
+            [4, 5, 0, 0],
+            [6, 7, 8, 9],
+        ]
+        self.assertEqual(self.ragged.padded().tolist(), expected)
+        self.assertEqual(self.ragged.padded(2, fill=255).tolist(),
+                         [[1, 2], [255, 255], [4, 5], [6, 7]])
+
+    def test_invert(self):
+        shared = self.ragged[[0, 0, 3]]
+        shared.invert()
+        self.assertEqual([list(wf) for wf in shared],
+                         [[254, 253, 252], [254, 253, 252],
+                          [249, 248, 247, 246]])
+
+    def test_invert_subset(self):
+        self.ragged[[2]].invert()
+        self.assertEqual([list(wf) for wf in self.ragged],
+                         [[1, 2, 3], [], [251, 250], [6, 7, 8, 9]])
+        self.ragged.invert()
+        self.assertEqual([list(wf) for wf in self.ragged],
+                         [[254, 253, 252], [], [4, 5], [249, 248, 247, 246]])
+
+    def test_fill_from(self):
+        self.ragged.fill_from(1)
+        self.assertEqual([list(wf) for wf in self.ragged],
+                         [[1, 1, 1], [], [4, 4], [6, 6, 6, 6]])
+        missing = self.ragged.take([-1, 0], allow_fill=True)
+        missing.fill_from(5)
+        self.assertIsNone(missing[0])
+        with self.assertRaises(ValueError):
+            self.ragged.fill_from(-1)
+
+    def test_take_fill(self):
+        taken = self.ragged.take([2, -1], allow_fill=True)
+        self.assertEqual(list(taken[0]), [4, 5])
+        self.assertIsNone(taken[1])
+        self.assertEqual(list(taken.isna()), [False, True])
+
+    def test_concat(self):
+        both = RaggedArray._concat_same_type([self.ragged[[2]], self.ragged[[0]]])
+        self.assertEqual([list(wf) for wf in both], [[4, 5], [1, 2, 3]])
+
+    def test_frame(self):
+        frame = pd.DataFrame({'channel': [1, 2, 3, 4], 'rx': self.ragged})
+        self.assertIsInstance(frame.rx.array, RaggedArray)
+        subset = frame[frame.channel > 2]
+        self.assertIsInstance(subset.rx.array, RaggedArray)
+        self.assertEqual([list(wf) for wf in subset.rx], self.wfs[2:])
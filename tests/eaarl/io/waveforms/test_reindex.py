@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import gzip
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from eaarl.io.waveforms import collection
+from eaarl.io.waveforms import edb
+from eaarl.io.waveforms import reindex
+from eaarl.io.waveforms import tld
+
+class TestReindex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.records = []
+        for name in ['b.tld', 'a.tld']:
+            with open(os.path.join(self.dir, name), 'wb') as fh:
+                for idx in range(3):
+                    offset = fh.tell()
+                    time = 1.4e9 + idx + (name == 'b.tld') * 10
+                    tld.write(fh, [{
+                        'time': time,
+                        'raster_number': idx + 1,
+                        'digitizer': idx % 2,
+                        'pulse': [{
+                            'time': time + 0.001,
+                            'bias_tx': 0,
+                            'bias_rx': [0, 0, 0, 0],
+                            'scan_angle': 0,
+                            'range': 0,
+                            'thresh_rx': 0,
+                            'thresh_tx': 0,
+                            'tx': [1, 2],
+                            'rx': [[3, 4, 5]] * (idx + 1),
+                        } for _ in range(idx + 1)],
+                    }])
+                    self.records.append({
+                        'record_offset': offset,
+                        'record_length': fh.tell() - offset,
+                        'file_name': name,
+                        'pulse_count': idx + 1,
+                        'digitizer': idx % 2,
+                        'time': time,
+                    })
+        self.records.sort(key=lambda record: record['file_name'])
+        with open(os.path.join(self.dir, 'notes.txt'), 'w') as fh:
+            fh.write('not a tld file')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def assertRecordsMatch(self, frame):
+        self.assertEqual(len(frame), len(self.records))
+        for row, expected in zip(frame.to_dict('records'), self.records):
+            time = row.pop('time')
+            self.assertTrue(np.isclose(time, expected['time'], atol=1e-5))
+            self.assertEqual(row, dict((k, v) for k, v in expected.items()
+                                       if k != 'time'))
+
+    def test_find_tld_files(self):
+        with gzip.open(os.path.join(self.dir, 'a.tld.gz'), 'wb') as fh:
+            fh.write(b'')
+        with gzip.open(os.path.join(self.dir, 'c.tld.gz'), 'wb') as fh:
+            fh.write(b'')
+        files = reindex.find_tld_files(self.dir)
+        self.assertEqual(files, [
+            ('a.tld', os.path.join(self.dir, 'a.tld')),
+            ('b.tld', os.path.join(self.dir, 'b.tld')),
+            ('c.tld', os.path.join(self.dir, 'c.tld.gz')),
+        ])
+
+    def test_find_tld_files_eaarl(self):
+        sub = os.path.join(self.dir, 'eaarl')
+        os.mkdir(sub)
+        for name in ['a.tld', 'b.tld']:
+            os.rename(os.path.join(self.dir, name), os.path.join(sub, name))
+        files = reindex.find_tld_files(self.dir)
+        self.assertEqual([name for name, _ in files], ['a.tld', 'b.tld'])
+
+    def test_build_edb(self):
+        self.assertRecordsMatch(reindex.build_edb(self.dir, progress=False))
+
+    def test_build_edb_compressed(self):
+        path = os.path.join(self.dir, 'b.tld')
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            dst.write(src.read())
+        os.remove(path)
+        self.assertRecordsMatch(reindex.build_edb(self.dir, progress=False))
+        # Scanning does not leave seek indexes beside the TLD files
+        self.assertFalse([name for name in os.listdir(self.dir)
+                          if name.endswith('.idx')])
+
+    def test_build_edb_workers(self):
+        self.assertRecordsMatch(reindex.build_edb(self.dir, workers=2,
+                                                  progress=False))
+
+    def test_rebuild_edb(self):
+        edb_file = os.path.join(self.dir, 'test.idx')
+        reindex.rebuild_edb(self.dir, edb_file, progress=False)
+        self.assertRecordsMatch(edb.read_frame_from(edb_file))
+        with collection.collection_open(edb_file=edb_file) as eaarl:
+            rasters = eaarl.get_rasters(start=1, count=6, progress=False)
+        self.assertEqual([len(raster['pulse']) for raster in rasters],
+                         [1, 2, 3, 1, 2, 3])
@@ -6,6 +6,9 @@ from future import standard_library
 from future.builtins import *
 
 import copy
+import os
+import shutil
+import tempfile
 import unittest
 from io import BytesIO
 
@@ -209,3 +212,107 @@ class TestTld(unittest.TestCase):
         raw = fh.getvalue()
         self.assertEqual(raw, self.raw[0])
 
+
+    def assertArraysMatch(self, arrays, records):
+        self.assertEqual(len(arrays.raster), len(records))
+        pulses = [pulse for record in records for pulse in record['pulse']]
+        self.assertEqual(len(arrays.pulse), len(pulses))
+        for raster, record in zip(arrays.raster, records):
+            for field in ['time', 'raster_number', 'digitizer', 'pulse_count']:
+                self.assertEqual(raster[field], record[field])
+        rx = [list(wf) for wf in arrays.rx]
+        self.assertEqual(rx, [wf for pulse in pulses for wf in pulse['rx']])
+        self.assertEqual(len(arrays.tx), len(pulses))
+        for pulse, tx, expected in zip(arrays.pulse, arrays.tx, pulses):
+            self.assertEqual(pulse['time'], expected['time'])
+            self.assertEqual(list(pulse['bias_rx']), expected['bias_rx'])
+            self.assertEqual(list(tx), expected['tx'])
+            for field in ['waveform_count', 'bias_tx', 'scan_angle', 'range',
+                          'thresh_rx', 'thresh_tx']:
+                self.assertEqual(pulse[field], expected[field])
+
+    def test_decode_arrays(self):
+        arrays = tld.decode_arrays(self.raw[0] + self.raw[1])
+        self.assertArraysMatch(arrays, self.records)
+        self.assertEqual(list(arrays.pulse['raster_index']), [0, 0, 1])
+        self.assertEqual(list(arrays.pulse['pulse_number']), [1, 2, 1])
+        self.assertEqual(list(arrays.channel['channel']), [1, 1, 1, 2, 3, 4])
+
+    def test_split_arrays(self):
+        arrays = tld.decode_arrays(self.raw[0] + self.raw[1])
+        parts = tld.split_arrays(arrays)
+        self.assertEqual(len(parts), 2)
+        for part, record in zip(parts, self.records):
+            self.assertArraysMatch(part, [record])
+            self.assertEqual(list(part.raster['record_index']), [0])
+        self.assertEqual(len(parts[1].tx.buffer), 2)
+        self.assertArraysMatch(tld.concat_arrays(parts), self.records)
+
+    def test_read_arrays_second(self):
+        fh = BytesIO(self.raw[0] + self.raw[1])
+        arrays = tld.read_arrays(fh, 63, 1)
+        self.assertArraysMatch(arrays, [self.records[1]])
+        self.assertEqual(list(arrays.raster['record_offset']), [63])
+
+    def test_read_arrays_both_with_garbage(self):
+        raw = bytearray(self.raw[0] + b'\xAA\xBB\xCC\xDD' + self.raw[1])
+        raw[0] += 4
+        fh = BytesIO(raw)
+        arrays = tld.read_arrays(fh, 0, 2)
+        self.assertArraysMatch(arrays, self.records)
+
+    def test_index_pulses(self):
+        raw = self.raw[0] + self.raw[1]
+        pulses, waveforms = tld.index_pulses(raw)
+        self.assertEqual(list(pulses['record_offset']), [0, 0, 63])
+        self.assertEqual(list(pulses['pulse_number']), [1, 2, 1])
+        self.assertEqual(list(pulses['waveform_index']), [0, 1, 2])
+        self.assertEqual(list(pulses['waveform_count']), [1, 1, 4])
+        expected = [pulse for record in self.records
+                    for pulse in record['pulse']]
+        for entry, pulse in zip(pulses, expected):
+            start = entry['tx_offset']
+            self.assertEqual(list(bytearray(raw[start:start+entry['tx_length']])),
+                             pulse['tx'])
+            decoded, end = tld._read_pulse(raw, entry['offset'])
+            self.assertEqual(end, entry['offset'] + entry['length'])
+            self.assertEqual(decoded['rx'], pulse['rx'])
+        rx = [list(bytearray(raw[o:o+l])) for o, l in waveforms]
+        self.assertEqual(rx, [wf for pulse in expected for wf in pulse['rx']])
+
+    def test_read_headers(self):
+        raw = self.raw[0] + b'\x08\x00\x00\x07\xAA\xBB\xCC\xDD' + self.raw[1]
+        for size in [None, len(raw)]:
+            headers = tld.read_headers(BytesIO(raw), size)
+            self.assertEqual(list(headers['record_offset']), [0, 71])
+            self.assertEqual(list(headers['record_length']),
+                             [63, len(self.raw[1])])
+            for field in ['time', 'raster_number', 'digitizer', 'pulse_count']:
+                self.assertEqual(list(headers[field]),
+                                 [record[field] for record in self.records])
+
+    def test_read_headers_truncated(self):
+        raw = self.raw[0] + self.raw[1][:-1]
+        for size in [None, len(raw)]:
+            headers = tld.read_headers(BytesIO(raw), size)
+            self.assertEqual(list(headers['record_offset']), [0])
+
+    def test_read_buffer_both(self):
+        records = tld.read_buffer(self.raw[0] + self.raw[1], 0, 2)
+        self.assertEqual(records, self.records)
+
+    def test_mapped(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmpdir, 'test.tld')
+            with open(fn, 'wb') as fh:
+                fh.write(self.raw[0] + self.raw[1])
+            with tld.MappedTLD(fn) as mapped:
+                self.assertEqual(mapped.read(63, 1), [self.records[1]])
+                views = mapped.read(0, 1, views=True)
+                self.assertEqual(list(views[0]['pulse'][1]['tx']), [82, 82])
+                self.assertFalse(views[0]['pulse'][1]['tx'].flags.writeable)
+                arrays = mapped.read_arrays(0, 2)
+                self.assertArraysMatch(arrays, self.records)
+        finally:
+            shutil.rmtree(tmpdir)
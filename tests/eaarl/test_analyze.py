@@ -7,9 +7,13 @@ from __future__ import absolute_import
 from future import standard_library # pylint: disable=unused-import
 from future.builtins import *
 
+import numpy as np
+import pandas as pd
 import pytest
 
 from eaarl import analyze
+from eaarl.io import waveforms
+from eaarl.io.waveforms import RaggedArray
 
 @pytest.mark.parametrize("wf,cent", [
     ([0,1,2,3,4,5,6,7,8,9,10], 7),
@@ -21,3 +25,145 @@ from eaarl import analyze
 ])
 def test_centroid(wf, cent):
     assert abs(analyze.centroid(wf) - cent) < 0.00001
+
+def test_centroid_frame_element():
+    # Waveform frames, as from Flight.wfs_by_raster, hold flipped uint8 samples
+    rx = [245, 250, 235, 225, 247]
+    raster = {
+        'time': 1000., 'raster_number': 1, 'digitizer': 0,
+        'pulse': [{
+            'time': 1000.1, 'bias_tx': 0, 'bias_rx': [0, 0, 0, 0],
+            'scan_angle': 0, 'range': 0, 'thresh_rx': 0, 'thresh_tx': 0,
+            'tx': [1, 2], 'rx': [rx],
+        }],
+    }
+    arrays = waveforms.tld.decode_arrays(waveforms.tld._encode_record(raster))
+    waveforms.rasters_wf_flip(arrays)
+    frame = waveforms.arrays_to_waveforms(arrays)
+    expected = analyze.centroid([255 - value for value in rx])
+    assert np.isclose(expected, 2.913043)
+    assert np.isclose(analyze.centroid(frame.rx.iloc[0]), expected)
+    assert np.isclose(analyze.centroid(np.array([10, 5, 20, 30, 8],
+                                                dtype=np.uint8)), expected)
+    assert np.isclose(analyze.centroid_array(frame.rx)[0], expected)
+
+def test_centroid_array_ragged():
+    wfs = [[0,1,2,3,4,5,6,7,8,9,10], [0,0,2,8,2,0], [1,1,1,1], [], [2,4,6]]
+    expected = [analyze.centroid(wf, 4) for wf in wfs]
+    result = analyze.centroid_array(RaggedArray.from_sequence(wfs), 4)
+    assert np.allclose(result, expected)
+
+def test_centroid_array_sequence():
+    wfs = [[0,1,2,3,4,5,6,7,8,9,10], [-1,1,-1,1], [1,1,1,1], [], [2,4,6]]
+    expected = [analyze.centroid(wf) for wf in wfs]
+    result = analyze.centroid_array(pd.Series(wfs))
+    assert result.dtype == np.float64
+    assert np.allclose(result, expected)
+    assert np.allclose(analyze.centroid_array(wfs, 3),
+                       [analyze.centroid(wf, 3) for wf in wfs])
+
+def test_centroid_padded():
+    samples = [[0,0,2,8,2,0,9], [2,4,6,0,0,0,0], [1,1,1,1,1,1,1]]
+    result = analyze.centroid_padded(samples, [6, 3, 7])
+    assert np.allclose(result, [3, 5./3., -1])
+    assert np.allclose(analyze.centroid_padded(samples, limit=2),
+                       [analyze.centroid(wf, 2) for wf in samples])
+
+def test_select_eaarla_channel_ragged():
+    sat = [255] * 12
+    clear = [10] * 12
+    frame = pd.DataFrame({
+        'raster_number': [1] * 8,
+        'pulse_number': [1, 1, 1, 1, 2, 2, 2, 2],
+        'channel': [1, 2, 3, 4] * 2,
+        'rx': RaggedArray.from_sequence([clear, clear, clear, clear,
+                                         sat, clear, clear, clear]),
+    })
+    result = analyze.select_eaarla_channel(frame)
+    assert list(result.pulse_number) == [1, 2]
+    assert list(result.channel) == [1, 2]
+
+def test_select_eaarla_channel_unsorted():
+    sat = [255] * 12
+    clear = [10] * 12
+    frame = pd.DataFrame({
+        'raster_number': [2, 1, 1, 2, 1, 2, 1, 2, 1],
+        'pulse_number': [1, 2, 1, 1, 2, 1, 1, 1, 2],
+        'channel': [3, 2, 2, 2, 1, 1, 1, 4, 3],
+        'rx': [clear, clear, clear, sat, sat, sat, sat, clear, sat],
+    })
+    result = analyze.select_eaarla_channel(frame)
+    # Rows stay in their original order; raster 2 has every channel
+    # saturated except 3 and raster 1 pulse 2 only has channel 2 clear
+    assert list(result.index) == [0, 1, 2]
+    assert list(result.channel) == [3, 2, 2]
+
+def test_select_eaarla_channel_saturated():
+    sat = [255] * 12
+    frame = pd.DataFrame({
+        'raster_number': [1] * 3,
+        'pulse_number': [1] * 3,
+        'channel': [1, 2, 3],
+        'rx': RaggedArray.from_sequence([sat, sat, sat]),
+    })
+    assert list(analyze.select_eaarla_channel(frame).channel) == [3]
+
+def _gaussians(components, width=40, background=10):
+    t = np.arange(width)
+    wf = np.full(width, float(background))
+    for amplitude, position, sigma in components:
+        wf += amplitude * np.exp(-(t - position) ** 2 / (2. * sigma ** 2))
+    return np.round(wf).astype(np.uint8)
+
+def test_decompose():
+    expected = [
+        [(100, 8, 1.5), (40, 22, 2.)],
+        [(60, 15, 2.)],
+        [],
+    ]
+    frame = pd.DataFrame({
+        'channel': [1, 2, 3],
+        'rx': RaggedArray.from_sequence([_gaussians(comps) for comps in expected]),
+    })
+    returns = analyze.decompose(frame)
+    assert list(returns.channel) == [1, 1, 2]
+    assert list(returns.gd_return) == [1, 2, 1]
+    fitted = returns[['gd_amplitude', 'gd_pos', 'gd_width']].values
+    assert np.allclose(fitted, [comp for comps in expected for comp in comps],
+                       rtol=0.02, atol=0.1)
+
+    parallel = analyze.decompose(frame, prefix='p', workers=2, chunk_size=1)
+    assert np.allclose(parallel[['p_amplitude', 'p_pos', 'p_width']].values,
+                       fitted)
+
+def test_decompose_max_returns():
+    frame = pd.DataFrame({
+        'rx': RaggedArray.from_sequence([
+            _gaussians([(30, 6, 1.5), (100, 16, 1.5), (60, 28, 1.5)])]),
+    })
+    returns = analyze.decompose(frame, max_returns=2)
+    assert np.allclose(returns.gd_pos, [16, 28], atol=0.2)
+
+def test_decompose_singular():
+    # The least-squares system for this waveform becomes singular
+    wf = [86, 169, 130, 166, 144, 153, 55, 32, 247, 75, 252, 65, 228, 120,
+          137, 159, 235, 143, 172, 177, 216, 205, 13, 126, 45, 14, 122, 86,
+          218, 52, 182, 188, 201, 252, 25, 219, 50, 180, 15, 79, 132, 72, 131,
+          75, 220, 220, 203, 146, 46, 208, 36]
+    good = _gaussians([(60, 15, 2.)])
+    frame = pd.DataFrame({
+        'channel': [1, 2],
+        'rx': RaggedArray.from_sequence([np.array(wf, dtype=np.uint8), good]),
+    })
+    returns = analyze.decompose(frame)
+    assert np.isfinite(returns[['gd_amplitude', 'gd_pos',
+                                'gd_width']].values).all()
+    fitted = returns[returns.channel == 2]
+    assert np.allclose(fitted[['gd_amplitude', 'gd_pos', 'gd_width']].values,
+                       [(60, 15, 2.)], rtol=0.02, atol=0.1)
+
+def test_fit_gaussians_failed():
+    wf = _gaussians([(60, 15, 2.)]).astype(float)[np.newaxis] - 10
+    valid = np.ones(wf.shape, dtype=bool)
+    params = np.array([[[60., 15., 0.]]])
+    assert np.isnan(analyze._fit_gaussians(wf, valid, params, 5)).all()
@@ -0,0 +1,72 @@
+# pylint: disable=missing-docstring,bad-whitespace
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library # pylint: disable=unused-import
+from future.builtins import *
+
+import numpy as np
+import pandas as pd
+
+from eaarl import analyze
+from eaarl import detect
+from eaarl.io.waveforms import RaggedArray
+
+WFS = [
+    [10, 10, 20, 30, 20, 10, 10],
+    [10, 10, 40, 12, 10, 30, 10],
+    [10, 12, 11, 10],
+    [],
+]
+
+def _padded():
+    return RaggedArray.from_sequence(WFS).padded(), [len(wf) for wf in WFS]
+
+def test_centroid():
+    samples, lengths = _padded()
+    result = detect.Centroid(limit=None)(samples, lengths)
+    assert result.shape == (4, 1)
+    assert np.allclose(result[:, 0],
+                       [analyze.centroid(wf) if wf else -1 for wf in WFS])
+
+def test_leading_edge():
+    samples, lengths = _padded()
+    result = detect.LeadingEdge(threshold=5)(samples, lengths)
+    assert np.allclose(result[:, 0], [1.5, 1 + 5 / 30., -1, -1])
+
+def test_trailing_edge():
+    samples, lengths = _padded()
+    result = detect.TrailingEdge(threshold=5)(samples, lengths)
+    assert np.allclose(result[:, 0], [4.5, 5.75, -1, -1])
+
+def test_peak():
+    samples, lengths = _padded()
+    result = detect.Peak(threshold=5)(samples, lengths)
+    assert np.allclose(result[:, 0], [3, 2 + 1 / 58., -1, -1])
+
+def test_peaks():
+    samples, lengths = _padded()
+    result = detect.Peaks(threshold=5)(samples, lengths)
+    assert result.shape == (4, 2)
+    assert np.allclose(result[0], [3, -1])
+    assert np.allclose(result[1], [2 + 1 / 58., 5])
+    assert np.all(result[2:] == -1)
+    first = detect.Peaks(threshold=5, max_returns=1)(samples, lengths)
+    assert np.allclose(first[:, 0], result[:, 0])
+    assert first.shape == (4, 1)
+
+def test_limit():
+    samples, lengths = _padded()
+    result = detect.Peaks(threshold=5, limit=4)(samples, lengths)
+    assert np.allclose(result[:, 0], [3, 2 + 1 / 58., -1, -1])
+    assert np.all(result[:, 1:] == -1)
+
+def test_detect_targets_chunks():
+    frame = pd.DataFrame({'rx': RaggedArray.from_sequence(WFS * 3)})
+    expected = detect.Peaks(threshold=5)(*_padded())
+    result = analyze.detect_targets(frame, detect.Peaks(threshold=5),
+                                    chunk_size=3)
+    assert result.shape == (12, 2)
+    assert np.allclose(result, np.vstack([expected] * 3))
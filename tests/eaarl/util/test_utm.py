@@ -0,0 +1,80 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from future import standard_library
+from future.builtins import *
+
+import pytest
+import numpy as np
+
+from eaarl.util import utm
+
+# Expected values are from the utm package
+KNOWN = [
+    # latitude, longitude, easting, northing, zone_number, zone_letter
+    (25.0, -80.0, 600913.0266956311, 2765319.94402007, 17, 'R'),
+    (40.71435, -74.00597, 583959.9590449499, 4507523.087089199, 18, 'T'),
+    (-33.8688, 151.2093, 334368.63364640076, 6250948.345360274, 56, 'H'),
+    (60.0, 5.0, 276979.9264163869, 6658157.203131719, 32, 'V'),
+    (78.0, 15.0, 500000.0, 8658369.586629482, 33, 'X'),
+]
+
+def test_from_latlon():
+    lat, lon, east, north, zone, letter = (np.array(col)
+                                           for col in zip(*KNOWN))
+    result = utm.from_latlon(lat, lon)
+    assert np.allclose(result[0], east, rtol=0, atol=1e-6)
+    assert np.allclose(result[1], north, rtol=0, atol=1e-6)
+    assert result[2].dtype.kind == 'i'
+    assert list(result[2]) == list(zone)
+    assert list(result[3]) == list(letter)
+
+def test_to_latlon():
+    lat, lon, east, north, zone, letter = (np.array(col)
+                                           for col in zip(*KNOWN))
+    result = utm.to_latlon(east, north, zone, letter)
+    assert np.allclose(result[0], lat, rtol=0, atol=1e-7)
+    assert np.allclose(result[1], lon, rtol=0, atol=1e-7)
+
+    result = utm.to_latlon(east, north, zone, northern=lat >= 0)
+    assert np.allclose(result[0], lat, rtol=0, atol=1e-7)
+
+def test_round_trip():
+    rng = np.random.RandomState(0)
+    lat = rng.uniform(-80, 84, 1000)
+    lon = rng.uniform(-180, 180, 1000)
+    east, north, zone, letter = utm.from_latlon(lat, lon)
+    result = utm.to_latlon(east, north, zone, letter)
+    assert np.allclose(result[0], lat, rtol=0, atol=1e-6)
+    assert np.allclose(result[1], lon, rtol=0, atol=1e-6)
+
+def test_force_zone_number():
+    east, north, zone, _ = utm.from_latlon([25.0, 25.0], [-80.0, -74.0], 17)
+    assert list(zone) == [17, 17]
+    assert np.isclose(east[0], 600913.0266956311)
+    assert east[1] > 1000000
+    lat, lon = utm.to_latlon(east, north, 17, 'R')
+    assert np.allclose(lat, 25.0)
+    assert np.allclose(lon, [-80.0, -74.0])
+
+def test_scalar():
+    east, north, zone, letter = utm.from_latlon(25.0, -80.0)
+    assert np.ndim(east) == 0
+    assert int(zone) == 17
+    assert str(letter) == 'R'
+
+@pytest.mark.parametrize("lat, lon", [
+    (-80.5, 0.),
+    (84.5, 0.),
+    (0., 180.5),
+])
+def test_from_latlon_range(lat, lon):
+    with pytest.raises(ValueError):
+        utm.from_latlon([0., lat], [0., lon])
+
+def test_zone_number_range():
+    with pytest.raises(ValueError):
+        utm.from_latlon(0., 0., 61)
+    with pytest.raises(ValueError):
+        utm.to_latlon([500000.], [0.], [0])